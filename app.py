@@ -1,25 +1,112 @@
+import os
+import sys
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
-import urllib
+from config import Config
+from extensions import db, login_manager
+from services.lazycli import LazyGroup, LazyCommand
 
-app = Flask(__name__)
 
-# Configure the Database URI: Replace with your actual SQL Server details
-params = urllib.parse.quote_plus("DRIVER={ODBC Driver 17 for SQL Server};"
-                                 "SERVER=DESKTOP-0G8418J;"
-                                 "DATABASE=Gym_ManagementSystem;"
-                                  "Trusted_Connection=yes;" 
-                                 )
+# (name, 'module:attribute', help). Imported only when the command runs.
+CLI_GROUPS = [
+    ('counters', 'models.counters:counters_cli', 'Maintain the precomputed dashboard counters.'),
+    ('import', 'models.importer:import_cli', 'Bulk-load members and bookings from CSV or NDJSON.'),
+    ('jobs', 'models.jobs:jobs_cli', 'Run and inspect the background job queue.'),
+    ('memberships', 'models.memberships:memberships_cli', 'Expire memberships and send renewal reminders.'),
+    ('analytics', 'models.analytics:analytics_cli', 'Build the revenue analytics cube.'),
+    ('search', 'models.search:search_cli', 'Maintain the full-text search index.'),
+    ('audit', 'models.audit:audit_cli', 'Query the audit trail.'),
+    ('archive', 'models.archive:archive_cli', 'Move closed bookings into monthly Arrow partitions.'),
+    ('attendance', 'models.attendance:attendance_cli', 'Check-ins and hourly occupancy.'),
+]
+CLI_COMMANDS = [
+    ('index-advisor', 'models.index_advisor:index_advisor_command',
+     "Replay the app's query shapes and report the ones that scan a table."),
+]
 
-app.config['SQLALCHEMY_DATABASE_URI'] = f'mssql+pyodbc:///?odbc_connect={params}'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Flask CLI commands that dispatch requests and so need the views
+_SERVING_COMMANDS = {'run', 'routes', 'shell'}
 
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
 
-  # Import and register blueprints or models here
-from models import User, Category, PackageType, Package, Booking, Payment, AdminSettings, Inquiry ,RegistrationForm,LoginForm,UpdateProfileForm,BookingForm,ChangePasswordForm
+def _cli_command():
+    # First positional argument of `flask [options] COMMAND ...`, skipping option values
+    args = iter(sys.argv[1:])
+    for arg in args:
+        if arg in ('-A', '--app', '-e', '--env-file'):
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def serves_requests():
+    # A gunicorn worker or `flask run` needs the views and forms; `flask db
+    # upgrade` or `flask jobs work` never dispatch a request, so they skip them.
+    if os.environ.get('FLASK_RUN_FROM_CLI') != 'true':
+        return True
+    return _cli_command() in _SERVING_COMMANDS
+
+
+def create_app(config=Config):
+    app = Flask(__name__, template_folder='template')
+
+    # Database URI and pool settings come from the environment, see config.py
+    app.config.from_object(config)
+
+    if app.config.get('TRUSTED_PROXIES'):
+        # remote_addr, scheme and host as the client sent them, see config.py
+        from werkzeug.middleware.proxy_fix import ProxyFix
+        hops = app.config['TRUSTED_PROXIES']
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=hops, x_proto=hops, x_host=hops)
+
+    db.init_app(app)
+    if os.environ.get('FLASK_RUN_FROM_CLI') == 'true':
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    login_manager.init_app(app)
+
+    from services.pool import configure_pool_metrics
+    from services.hashing import configure_hasher
+    from services.profiling import init_profiling
+    from services.ratelimit import configure_rate_limits
+    from services.httpcache import configure_page_cache
+    from services.replicas import configure_replicas
+    with app.app_context():
+        configure_pool_metrics(app, db.engine)
+    configure_hasher(app)
+    init_profiling(app)
+    configure_rate_limits(app)
+    configure_page_cache(app)
+    configure_replicas(app)
+
+    # Models register their tables on import; these modules also hook session
+    # events (dashboard counters, membership expiry, search index, audit
+    # trail, active-member index) that must run in every process that
+    # writes, CLI commands and workers included.
+    import models
+    import models.counters, models.memberships, models.search, models.attendance  # noqa: F401
+    from models.reference import configure_reference_cache
+    from models.audit import configure_audit
+    configure_reference_cache(app)
+    configure_audit(app)
+
+    @login_manager.user_loader
+    def load_user(user_id):
+        return db.session.get(models.User, int(user_id))
+
+    for name, import_path, help_text in CLI_GROUPS:
+        app.cli.add_command(LazyGroup(name, import_path, help=help_text))
+    for name, import_path, help_text in CLI_COMMANDS:
+        app.cli.add_command(LazyCommand(name, import_path, help=help_text))
+
+    register_views = app.config.get('REGISTER_VIEWS')
+    if register_views is None:
+        register_views = serves_requests()
+    if register_views:
+        from views.main import bp as main_bp
+        app.register_blueprint(main_bp)
+
+    return app
+
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,82 @@
+"""Digest of ``python -X importtime`` for app startup.
+
+    python -m bench.importtime                  # web worker boot: create_app()
+    python -m bench.importtime --mode cli       # what `flask db upgrade` loads
+    python -m bench.importtime --top 30 --runs 5
+
+Runs the import in fresh interpreters, then reports the wall time and the
+top-level packages that account for the most cumulative import time.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPETS = {
+    # What a gunicorn worker does for `app:create_app()`
+    'web': 'from app import create_app; create_app()',
+    # What the flask CLI does for a command that never serves a request
+    'cli': ('import os, sys; os.environ["FLASK_RUN_FROM_CLI"] = "true"; sys.argv = ["flask", "db", "current"]; '
+            'from app import create_app; create_app()'),
+}
+
+
+def parse_importtime(stderr):
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def digest(rows):
+    # Self time per top-level package, so nested imports are not double counted
+    totals = defaultdict(int)
+    for name, self_us, _ in rows:
+        totals[name.split('.')[0]] += self_us
+    return sorted(totals.items(), key=lambda item: -item[1])
+
+
+def measure(mode, env=None):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', SNIPPETS[mode]],
+                               cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode:
+        raise SystemExit(completed.stderr[-2000:])
+    return elapsed_ms, parse_importtime(completed.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=sorted(SNIPPETS), default='web')
+    parser.add_argument('--runs', type=int, default=3, help='fresh interpreters to time; the median is shown')
+    parser.add_argument('--top', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    env = dict(os.environ)
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    timings, rows = [], []
+    for _ in range(args.runs):
+        elapsed_ms, rows = measure(args.mode, env)
+        timings.append(elapsed_ms)
+
+    total_us = sum(self_us for _, self_us, _ in rows)
+    print(f'{args.mode}: median {statistics.median(timings):.0f} ms wall over {args.runs} run(s), '
+          f'{len(rows)} modules, {total_us / 1000:.0f} ms importing')
+    print(f'{"package":<28}{"self ms":>10}{"share":>8}')
+    for package, self_us in digest(rows)[:args.top]:
+        print(f'{package:<28}{self_us / 1000:>10.1f}{self_us / total_us:>8.1%}')
+
+
+if __name__ == '__main__':
+    main()
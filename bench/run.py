@@ -0,0 +1,291 @@
+"""Benchmark every route against a seeded local database.
+
+    python -m bench.run --database sqlite:///bench.db --users 500 --requests 200
+    python -m bench.run --update-baseline      # record bench/baseline.json
+    python -m bench.run --mode http --threads 16
+
+Exits with status 1 when any route answers 5xx (a baseline is then not
+written), when a route's p95 latency regresses past the baseline by more
+than --tolerance, when it issues more queries, when its status codes
+differ from the baseline's, or when it has no baseline.
+
+Templates missing from the checkout render as a placeholder, so every
+route runs its queries instead of timing an error page.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from jinja2 import BaseLoader, ChoiceLoader
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+# (name, method, path, form data, who is logged in)
+ROUTES = [
+    ('home', 'GET', '/', None, None),
+    ('contact', 'GET', '/contact', None, None),
+    ('login', 'POST', '/login', {'email': 'member0@bench.example.com', 'password': 'bench-password'}, None),
+    ('book_form', 'GET', '/book', None, 'member'),
+    ('book', 'POST', '/book', {'package': '1'}, 'member'),
+    ('booking_history', 'GET', '/booking-history', None, 'member'),
+    ('user_booking_history', 'GET', '/user/booking_history', None, 'member'),
+    ('admin_dashboard', 'GET', '/admin/dashboard', None, 'admin'),
+    ('admin_bookings', 'GET', '/admin/bookings', None, 'admin'),
+    ('admin_bookings_filtered', 'GET', '/admin/bookings?status=pending&category_id=1', None, 'admin'),
+    ('admin_packages', 'GET', '/admin/packages', None, 'admin'),
+    ('admin_categories', 'GET', '/admin/categories', None, 'admin'),
+    ('reports', 'POST', '/admin/reports', {'start_date': '2025-01-01', 'end_date': '2025-12-31'}, 'admin'),
+    ('reports_csv', 'GET', '/admin/reports?start_date=2025-01-01&end_date=2025-12-31&format=csv', None, 'admin'),
+    ('process_payment_form', 'GET', '/admin/process_payment?q=member1', None, 'admin'),
+    ('process_payment', 'POST', '/admin/process_payment',
+     {'booking_id': '1', 'amount': '10', 'payment_type': 'cash'}, 'admin'),
+    ('booking_search', 'GET', '/admin/bookings/search?q=member1', None, 'admin'),
+]
+
+
+class _PlaceholderTemplates(BaseLoader):
+    # Consulted only after the app's own loader
+    def get_source(self, environment, template):
+        return f'<!-- {template} -->', None, lambda: True
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A 302 is the route's answer; following it would time the next page too
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    latencies = sorted(sample['ms'] for sample in samples)
+    queries = [sample['queries'] for sample in samples if sample['queries'] is not None]
+    statuses = {}
+    for sample in samples:
+        statuses[str(sample['status'])] = statuses.get(str(sample['status']), 0) + 1
+    return {
+        'requests': len(samples),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'rps': round(len(samples) / elapsed, 1) if elapsed else 0.0,
+        'queries': max(queries) if queries else None,
+        'statuses': statuses,
+    }
+
+
+def _user_ids():
+    from models.model import User
+    from bench.seed import ADMIN_EMAIL, MEMBER_EMAIL
+    return {'member': User.query.filter_by(email=MEMBER_EMAIL).one().id,
+            'admin': User.query.filter_by(email=ADMIN_EMAIL).one().id}
+
+
+def logged_in_clients(app, user_ids):
+    clients = {None: app.test_client()}
+    for who, user_id in user_ids.items():
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user_id)
+            session['_fresh'] = True
+        clients[who] = client
+    return clients
+
+
+def run_test_client(app, requests_per_route, user_ids):
+    results = {}
+    for name, method, path, data, who in ROUTES:
+        samples = []
+        started = time.perf_counter()
+        for _ in range(requests_per_route):
+            # A fresh client per request keeps flashed messages from piling up in the session
+            client = logged_in_clients(app, {who: user_ids[who]} if who else {})[who]
+            t0 = time.perf_counter()
+            response = client.open(path, method=method, data=data)
+            response.get_data()  # drain streamed bodies so they are timed too
+            ms = (time.perf_counter() - t0) * 1000
+            queries = response.headers.get('X-DB-Queries')
+            samples.append({'ms': ms, 'status': response.status_code,
+                            'queries': int(queries) if queries else None})
+            response.close()
+        results[name] = summarize(samples, time.perf_counter() - started)
+    return results
+
+
+def _cookies(app, user_ids):
+    # Session cookies minted by the test client are valid for the real server too
+    cookies = {None: ''}
+    for who, client in logged_in_clients(app, user_ids).items():
+        if who is not None:
+            cookie = client.get_cookie('session')
+            cookies[who] = f'session={cookie.value}' if cookie else ''
+    return cookies
+
+
+def run_http(app, requests_per_route, user_ids, threads, port=0):
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', port, app, threaded=True)
+    base = f'http://127.0.0.1:{server.server_port}'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    cookies = _cookies(app, user_ids)
+    opener = urllib.request.build_opener(_NoRedirect)
+
+    def hit(method, path, data, who):
+        body = urllib.parse.urlencode(data).encode() if data else None
+        request = urllib.request.Request(base + path, data=body, method=method,
+                                         headers={'Cookie': cookies[who]} if cookies[who] else {})
+        t0 = time.perf_counter()
+        try:
+            with opener.open(request) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as error:
+            error.read()
+            status, headers = error.code, error.headers
+        queries = headers.get('X-DB-Queries')
+        return {'ms': (time.perf_counter() - t0) * 1000, 'status': status,
+                'queries': int(queries) if queries else None}
+
+    results = {}
+    try:
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            for name, method, path, data, who in ROUTES:
+                started = time.perf_counter()
+                samples = list(pool.map(lambda _: hit(method, path, data, who), range(requests_per_route)))
+                results[name] = summarize(samples, time.perf_counter() - started)
+    finally:
+        server.shutdown()
+    return results
+
+
+def server_errors(results):
+    return [f"{name}: {row['statuses']}" for name, row in results.items()
+            if any(status.startswith('5') for status in row['statuses'])]
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            regressions.append(f'{name}: not in the baseline; record it with --update-baseline')
+            continue
+        # A route that starts failing fast must not pass as a speed-up
+        if sorted(current['statuses']) != sorted(previous.get('statuses', {})):
+            regressions.append(f"{name}: statuses {sorted(previous.get('statuses', {}))} -> "
+                               f"{sorted(current['statuses'])}")
+        # Sub-millisecond routes jitter by more than any sensible percentage
+        if (current['p95_ms'] > previous['p95_ms'] * (1 + tolerance)
+                and current['p95_ms'] - previous['p95_ms'] > min_delta_ms):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} -> {current['p95_ms']} ms")
+        if previous.get('queries') is not None and (current['queries'] or 0) > previous['queries']:
+            regressions.append(f"{name}: queries {previous['queries']} -> {current['queries']}")
+    return regressions
+
+
+def print_table(title, results):
+    print(f'\n{title}')
+    print(f"{'route':<26}{'p50':>9}{'p95':>9}{'p99':>9}{'req/s':>9}{'queries':>9}  statuses")
+    for name, row in results.items():
+        queries = '-' if row['queries'] is None else row['queries']
+        print(f"{name:<26}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}{row['p99_ms']:>9.2f}"
+              f"{row['rps']:>9.1f}{queries:>9}  {row['statuses']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='sqlite:///bench.db')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--packages', type=int, default=20)
+    parser.add_argument('--bookings-per-user', type=int, default=20)
+    parser.add_argument('--payments-per-booking', type=int, default=2)
+    parser.add_argument('--requests', type=int, default=50, help='requests per route')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent clients in http mode')
+    parser.add_argument('--mode', choices=('client', 'http', 'both'), default='client')
+    parser.add_argument('--reseed', action='store_true', help='drop and reseed the database first')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed p95 slowdown, 0.25 = 25%%')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                        help='ignore p95 slowdowns smaller than this many milliseconds')
+    args = parser.parse_args(argv)
+
+    # Must be set before the app is imported: config.py reads them at import time
+    os.environ['DATABASE_URL'] = args.database
+    os.environ['SQL_PROFILING'] = '1'
+    # The harness replays /login and /contact far faster than the limits allow
+    os.environ['RATELIMIT_ENABLED'] = '0'
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', '12')
+    from app import create_app
+    from extensions import db
+    from bench.seed import seed
+    from models.model import User
+
+    app = create_app()
+    app.config.update(WTF_CSRF_ENABLED=False)
+    app.jinja_env.loader = ChoiceLoader([app.jinja_env.loader, _PlaceholderTemplates()])
+    with app.app_context():
+        if args.reseed:
+            db.drop_all()
+        db.create_all()
+        if not User.query.first():
+            counts = seed(args.users, args.packages, args.bookings_per_user, args.payments_per_booking)
+            print('Seeded', ', '.join(f'{count} {name}' for name, count in counts.items()))
+        user_ids = _user_ids()
+
+    results = {}
+    if args.mode in ('client', 'both'):
+        results['client'] = run_test_client(app, args.requests, user_ids)
+        print_table('Flask test client (single thread)', results['client'])
+    if args.mode in ('http', 'both'):
+        results['http'] = run_http(app, args.requests, user_ids, args.threads)
+        print_table(f'HTTP ({args.threads} threads)', results['http'])
+
+    errors = [f'[{mode}] {line}' for mode, mode_results in results.items() for line in server_errors(mode_results)]
+    if errors:
+        # An error page is not a timing to compare against, nor to record
+        print('\nServer errors:')
+        for line in errors:
+            print('  ' + line)
+        return 1
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.update_baseline:
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f'\nBaseline written to {args.baseline}')
+        return 0
+
+    regressions = []
+    for mode, mode_results in results.items():
+        found = compare(mode_results, baseline.get(mode, {}), args.tolerance, args.min_delta_ms)
+        regressions += [f'[{mode}] {line}' for line in found]
+    if regressions:
+        print('\nRegressions against baseline:')
+        for line in regressions:
+            print('  ' + line)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,87 @@
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert, select, update
+from extensions import db
+from models.model import User, Category, PackageType, Package, Booking, Payment
+from models.counters import rebuild_counters
+from models.memberships import membership_expiry, package_durations
+from models.reference import invalidate_reference_data, PACKAGES
+from models.search import rebuild_search_index
+from services.hashing import hasher
+
+
+BENCH_PASSWORD = 'bench-password'
+MEMBER_EMAIL = 'member0@bench.example.com'
+ADMIN_EMAIL = 'admin@bench.example.com'
+BATCH_SIZE = 5000
+
+
+def _batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(model, rows):
+    for batch in _batches(rows):
+        db.session.execute(insert(model), batch)
+
+
+def seed(users=200, packages=20, bookings_per_user=20, payments_per_booking=2, random_seed=1):
+    """Fill an empty database with a deterministic data set of the given size."""
+    rng = random.Random(random_seed)
+    db.create_all()
+    # One hash shared by every seeded account keeps seeding fast; the cost
+    # factor is the app's own so login benchmarks measure the real thing.
+    password_hash = hasher.hash(BENCH_PASSWORD)
+    now = datetime(2026, 1, 1)
+
+    _insert(Category, [{'name': f'Category {i}', 'description': 'bench'} for i in range(5)])
+    _insert(PackageType, [{'name': name, 'duration_in_months': months}
+                          for name, months in (('Monthly', 1), ('Quarterly', 3), ('Yearly', 12))])
+    category_ids = db.session.scalars(select(Category.id)).all()
+    type_ids = db.session.scalars(select(PackageType.id)).all()
+    _insert(Package, [{'name': f'Package {i}', 'description': 'bench', 'price': rng.choice((30, 80, 250, 900)),
+                       'category_id': rng.choice(category_ids), 'package_type_id': rng.choice(type_ids)}
+                      for i in range(packages)])
+    package_prices = dict(db.session.execute(select(Package.id, Package.price)).all())
+    package_ids = list(package_prices)
+
+    _insert(User, [{'username': 'admin', 'email': ADMIN_EMAIL, 'password_hash': password_hash,
+                    'role': 'admin', 'created_at': now}])
+    _insert(User, ({'username': f'member{i}', 'email': f'member{i}@bench.example.com', 'password_hash': password_hash,
+                    'role': 'registered', 'created_at': now} for i in range(users)))
+    member_ids = db.session.scalars(select(User.id).where(User.role == 'registered')).all()
+
+    # Core inserts bypass the views that invalidate cached package data
+    invalidate_reference_data(PACKAGES)
+    durations = package_durations()
+
+    def booking(user_id):
+        package_id = rng.choice(package_ids)
+        booking_date = now - timedelta(days=rng.randrange(730), minutes=rng.randrange(1440))
+        return {'user_id': user_id, 'package_id': package_id, 'total_amount': package_prices[package_id],
+                'booking_date': booking_date, 'expires_at': membership_expiry(booking_date, package_id, durations),
+                'status': rng.choice(('confirmed', 'confirmed', 'pending', 'cancelled'))}
+
+    _insert(Booking, (booking(user_id) for user_id in member_ids for _ in range(bookings_per_user)))
+    booking_ids = db.session.scalars(select(Booking.id)).all()
+    _insert(Payment, ({'booking_id': booking_id, 'amount': rng.choice((30.0, 80.0, 250.0)),
+                       'payment_date': now - timedelta(days=rng.randrange(730)), 'payment_status': 'completed',
+                       'payment_type': 'card'}
+                      for booking_id in booking_ids for _ in range(rng.randrange(payments_per_booking + 1))))
+    # Keep the running balance consistent with the seeded payments
+    paid = select(func.coalesce(func.sum(Payment.amount), 0)).where(Payment.booking_id == Booking.id)
+    db.session.execute(update(Booking).values(amount_paid=paid.scalar_subquery()))
+    db.session.commit()
+    # Core inserts bypass the session events that maintain the dashboard counters
+    # and the search index
+    rebuild_counters()
+    rebuild_search_index()
+    return {'users': len(member_ids) + 1, 'packages': len(package_ids),
+            'bookings': len(booking_ids), 'payments': db.session.query(Payment).count()}
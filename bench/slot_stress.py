@@ -0,0 +1,147 @@
+"""Race many members for the seats of one class slot and check nobody is oversold.
+
+    python -m bench.slot_stress --database sqlite:///bench.db --capacity 20 --members 300 --threads 64
+
+Every member tries to reserve at the same moment (a barrier releases all
+threads together), then a third of the seat holders cancel so waitlisted
+members get promoted. Finally the waitlist is emptied and some holders
+cancel and rebook twice at once. Exits 1 if seats_taken ever disagrees
+with the reservations or exceeds capacity.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--database', default='sqlite:///bench.db')
+    parser.add_argument('--capacity', type=int, default=20)
+    parser.add_argument('--members', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--retries', type=int, default=20,
+                        help='retries for lock timeouts (SQLite serialises all writers)')
+    args = parser.parse_args(argv)
+
+    os.environ['DATABASE_URL'] = args.database
+    from sqlalchemy import func, insert, select
+    from sqlalchemy.exc import OperationalError
+    from app import create_app
+    from extensions import db
+    from models.model import User, Category, PackageType, Package, Booking, ClassSlot, SlotReservation
+    from models.slots import reserve_seat, cancel_reservation, RESERVED, WAITLISTED
+
+    app = create_app()
+
+    with app.app_context():
+        db.create_all()
+        stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+        category = Category(name=f'Stress {stamp}')
+        package_type = PackageType(name=f'Stress {stamp}', duration_in_months=1)
+        package = Package(name='Stress class', price=10, category=category, package_type=package_type)
+        slot = ClassSlot(package=package, starts_at=datetime.utcnow() + timedelta(days=1), capacity=args.capacity)
+        db.session.add(slot)
+        db.session.commit()
+        slot_id = slot.id
+        db.session.execute(insert(User), [{'username': f'stress{stamp}-{i}', 'email': f'stress{stamp}-{i}@bench.example.com',
+                                           'password_hash': '-', 'role': 'registered'}
+                                          for i in range(args.members)])
+        db.session.commit()
+        user_ids = db.session.scalars(select(User.id).where(User.email.like(f'stress{stamp}-%'))).all()
+        # Reserving takes an active booking for the slot's package
+        db.session.execute(insert(Booking), [{'user_id': user_id, 'package_id': package.id, 'status': 'confirmed',
+                                              'total_amount': 10, 'booking_date': datetime.utcnow()}
+                                             for user_id in user_ids])
+        db.session.commit()
+
+    outcomes = Counter()
+    lock = threading.Lock()
+
+    def attempt(action, user_id, barrier=None):
+        if barrier is not None:
+            try:
+                barrier.wait(timeout=30)
+            except threading.BrokenBarrierError:
+                pass
+        for attempt_no in range(args.retries + 1):
+            with app.app_context():
+                try:
+                    result = action(slot_id, user_id)
+                    with lock:
+                        outcomes[getattr(result, 'status', 'cancelled')] += 1
+                    return
+                except OperationalError:
+                    db.session.rollback()
+                    time.sleep(0.01 * (attempt_no + 1))
+        with lock:
+            outcomes['gave_up'] += 1
+
+    barrier = threading.Barrier(min(args.threads, len(user_ids)))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda user_id: attempt(reserve_seat, user_id, barrier), user_ids))
+    elapsed = time.perf_counter() - started
+    print(f'{len(user_ids)} reservation attempts in {elapsed:.2f}s '
+          f'({len(user_ids) / elapsed:.0f}/s): {dict(outcomes)}')
+
+    with app.app_context():
+        holders = db.session.scalars(select(SlotReservation.user_id).where(
+            SlotReservation.slot_id == slot_id, SlotReservation.status == RESERVED)).all()
+    cancelling = holders[:max(1, len(holders) // 3)]
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda user_id: attempt(cancel_reservation, user_id), cancelling))
+    print(f'{len(cancelling)} seat holders cancelled')
+
+    # A double-submitted rebook: both requests see the cancelled row, and
+    # only one of them may take a seat with it. The waitlist is emptied and
+    # some holders cancel first, so there are free seats to race for.
+    with app.app_context():
+        waiting = db.session.scalars(select(SlotReservation.user_id).where(
+            SlotReservation.slot_id == slot_id, SlotReservation.status == WAITLISTED)).all()
+        holders = db.session.scalars(select(SlotReservation.user_id).where(
+            SlotReservation.slot_id == slot_id, SlotReservation.status == RESERVED)).all()
+    rebooking = holders[:max(1, len(holders) // 3)]
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda user_id: attempt(cancel_reservation, user_id), waiting + rebooking))
+    rebooks = [user_id for user_id in rebooking for _ in range(2)]
+    barrier = threading.Barrier(min(args.threads, len(rebooks)))
+    outcomes.clear()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        list(pool.map(lambda user_id: attempt(reserve_seat, user_id, barrier), rebooks))
+    print(f'{len(waiting)} waitlisted members left, {len(rebooking)} holders cancelled and rebooked '
+          f'twice at once: {dict(outcomes)}')
+
+    with app.app_context():
+        slot = db.session.get(ClassSlot, slot_id)
+        counts = dict(db.session.execute(
+            select(SlotReservation.status, func.count())
+            .where(SlotReservation.slot_id == slot_id)
+            .group_by(SlotReservation.status)).all())
+        reserved = counts.get(RESERVED, 0)
+        waiting = counts.get(WAITLISTED, 0)
+        print(f'capacity={slot.capacity} seats_taken={slot.seats_taken} reserved={reserved} '
+              f'waitlisted={waiting} cancelled={counts.get("cancelled", 0)}')
+
+        failures = []
+        if slot.seats_taken > slot.capacity or reserved > slot.capacity:
+            failures.append('slot is overbooked')
+        if slot.seats_taken != reserved:
+            failures.append('seats_taken does not match the reserved rows')
+        if waiting and reserved < slot.capacity:
+            failures.append('members are waitlisted while seats are free')
+        if outcomes['gave_up']:
+            failures.append(f"{outcomes['gave_up']} attempts gave up after retries")
+    for failure in failures:
+        print('FAIL:', failure)
+    if not failures:
+        print('OK: no overbooking')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,124 @@
+import os
+import urllib
+from services.pool import InstrumentedQueuePool
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_bool(name, default):
+    return os.environ.get(name, str(default)).lower() in ('1', 'true', 'yes', 'on')
+
+
+def database_uri():
+    # SQLite is used only when asked for, e.g. DATABASE_URL=sqlite:///gym.db:
+    # a production box missing its driver must not quietly start on an empty file
+    if os.environ.get('DATABASE_URL'):
+        return os.environ['DATABASE_URL']
+    try:
+        import pyodbc  # noqa: F401
+    except ImportError as error:
+        # Also raised when the package is there but the ODBC driver manager is not
+        raise RuntimeError(f'Cannot load the SQL Server driver ({error}). Install pyodbc and an ODBC '
+                           'driver, or set DATABASE_URL, e.g. DATABASE_URL=sqlite:///gym.db for a '
+                           'local database.') from None
+
+    # Configure the Database URI: Replace with your actual SQL Server details
+    params = urllib.parse.quote_plus("DRIVER={%s};" % os.environ.get('MSSQL_DRIVER', 'ODBC Driver 17 for SQL Server') +
+                                     "SERVER=%s;" % os.environ.get('MSSQL_SERVER', 'DESKTOP-0G8418J') +
+                                     "DATABASE=%s;" % os.environ.get('MSSQL_DATABASE', 'Gym_ManagementSystem') +
+                                     "Trusted_Connection=yes;"
+                                     )
+    return f'mssql+pyodbc:///?odbc_connect={params}'
+
+
+def engine_options(uri):
+    if uri.startswith('sqlite'):
+        # SQLite picks its own pool (a single connection for :memory:)
+        return {}
+    options = {
+        'poolclass': InstrumentedQueuePool,
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': _env_bool('DB_POOL_PRE_PING', True),
+    }
+    if uri.startswith('mssql+pyodbc'):
+        # Send executemany() batches as one round trip instead of one per row
+        options['fast_executemany'] = _env_bool('DB_FAST_EXECUTEMANY', True)
+    return options
+
+
+class Config:
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'dev')
+    SQLALCHEMY_DATABASE_URI = database_uri()
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Read replicas for the reporting and listing pages, comma separated in
+    # DATABASE_REPLICA_URLS (e.g. sqlite:///replica1.db,sqlite:///replica2.db).
+    # A replica further behind than REPLICA_MAX_LAG_SECONDS is skipped, and a
+    # user reads from the primary for REPLICA_STICKY_SECONDS after their own write.
+    SQLALCHEMY_REPLICA_URIS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',')
+                               if url.strip()]
+    REPLICA_MAX_LAG_SECONDS = _env_int('REPLICA_MAX_LAG_SECONDS', 30)
+    REPLICA_LAG_CHECK_SECONDS = _env_int('REPLICA_LAG_CHECK_SECONDS', 5)
+    REPLICA_STICKY_SECONDS = _env_int('REPLICA_STICKY_SECONDS', 10)
+    # Lag is probed by a background thread every REPLICA_LAG_CHECK_SECONDS;
+    # a SQL Server replica that does not answer the login within this is unhealthy
+    REPLICA_CONNECT_TIMEOUT = _env_int('REPLICA_CONNECT_TIMEOUT', 3)
+
+    # Pool checkouts that wait longer than this are logged with the pool state
+    DB_SLOW_CHECKOUT_MS = _env_int('DB_SLOW_CHECKOUT_MS', 100)
+
+    CACHE_URL = os.environ.get('CACHE_URL', 'memory://')
+
+    # bcrypt work factor; existing hashes are upgraded on the next login
+    BCRYPT_LOG_ROUNDS = _env_int('BCRYPT_LOG_ROUNDS', 12)
+    HASH_WORKERS = _env_int('HASH_WORKERS', 2)
+    HASH_MAX_PENDING = _env_int('HASH_MAX_PENDING', 16)
+
+    # Per-request query counts and timings, /admin/perf and X-DB-* headers
+    SQL_PROFILING = _env_bool('SQL_PROFILING', False)
+
+    # Throttling for /login, /register and /contact. memory:// is per process;
+    # sqlite:///path shares buckets on one host, redis:// across hosts.
+    # RATE_LIMITS overrides the defaults per limit name, e.g. {'login-ip': '30/minute'}.
+    RATELIMIT_ENABLED = _env_bool('RATELIMIT_ENABLED', True)
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL', 'memory://')
+    RATE_LIMITS = {}
+    # Number of reverse proxies (load balancer, nginx) in front of the app.
+    # Limits are keyed on the client IP, so behind a proxy set this to the hop
+    # count: the app then trusts that many X-Forwarded-For/-Proto/-Host
+    # entries. Leave it at 0 when clients connect directly, or they can spoof
+    # their address with the header.
+    TRUSTED_PROXIES = _env_int('TRUSTED_PROXIES', 0)
+
+    # Audit trail of model changes, written in batches by a background thread.
+    # AUDIT_SINK is 'table' (audit_events), 'ndjson' (segment files in
+    # AUDIT_DIR, default instance/audit) or 'off'. Events beyond
+    # AUDIT_BUFFER_SIZE waiting to be written are dropped and counted.
+    AUDIT_SINK = os.environ.get('AUDIT_SINK', 'table')
+    AUDIT_DIR = os.environ.get('AUDIT_DIR')
+    AUDIT_BUFFER_SIZE = _env_int('AUDIT_BUFFER_SIZE', 10000)
+    AUDIT_BATCH_SIZE = _env_int('AUDIT_BATCH_SIZE', 500)
+    AUDIT_FLUSH_SECONDS = float(os.environ.get('AUDIT_FLUSH_SECONDS', 1.0))
+
+    # Closed bookings moved out by `flask archive run` live here as monthly
+    # Arrow IPC files (default instance/archive). None disables compression,
+    # which lets readers use the memory-mapped buffers without copying.
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR')
+    ARCHIVE_COMPRESSION = os.environ.get('ARCHIVE_COMPRESSION', 'zstd') or None
+
+    # Door devices post check-ins to /api/check-ins with one of these bearer
+    # tokens, given as token:device pairs in CHECKIN_DEVICE_TOKENS.
+    CHECKIN_DEVICE_TOKENS = dict(pair.split(':', 1) for pair in os.environ.get('CHECKIN_DEVICE_TOKENS', '').split(',')
+                                 if ':' in pair)
+    CHECKIN_MAX_BATCH = _env_int('CHECKIN_MAX_BATCH', 5000)
+    # Seconds the cached active-member index may lag a membership change
+    ACTIVE_MEMBER_TTL = _env_int('ACTIVE_MEMBER_TTL', 60)
+
+    # Renewal reminders go out this many days before a membership expires
+    MEMBERSHIP_REMINDER_DAYS = _env_int('MEMBERSHIP_REMINDER_DAYS', 7)
@@ -0,0 +1,11 @@
+from flask_sqlalchemy import SQLAlchemy
+from flask_login import LoginManager
+from services.replicas import RoutingSession
+
+# Created unbound so modules can import them without building an app;
+# create_app() in app.py binds them. Flask-Migrate is bound there too, but
+# only for CLI processes: it imports alembic, mako and pygments, which a web
+# worker never uses.
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+login_manager = LoginManager()
+login_manager.login_view = 'main.login'
@@ -0,0 +1,41 @@
+"""Add dashboard counters
+
+Revision ID: 3b7f0e52c9a1
+Revises: 9c2e4a1d7b35
+Create Date: 2026-10-18 10:03:27.114870
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3b7f0e52c9a1'
+down_revision = '9c2e4a1d7b35'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('dashboard_counters',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+    # Seed from the existing rows; 'flask counters rebuild' does the same at any time.
+    op.execute("INSERT INTO dashboard_counters (name, value) SELECT 'bookings', COUNT(*) FROM bookings")
+    op.execute("INSERT INTO dashboard_counters (name, value) SELECT 'packages', COUNT(*) FROM packages")
+    op.execute("INSERT INTO dashboard_counters (name, value) SELECT 'categories', COUNT(*) FROM categories")
+    op.execute("INSERT INTO dashboard_counters (name, value) SELECT 'package_types', COUNT(*) FROM package_types")
+    # String concatenation differs by dialect ('+' on SQL Server, '||' on SQLite)
+    bookings = sa.table('bookings', sa.column('status', sa.String))
+    counters = sa.table('dashboard_counters', sa.column('name', sa.String), sa.column('value', sa.Integer))
+    op.execute(counters.insert().from_select(
+        ['name', 'value'],
+        sa.select(sa.literal('bookings:', sa.String) + bookings.c.status, sa.func.count())
+        .group_by(bookings.c.status)))
+
+
+def downgrade():
+    op.drop_table('dashboard_counters')
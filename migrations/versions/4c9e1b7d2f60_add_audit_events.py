@@ -0,0 +1,41 @@
+"""Add audit events table
+
+Revision ID: 4c9e1b7d2f60
+Revises: f0c7a2e8d614
+Create Date: 2026-10-18 17:02:44.318027
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c9e1b7d2f60'
+down_revision = 'f0c7a2e8d614'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('audit_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('occurred_at', sa.DateTime(), nullable=False),
+    sa.Column('actor_id', sa.Integer(), nullable=True),
+    sa.Column('action', sa.String(length=20), nullable=False),
+    sa.Column('entity', sa.String(length=50), nullable=False),
+    sa.Column('entity_id', sa.Integer(), nullable=True),
+    sa.Column('changes', sa.Text(), nullable=True),
+    sa.Column('endpoint', sa.String(length=100), nullable=True),
+    sa.Column('ip', sa.String(length=45), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_audit_events_occurred_at', 'audit_events', ['occurred_at', 'id'], unique=False)
+    op.create_index('ix_audit_events_entity', 'audit_events', ['entity', 'entity_id', 'occurred_at'], unique=False)
+    op.create_index('ix_audit_events_actor_id', 'audit_events', ['actor_id', 'occurred_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_audit_events_actor_id', table_name='audit_events')
+    op.drop_index('ix_audit_events_entity', table_name='audit_events')
+    op.drop_index('ix_audit_events_occurred_at', table_name='audit_events')
+    op.drop_table('audit_events')
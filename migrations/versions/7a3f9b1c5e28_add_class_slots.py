@@ -0,0 +1,55 @@
+"""Add class slots and reservations
+
+Revision ID: 7a3f9b1c5e28
+Revises: c41d8e6f2a90
+Create Date: 2026-10-18 12:55:31.440127
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a3f9b1c5e28'
+down_revision = 'c41d8e6f2a90'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('class_slots',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('package_id', sa.Integer(), nullable=False),
+    sa.Column('starts_at', sa.DateTime(), nullable=False),
+    sa.Column('duration_minutes', sa.Integer(), nullable=False),
+    sa.Column('capacity', sa.Integer(), nullable=False),
+    sa.Column('seats_taken', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['package_id'], ['packages.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_class_slots_package_id_starts_at', 'class_slots', ['package_id', 'starts_at'], unique=False)
+    op.create_index('ix_class_slots_starts_at', 'class_slots', ['starts_at'], unique=False)
+    op.create_table('slot_reservations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('slot_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['slot_id'], ['class_slots.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('slot_id', 'user_id', name='uq_slot_reservations_slot_id_user_id')
+    )
+    op.create_index('ix_slot_reservations_slot_id_status', 'slot_reservations',
+                    ['slot_id', 'status', 'created_at', 'id'], unique=False)
+    op.create_index('ix_slot_reservations_user_id', 'slot_reservations', ['user_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_slot_reservations_user_id', table_name='slot_reservations')
+    op.drop_index('ix_slot_reservations_slot_id_status', table_name='slot_reservations')
+    op.drop_table('slot_reservations')
+    op.drop_index('ix_class_slots_starts_at', table_name='class_slots')
+    op.drop_index('ix_class_slots_package_id_starts_at', table_name='class_slots')
+    op.drop_table('class_slots')
@@ -0,0 +1,29 @@
+"""Add bookings.expires_at
+
+Revision ID: 8e2b6d4f1a73
+Revises: d5e1a7c3b942
+Create Date: 2026-10-18 14:22:47.093316
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2b6d4f1a73'
+down_revision = 'd5e1a7c3b942'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows are filled in by `flask memberships backfill`
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('expires_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_bookings_status_expires_at', ['status', 'expires_at', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.drop_index('ix_bookings_status_expires_at')
+        batch_op.drop_column('expires_at')
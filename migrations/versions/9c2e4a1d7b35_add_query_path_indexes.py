@@ -0,0 +1,40 @@
+"""Add indexes for hot query paths
+
+Revision ID: 9c2e4a1d7b35
+Revises: 5f9386db8068
+Create Date: 2026-10-18 09:12:44.518203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c2e4a1d7b35'
+down_revision = '5f9386db8068'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_bookings_user_id_booking_date', 'bookings', ['user_id', 'booking_date', 'id'],
+                    unique=False, mssql_include=['package_id', 'status'])
+    op.create_index('ix_bookings_booking_date', 'bookings', ['booking_date', 'id'], unique=False)
+    op.create_index('ix_bookings_status_booking_date', 'bookings', ['status', 'booking_date', 'id'], unique=False)
+    op.create_index('ix_bookings_package_id', 'bookings', ['package_id'], unique=False)
+    op.create_index('ix_payments_booking_id', 'payments', ['booking_id', 'payment_date'],
+                    unique=False, mssql_include=['amount', 'payment_status'])
+    op.create_index('ix_packages_category_id_name', 'packages', ['category_id', 'name', 'id'], unique=False)
+    op.create_index('ix_packages_package_type_id', 'packages', ['package_type_id'], unique=False)
+    op.create_index('ix_inquiries_created_at', 'inquiries', ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_inquiries_created_at', table_name='inquiries')
+    op.drop_index('ix_packages_package_type_id', table_name='packages')
+    op.drop_index('ix_packages_category_id_name', table_name='packages')
+    op.drop_index('ix_payments_booking_id', table_name='payments')
+    op.drop_index('ix_bookings_package_id', table_name='bookings')
+    op.drop_index('ix_bookings_status_booking_date', table_name='bookings')
+    op.drop_index('ix_bookings_booking_date', table_name='bookings')
+    op.drop_index('ix_bookings_user_id_booking_date', table_name='bookings')
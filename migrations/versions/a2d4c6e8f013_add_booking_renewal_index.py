@@ -0,0 +1,25 @@
+"""Index bookings by member, status and expiry
+
+Revision ID: a2d4c6e8f013
+Revises: b6d3f8a1c057
+Create Date: 2026-10-18 21:40:03.118457
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2d4c6e8f013'
+down_revision = 'b6d3f8a1c057'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_bookings_user_id_status_expires_at', 'bookings', ['user_id', 'status', 'expires_at'],
+                    unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_bookings_user_id_status_expires_at', table_name='bookings')
@@ -0,0 +1,47 @@
+"""Add check-ins and hourly occupancy
+
+Revision ID: b6d3f8a1c057
+Revises: 4c9e1b7d2f60
+Create Date: 2026-10-18 18:21:05.447613
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d3f8a1c057'
+down_revision = '4c9e1b7d2f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('check_ins',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('booking_id', sa.Integer(), nullable=True),
+    sa.Column('device_id', sa.String(length=50), nullable=False),
+    sa.Column('event_id', sa.String(length=64), nullable=False),
+    sa.Column('direction', sa.String(length=3), nullable=False),
+    sa.Column('occurred_at', sa.DateTime(), nullable=False),
+    sa.Column('received_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('device_id', 'event_id', name='uq_check_ins_device_id_event_id')
+    )
+    op.create_index('ix_check_ins_user_id_occurred_at', 'check_ins', ['user_id', 'occurred_at'], unique=False)
+    op.create_index('ix_check_ins_occurred_at', 'check_ins', ['occurred_at'], unique=False)
+    op.create_table('occupancy_hours',
+    sa.Column('hour', sa.DateTime(), nullable=False),
+    sa.Column('entries', sa.Integer(), nullable=False),
+    sa.Column('exits', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('hour')
+    )
+
+
+def downgrade():
+    op.drop_table('occupancy_hours')
+    op.drop_index('ix_check_ins_occurred_at', table_name='check_ins')
+    op.drop_index('ix_check_ins_user_id_occurred_at', table_name='check_ins')
+    op.drop_table('check_ins')
@@ -0,0 +1,46 @@
+"""Add payment ledger columns
+
+Revision ID: c41d8e6f2a90
+Revises: 3b7f0e52c9a1
+Create Date: 2026-10-18 11:40:05.902311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41d8e6f2a90'
+down_revision = '3b7f0e52c9a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_amount', sa.Float(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('amount_paid', sa.Float(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('payment_type', sa.String(length=20), nullable=True))
+        batch_op.add_column(sa.Column('idempotency_key', sa.String(length=64), nullable=True))
+        batch_op.create_index('ux_payments_idempotency_key', ['idempotency_key'], unique=True,
+                              mssql_where=sa.text('idempotency_key IS NOT NULL'),
+                              sqlite_where=sa.text('idempotency_key IS NOT NULL'))
+
+    # Backfill the booking price and the running balance from existing payments
+    op.execute('UPDATE bookings SET total_amount = '
+               '(SELECT packages.price FROM packages WHERE packages.id = bookings.package_id)')
+    op.execute('UPDATE bookings SET amount_paid = '
+               '(SELECT COALESCE(SUM(payments.amount), 0) FROM payments WHERE payments.booking_id = bookings.id)')
+
+
+def downgrade():
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_index('ux_payments_idempotency_key')
+        batch_op.drop_column('idempotency_key')
+        batch_op.drop_column('payment_type')
+
+    with op.batch_alter_table('bookings', schema=None) as batch_op:
+        batch_op.drop_column('amount_paid')
+        batch_op.drop_column('total_amount')
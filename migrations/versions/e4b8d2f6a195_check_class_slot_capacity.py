@@ -0,0 +1,27 @@
+"""Require a positive class slot capacity
+
+Revision ID: e4b8d2f6a195
+Revises: a2d4c6e8f013
+Create Date: 2026-10-18 21:58:26.402113
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4b8d2f6a195'
+down_revision = 'a2d4c6e8f013'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fails on existing slots with capacity < 1; fix or delete those first
+    with op.batch_alter_table('class_slots', schema=None) as batch_op:
+        batch_op.create_check_constraint('ck_class_slots_capacity_positive', 'capacity > 0')
+
+
+def downgrade():
+    with op.batch_alter_table('class_slots', schema=None) as batch_op:
+        batch_op.drop_constraint('ck_class_slots_capacity_positive', type_='check')
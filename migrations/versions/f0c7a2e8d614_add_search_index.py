@@ -0,0 +1,62 @@
+"""Add full-text search index
+
+Revision ID: f0c7a2e8d614
+Revises: 8e2b6d4f1a73
+Create Date: 2026-10-18 15:08:19.720451
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f0c7a2e8d614'
+down_revision = '8e2b6d4f1a73'
+branch_labels = None
+depends_on = None
+
+SEARCHABLE = {
+    'members': ('users', ('username', 'email')),
+    'packages': ('packages', ('name', 'description')),
+    'inquiries': ('inquiries', ('name', 'email', 'message')),
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for kind, (table, columns) in SEARCHABLE.items():
+            op.execute(f"CREATE VIRTUAL TABLE search_{kind} USING fts5({', '.join(columns)}, "
+                       f"tokenize='unicode61 remove_diacritics 2', prefix='2 3 4')")
+            op.execute(f"INSERT INTO search_{kind} (rowid, {', '.join(columns)}) "
+                       f"SELECT id, {', '.join(columns)} FROM {table}")
+    elif dialect == 'mssql':
+        # Full-text DDL cannot run inside a transaction. Skipped quietly where
+        # the Full-Text Search feature is not installed; the app then uses LIKE.
+        with op.get_context().autocommit_block():
+            op.execute("IF FULLTEXTSERVICEPROPERTY('IsFullTextInstalled') = 1 "
+                       "AND NOT EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'gym_search') "
+                       "CREATE FULLTEXT CATALOG gym_search")
+            for table, columns in SEARCHABLE.values():
+                op.execute(f"""
+IF FULLTEXTSERVICEPROPERTY('IsFullTextInstalled') = 1
+BEGIN
+    DECLARE @key sysname = (SELECT name FROM sys.indexes
+                            WHERE object_id = OBJECT_ID('{table}') AND is_primary_key = 1);
+    EXEC('CREATE FULLTEXT INDEX ON {table} ({', '.join(columns)}) KEY INDEX ' + @key +
+         ' ON gym_search WITH CHANGE_TRACKING AUTO');
+END""")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for kind in SEARCHABLE:
+            op.execute(f'DROP TABLE search_{kind}')
+    elif dialect == 'mssql':
+        with op.get_context().autocommit_block():
+            for table, _ in SEARCHABLE.values():
+                op.execute(f"IF EXISTS (SELECT 1 FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('{table}')) "
+                           f"DROP FULLTEXT INDEX ON {table}")
+            op.execute("IF EXISTS (SELECT 1 FROM sys.fulltext_catalogs WHERE name = 'gym_search') "
+                       "DROP FULLTEXT CATALOG gym_search")
@@ -1 +1 @@
-from .model import User, Category, PackageType, Package, Booking, Payment, AdminSettings, Inquiry,RegistrationForm,LoginForm,UpdateProfileForm,BookingForm,ChangePasswordForm
\ No newline at end of file
+from .model import User, Category, PackageType, Package, Booking, Payment, AdminSettings, Inquiry,ClassSlot,SlotReservation,Job,DashboardCounter,AuditEvent,CheckIn,OccupancyHour
\ No newline at end of file
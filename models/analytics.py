@@ -0,0 +1,313 @@
+import itertools
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import date
+import click
+import numpy as np
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+from extensions import db
+from models.model import Payment, Booking, Package, Job
+from models.archive import archived_payment_batches
+from models.reference import (reference_cache, invalidate_reference_data, category_choices,
+                              package_type_choices, ANALYTICS)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+CUBE_BATCH_SIZE = 50000
+# Payment ids are handed out before commit, so a lower id can become visible
+# after a higher one was folded in. Refreshes look this many ids back and
+# skip the ones already counted.
+LOOKBACK_IDS = 5000
+REFRESH_JOB = 'refresh_revenue_cube'
+GRANULARITIES = ('day', 'week', 'month')
+# (user_id, month) pairs are packed into one int64 for set operations
+_MONTH_SLOTS = 1 << 16
+
+analytics_cli = AppGroup('analytics', help='Build the revenue analytics cube.')
+
+_thread_lock = threading.Lock()
+# The last cube this process loaded, reused while the file on disk is unchanged
+_loaded = {}
+
+
+def _empty_state():
+    return {
+        'last_payment_id': np.int64(0),
+        # Sorted ids of the payments folded in within LOOKBACK_IDS of the last one
+        'recent_ids': np.empty(0, dtype=np.int64),
+        # Daily base cube: one row per (day, category_id, package_type_id)
+        'keys': np.empty((0, 3), dtype=np.int64),
+        'revenue': np.empty(0, dtype=np.float64),
+        'payments': np.empty(0, dtype=np.int64),
+        # Sorted, unique user_id * _MONTH_SLOTS + month for every month a member paid in
+        'activity': np.empty(0, dtype=np.int64),
+    }
+
+
+def _aggregate(keys, revenue, payments):
+    unique, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    return (unique, np.bincount(inverse, weights=revenue, minlength=len(unique)),
+            np.bincount(inverse, weights=payments, minlength=len(unique)).astype(np.int64))
+
+
+def _months(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def _period_starts(days, granularity):
+    # Days since 1970-01-01, a Thursday; weeks start on Monday
+    if granularity == 'day':
+        return days
+    if granularity == 'week':
+        return days - (days + 3) % 7
+    return _months(days).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+
+class RevenueCube:
+    """Revenue by day x category x package type, plus monthly member activity.
+
+    The state is a handful of NumPy arrays saved to an .npz file, so a
+    refresh only reads payments newer than ``last_payment_id`` and folds
+    them in; every rollup is then computed from the small daily cube
+    rather than from payment rows.
+    """
+
+    def __init__(self, path, state=None):
+        self.path = path
+        self.state = state or _empty_state()
+
+    @classmethod
+    def load(cls, path):
+        if not os.path.exists(path):
+            return cls(path)
+        mtime = os.stat(path).st_mtime_ns
+        cached = _loaded.get(path)
+        if cached and cached[0] == mtime:
+            return cls(path, dict(cached[1]))
+        with np.load(path) as saved:
+            state = dict(_empty_state(), **{name: saved[name] for name in saved.files})
+        _loaded[path] = (mtime, state)
+        return cls(path, dict(state))
+
+    @property
+    def last_payment_id(self):
+        return int(self.state['last_payment_id'])
+
+    def save(self):
+        # A temporary file of its own next to the cube, so a concurrent save
+        # can neither remove it nor be renamed into place half-written
+        fd, tmp = tempfile.mkstemp(prefix='revenue_cube.', suffix='.npz', dir=os.path.dirname(self.path))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                np.savez(out, **self.state)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def append(self, batch):
+        # batch: dict of equal-length arrays as produced by payment_batches()
+        state = self.state
+        fresh = ~np.isin(batch['payment_id'], state['recent_ids'])
+        if not fresh.all():
+            batch = {name: values[fresh] for name, values in batch.items()}
+            if not len(batch['payment_id']):
+                return 0
+        keys = np.stack([batch['day'], batch['category_id'], batch['package_type_id']], axis=1)
+        state['keys'], state['revenue'], state['payments'] = _aggregate(
+            np.concatenate([state['keys'], keys]),
+            np.concatenate([state['revenue'], batch['amount']]),
+            np.concatenate([state['payments'], np.ones(len(keys), dtype=np.int64)]))
+        activity = batch['user_id'] * _MONTH_SLOTS + _months(batch['day'])
+        state['activity'] = np.union1d(state['activity'], activity)
+        state['last_payment_id'] = np.int64(max(self.last_payment_id, int(batch['payment_id'].max())))
+        recent = np.union1d(state['recent_ids'], batch['payment_id'])
+        state['recent_ids'] = recent[recent > self.last_payment_id - LOOKBACK_IDS]
+        return len(batch['payment_id'])
+
+    def rollup(self, granularity='month', start=None, end=None):
+        keys, revenue, payments = self.state['keys'], self.state['revenue'], self.state['payments']
+        days = keys[:, 0]
+        mask = np.ones(len(days), dtype=bool)
+        if start is not None:
+            mask &= days >= _day_number(start)
+        if end is not None:
+            mask &= days <= _day_number(end)
+        periods = _period_starts(days[mask], granularity)
+        grouped, totals, counts = _aggregate(np.stack([periods, keys[mask, 1], keys[mask, 2]], axis=1),
+                                             revenue[mask], payments[mask])
+        return grouped, totals, counts
+
+    def retention(self):
+        # Cohort = month of a member's first payment; offset = months since then
+        activity = self.state['activity']
+        if not len(activity):
+            empty = np.empty(0, dtype=np.int64)
+            return np.empty((0, 0), dtype=np.int64), empty, empty
+        users, months = activity // _MONTH_SLOTS, activity % _MONTH_SLOTS
+        # activity is sorted, so each user's first entry is their earliest month
+        starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+        first = np.repeat(months[starts], np.diff(np.r_[starts, len(users)]))
+        cohorts, cohort_index = np.unique(first, return_inverse=True)
+        offsets = months - first
+        matrix = np.zeros((len(cohorts), int(offsets.max()) + 1), dtype=np.int64)
+        np.add.at(matrix, (cohort_index.ravel(), offsets), 1)
+        # Offsets past the latest month seen have not happened yet for a cohort
+        observed = months.max() - cohorts + 1
+        return matrix, cohorts, observed
+
+
+def _day_number(value):
+    return int(np.datetime64(value, 'D').astype(np.int64))
+
+
+def _day_string(number):
+    return str(np.datetime64(int(number), 'D'))
+
+
+def payment_batches(after_id=0, batch_size=CUBE_BATCH_SIZE):
+    # Plain columns streamed with yield_per; each partition becomes one set of arrays
+    statement = (select(Payment.id, Payment.amount, Payment.payment_date, Booking.user_id,
+                        Package.category_id, Package.package_type_id)
+                 .join(Booking, Payment.booking_id == Booking.id)
+                 .join(Package, Booking.package_id == Package.id)
+                 .where(Payment.id > after_id, Payment.payment_status == 'completed',
+                        Payment.payment_date.is_not(None))
+                 .order_by(Payment.id))
+    result = db.session.execute(statement.execution_options(yield_per=batch_size))
+    try:
+        for rows in result.partitions():
+            payment_id, amount, paid_at, user_id, category_id, package_type_id = zip(*rows)
+            yield {
+                'payment_id': np.fromiter(payment_id, dtype=np.int64, count=len(rows)),
+                'amount': np.fromiter(amount, dtype=np.float64, count=len(rows)),
+                'day': np.array(paid_at, dtype='datetime64[D]').astype(np.int64),
+                'user_id': np.fromiter(user_id, dtype=np.int64, count=len(rows)),
+                'category_id': np.fromiter(category_id, dtype=np.int64, count=len(rows)),
+                'package_type_id': np.fromiter(package_type_id, dtype=np.int64, count=len(rows)),
+            }
+    finally:
+        result.close()
+
+
+def cube_path():
+    directory = current_app.config.get('ANALYTICS_DIR') or os.path.join(current_app.instance_path, 'analytics')
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, 'revenue_cube.npz')
+
+
+@contextmanager
+def _refresh_lock(path):
+    # The file lock serialises refreshes across processes (several job
+    # workers, the CLI); the thread lock covers threads within one
+    with _thread_lock, open(path + '.lock', 'a+b') as handle:
+        if fcntl:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def refresh_cube(rebuild=False, batch_size=CUBE_BATCH_SIZE):
+    """Fold new payments into the saved cube. Run by ``flask analytics build``
+    and the refresh_revenue_cube job; requests only read the cube."""
+    path = cube_path()
+    with _refresh_lock(path):
+        cube = RevenueCube(path) if rebuild else RevenueCube.load(path)
+        appended = 0
+        # Archived payments left the table after they were folded in; a
+        # rebuild reads them back from the archive first.
+        batches = payment_batches(max(cube.last_payment_id - LOOKBACK_IDS, 0), batch_size)
+        if rebuild:
+            batches = itertools.chain(archived_payment_batches(), batches)
+        for batch in batches:
+            appended += cube.append(batch)
+        if appended or rebuild:
+            cube.save()
+            # A late payment below last_payment_id, or a rebuild, changes
+            # totals under the same key: drop cached rollups
+            invalidate_reference_data(ANALYTICS)
+        return cube, appended
+
+
+def schedule_refresh():
+    """Queue a cube refresh when payments have arrived since the last one,
+    unless one is already waiting. True while the cube is behind."""
+    from models.jobs import enqueue, QUEUED, RUNNING
+    cube = RevenueCube.load(cube_path())
+    newest = db.session.scalar(select(func.max(Payment.id)))
+    if not newest or newest <= cube.last_payment_id:
+        return False
+    pending = db.session.scalar(select(Job.id).where(Job.name == REFRESH_JOB, Job.status.in_((QUEUED, RUNNING)))
+                                .limit(1))
+    if pending is not None:
+        return True
+    enqueue(REFRESH_JOB)
+    db.session.commit()
+    return True
+
+
+def revenue_rollup(granularity='month', start=None, end=None):
+    if granularity not in GRANULARITIES:
+        raise ValueError(f'Unknown granularity {granularity!r}')
+    cube = RevenueCube.load(cube_path())
+
+    def build():
+        grouped, totals, counts = cube.rollup(granularity, start, end)
+        categories = dict(category_choices())
+        package_types = dict(package_type_choices())
+        return [{'period': _day_string(period), 'category': categories.get(int(category_id), category_id),
+                 'package_type': package_types.get(int(type_id), type_id),
+                 'revenue': round(float(total), 2), 'payments': int(count)}
+                for (period, category_id, type_id), total, count in zip(grouped.tolist(), totals, counts)]
+
+    # Keyed by the last payment folded in, so a cached rollup is never older than the cube
+    key = (ANALYTICS, 'rollup', granularity, start, end, cube.last_payment_id)
+    return reference_cache.get_or_load(key, build, ttl=3600)
+
+
+def cohort_retention():
+    cube = RevenueCube.load(cube_path())
+
+    def build():
+        matrix, cohorts, observed = cube.retention()
+        rates = matrix / matrix[:, :1]
+        return [{'cohort': str(np.datetime64(int(month), 'M')), 'members': int(row[0]),
+                 'retention': np.round(rate[:span], 4).tolist()}
+                for month, row, rate, span in zip(cohorts, matrix, rates, observed)]
+
+    return reference_cache.get_or_load((ANALYTICS, 'retention', cube.last_payment_id), build, ttl=3600)
+
+
+def parse_period(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+@analytics_cli.command('build')
+@click.option('--rebuild', is_flag=True, help='Discard the saved cube and read every payment again.')
+@click.option('--batch-size', default=CUBE_BATCH_SIZE, show_default=True)
+def build_command(rebuild, batch_size):
+    """Fold new payments into the revenue cube."""
+    cube, appended = refresh_cube(rebuild, batch_size)
+    click.echo(f'{appended} payment(s) added; cube has {len(cube.state["revenue"])} cells '
+               f'up to payment {cube.last_payment_id}.')
@@ -0,0 +1,388 @@
+import heapq
+import os
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, select
+from extensions import db
+from models.model import Booking, Payment, User, Package, Category, PackageType
+
+
+# Closed bookings: nothing changes them any more, so they can leave the hot
+# tables. Pending and active bookings stay however old they are.
+ARCHIVABLE_STATUSES = ('expired', 'cancelled')
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_COMPRESSION = 'zstd'
+
+BOOKINGS = 'bookings'
+PAYMENTS = 'payments'
+
+# Archived bookings carry the names they were reported under, so reports and
+# history still read right after a package or member is renamed or deleted.
+BOOKING_COLUMNS = (
+    ('id', 'int64'), ('user_id', 'int64'), ('package_id', 'int64'), ('booking_date', 'timestamp'),
+    ('status', 'string'), ('total_amount', 'float64'), ('amount_paid', 'float64'), ('expires_at', 'timestamp'),
+    ('username', 'string'), ('email', 'string'), ('package_name', 'string'), ('price', 'float64'),
+    ('category_id', 'int64'), ('category', 'string'), ('package_type_id', 'int64'), ('package_type', 'string'),
+)
+# Payments are filed in the month of their booking, next to it
+PAYMENT_COLUMNS = (
+    ('id', 'int64'), ('booking_id', 'int64'), ('amount', 'float64'), ('payment_date', 'timestamp'),
+    ('payment_status', 'string'), ('payment_type', 'string'), ('idempotency_key', 'string'),
+)
+COLUMNS = {BOOKINGS: BOOKING_COLUMNS, PAYMENTS: PAYMENT_COLUMNS}
+
+
+class ArchiveError(Exception):
+    """Raised when rows changed while they were being archived."""
+
+
+def _schema(kind):
+    import pyarrow as pa
+    types = {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string(), 'timestamp': pa.timestamp('us')}
+    return pa.schema([(name, types[type_name]) for name, type_name in COLUMNS[kind]])
+
+
+def archive_directory(kind):
+    root = current_app.config.get('ARCHIVE_DIR') or os.path.join(current_app.instance_path, 'archive')
+    return os.path.join(root, kind)
+
+
+def month_of(value):
+    return value.strftime('%Y-%m')
+
+
+def partition_path(kind, month):
+    return os.path.join(archive_directory(kind), f'{month}.arrow')
+
+
+def archived_months(kind):
+    # Partition names sort chronologically; no pyarrow import to find out there are none
+    try:
+        names = os.listdir(archive_directory(kind))
+    except FileNotFoundError:
+        return []
+    return sorted(name[:-len('.arrow')] for name in names if name.endswith('.arrow'))
+
+
+def read_partition(kind, month, columns=None):
+    """One month as an Arrow table, read through a memory map.
+
+    Only ``columns`` are read and decompressed; with ARCHIVE_COMPRESSION
+    set to None the buffers point straight into the mapped file.
+    """
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    names = [name for name, _ in COLUMNS[kind]]
+    options = ipc.IpcReadOptions(included_fields=[names.index(column) for column in columns]) if columns else None
+    return ipc.open_file(pa.memory_map(partition_path(kind, month)), options=options).read_all()
+
+
+def write_partition(kind, month, table):
+    # Merged with what the month already holds; a row archived twice (a run
+    # that failed after writing) keeps its newest copy.
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.ipc as ipc
+    path = partition_path(kind, month)
+    if os.path.exists(path):
+        existing = read_partition(kind, month)
+        existing = existing.filter(pc.invert(pc.is_in(existing['id'], value_set=table['id'])))
+        table = pa.concat_tables([existing, table])
+    sort_keys = [('booking_date', 'ascending'), ('id', 'ascending')] if kind == BOOKINGS else [('id', 'ascending')]
+    table = table.sort_by(sort_keys)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    options = ipc.IpcWriteOptions(compression=current_app.config.get('ARCHIVE_COMPRESSION', ARCHIVE_COMPRESSION))
+    # Written under a temporary name so readers never map a half-written file
+    with pa.OSFile(path + '.partial', 'wb') as sink:
+        with ipc.new_file(sink, table.schema, options=options) as writer:
+            writer.write_table(table, max_chunksize=65536)
+    os.replace(path + '.partial', path)
+    return table.num_rows
+
+
+def _booking_statement(cutoff, limit):
+    return (select(Booking.id, Booking.user_id, Booking.package_id, Booking.booking_date, Booking.status,
+                   Booking.total_amount, Booking.amount_paid, Booking.expires_at,
+                   User.username, User.email, Package.name, Package.price,
+                   Category.id, Category.name, PackageType.id, PackageType.name)
+            .join(User, Booking.user_id == User.id)
+            .join(Package, Booking.package_id == Package.id)
+            .join(Category, Package.category_id == Category.id)
+            .join(PackageType, Package.package_type_id == PackageType.id)
+            .where(Booking.booking_date < cutoff, Booking.status.in_(ARCHIVABLE_STATUSES))
+            .order_by(Booking.booking_date, Booking.id)
+            .limit(limit))
+
+
+def _payment_statement(booking_ids):
+    return (select(Payment.id, Payment.booking_id, Payment.amount, Payment.payment_date,
+                   Payment.payment_status, Payment.payment_type, Payment.idempotency_key)
+            .where(Payment.booking_id.in_(booking_ids))
+            .order_by(Payment.id))
+
+
+def _table(kind, rows):
+    import pyarrow as pa
+    schema = _schema(kind)
+    return pa.table({name: [row[index] for row in rows] for index, name in enumerate(schema.names)}, schema=schema)
+
+
+def archive_bookings(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move closed bookings older than ``cutoff`` and their payments into
+    monthly Arrow partitions. Returns (bookings, payments, months).
+
+    Each batch is deleted, written to its partitions and then committed, so
+    a failed write leaves the rows in the database. A crash between the
+    write and the commit leaves rows in both places: report rows and
+    history skip those duplicates (union_rows), and the next run replaces
+    the archived copy.
+    """
+    archived_bookings = archived_payments = 0
+    months = set()
+    while True:
+        bookings = db.session.execute(_booking_statement(cutoff, batch_size)).all()
+        if not bookings:
+            break
+        booking_ids = [row[0] for row in bookings]
+        booking_month = {row[0]: month_of(row[3]) for row in bookings}
+        payments = db.session.execute(_payment_statement(booking_ids)).all()
+
+        # Core deletes: the dashboard counters keep counting archived bookings
+        db.session.execute(delete(Payment).where(Payment.booking_id.in_(booking_ids))
+                           .execution_options(synchronize_session=False))
+        deleted = db.session.execute(delete(Booking).where(Booking.id.in_(booking_ids),
+                                                           Booking.status.in_(ARCHIVABLE_STATUSES))
+                                     .execution_options(synchronize_session=False)).rowcount
+        if deleted != len(booking_ids):
+            db.session.rollback()
+            raise ArchiveError(f'{len(booking_ids) - deleted} bookings changed while archiving; run it again.')
+
+        by_month = defaultdict(lambda: ([], []))
+        for row in bookings:
+            by_month[booking_month[row[0]]][0].append(row)
+        for row in payments:
+            by_month[booking_month[row[1]]][1].append(row)
+        try:
+            for month, (month_bookings, month_payments) in sorted(by_month.items()):
+                write_partition(BOOKINGS, month, _table(BOOKINGS, month_bookings))
+                if month_payments:
+                    write_partition(PAYMENTS, month, _table(PAYMENTS, month_payments))
+        except Exception:
+            db.session.rollback()
+            raise
+        db.session.commit()
+        archived_bookings += len(bookings)
+        archived_payments += len(payments)
+        months.update(by_month)
+    return archived_bookings, archived_payments, sorted(months)
+
+
+def _months_between(start, end):
+    first, last = month_of(start), month_of(end)
+    return [month for month in archived_months(BOOKINGS) if first <= month <= last]
+
+
+def union_rows(hot, archived, key, reverse=False):
+    """Merge two iterables sorted on ``key`` (booking_date, id).
+
+    Equal keys are the same booking caught in both places by an
+    interrupted archive run, so only the hot copy is kept.
+    """
+    previous = object()
+    for row in heapq.merge(hot, archived, key=key, reverse=reverse):
+        current = key(row)
+        if current != previous:
+            yield row
+        previous = current
+
+
+def archived_report_rows(start, end):
+    # Same columns and order as reports.report_statement
+    start_at = datetime.combine(start, datetime.min.time())
+    end_at = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    columns = ['id', 'booking_date', 'status', 'username', 'email', 'package_name', 'category',
+               'package_type', 'price']
+    for month in _months_between(start_at, end_at - timedelta(microseconds=1)):
+        table = read_partition(BOOKINGS, month, columns)
+        for row in zip(*(table[column].to_pylist() for column in columns)):
+            if start_at <= row[1] < end_at:
+                yield row
+
+
+def archived_aggregates(start, end):
+    """Per package, category, package type and day totals of archived bookings.
+
+    Returns {'per_package': {name: (bookings, paid)}, ..., 'per_day': {date: bookings}}.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    start_at = datetime.combine(start, datetime.min.time())
+    end_at = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    months = _months_between(start_at, end_at - timedelta(microseconds=1))
+    result = {'per_package': {}, 'per_category': {}, 'per_package_type': {}, 'per_day': {}}
+    if not months:
+        return result
+    bookings = pa.concat_tables([read_partition(BOOKINGS, month, ['id', 'booking_date', 'package_name', 'category',
+                                                                 'package_type']) for month in months])
+    bookings = bookings.filter(pc.and_(pc.greater_equal(bookings['booking_date'], pa.scalar(start_at, pa.timestamp('us'))),
+                                       pc.less(bookings['booking_date'], pa.scalar(end_at, pa.timestamp('us')))))
+    payment_months = [month for month in months if os.path.exists(partition_path(PAYMENTS, month))]
+    if payment_months:
+        payments = pa.concat_tables([read_partition(PAYMENTS, month, ['booking_id', 'amount'])
+                                     for month in payment_months])
+        paid = payments.group_by('booking_id').aggregate([('amount', 'sum')]).rename_columns(['id', 'paid'])
+        bookings = bookings.join(paid, 'id', join_type='left outer')
+    else:
+        bookings = bookings.append_column('paid', pa.nulls(bookings.num_rows, pa.float64()))
+    bookings = bookings.set_column(bookings.schema.get_field_index('paid'), 'paid',
+                                   pc.fill_null(bookings['paid'], 0.0))
+    for name, column in (('per_package', 'package_name'), ('per_category', 'category'),
+                         ('per_package_type', 'package_type')):
+        grouped = bookings.group_by(column).aggregate([('id', 'count'), ('paid', 'sum')])
+        result[name] = {key: (count, total) for key, count, total in
+                        zip(grouped[column].to_pylist(), grouped['id_count'].to_pylist(),
+                            grouped['paid_sum'].to_pylist())}
+    days = pc.cast(bookings['booking_date'], pa.date32())
+    grouped = pa.table({'day': days, 'id': bookings['id']}).group_by('day').aggregate([('id', 'count')])
+    result['per_day'] = dict(zip(grouped['day'].to_pylist(), grouped['id_count'].to_pylist()))
+    return result
+
+
+class ArchivedBooking(SimpleNamespace):
+    """A booking read back from the archive, shaped like Booking for the templates."""
+
+    archived = True
+
+
+# Member ids per bookings partition, as (mtime, frozenset) by path
+_members = {}
+
+
+def _partition_members(month):
+    # The member ids in one bookings partition, kept per process until the
+    # file changes: a history page skips the months its member has nothing in
+    import pyarrow.compute as pc
+    path = partition_path(BOOKINGS, month)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _members.get(path)
+    if cached is None or cached[0] != mtime:
+        user_ids = read_partition(BOOKINGS, month, ['user_id'])['user_id']
+        cached = _members[path] = (mtime, frozenset(pc.unique(user_ids).to_pylist()))
+    return cached[1]
+
+
+def archived_history(user_id, before=None, limit=20):
+    """A member's archived bookings, newest first, strictly before the
+    (booking_date, id) position ``before``. Reads only the months the member
+    has bookings in, newest first, and stops once ``limit`` are found.
+    """
+    import pyarrow.compute as pc
+    if before and before[0] is None:
+        # Past the hot rows without a booking_date, which sort after every
+        # archived row (only dated bookings are archived)
+        return []
+    found = []
+    for month in reversed(archived_months(BOOKINGS)):
+        if before and month > month_of(before[0]):
+            continue
+        if user_id not in _partition_members(month):
+            continue
+        table = read_partition(BOOKINGS, month, ['id', 'user_id', 'booking_date', 'status', 'total_amount',
+                                                 'amount_paid', 'expires_at', 'package_name'])
+        table = table.filter(pc.equal(table['user_id'], user_id))
+        rows = [row for row in table.to_pylist()
+                if not before or (row['booking_date'], row['id']) < before]
+        rows.sort(key=lambda row: (row['booking_date'], row['id']), reverse=True)
+        found.extend(_with_payments(month, rows))
+        if len(found) >= limit:
+            break
+    return found[:limit]
+
+
+def _with_payments(month, rows):
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    payments = defaultdict(list)
+    if rows and os.path.exists(partition_path(PAYMENTS, month)):
+        table = read_partition(PAYMENTS, month)
+        table = table.filter(pc.is_in(table['booking_id'], value_set=pa.array([row['id'] for row in rows], pa.int64())))
+        for payment in table.to_pylist():
+            payments[payment['booking_id']].append(SimpleNamespace(**payment))
+    return [ArchivedBooking(package=SimpleNamespace(id=None, name=row.pop('package_name')),
+                            payments=payments[row['id']], **row) for row in rows]
+
+
+def archived_counts():
+    # For counters.compute_counts, so a recount still includes archived bookings
+    counts = defaultdict(int)
+    for month in archived_months(BOOKINGS):
+        for status in read_partition(BOOKINGS, month, ['status'])['status'].to_pylist():
+            counts[status] += 1
+    return counts
+
+
+def archived_payment_batches():
+    # Completed payments in the shape analytics.payment_batches yields
+    import numpy as np
+    for month in archived_months(PAYMENTS):
+        payments = read_partition(PAYMENTS, month).to_pydict()
+        bookings = read_partition(BOOKINGS, month, ['id', 'user_id', 'category_id', 'package_type_id']).to_pydict()
+        by_id = {booking_id: index for index, booking_id in enumerate(bookings['id'])}
+        rows = [(payment_id, amount, paid_at, by_id[booking_id])
+                for payment_id, booking_id, amount, paid_at, status in
+                zip(payments['id'], payments['booking_id'], payments['amount'], payments['payment_date'],
+                    payments['payment_status'])
+                if status == 'completed' and paid_at is not None and booking_id in by_id]
+        if not rows:
+            continue
+        payment_id, amount, paid_at, index = zip(*rows)
+        yield {
+            'payment_id': np.array(payment_id, dtype=np.int64),
+            'amount': np.array(amount, dtype=np.float64),
+            'day': np.array(paid_at, dtype='datetime64[D]').astype(np.int64),
+            'user_id': np.array([bookings['user_id'][i] for i in index], dtype=np.int64),
+            'category_id': np.array([bookings['category_id'][i] for i in index], dtype=np.int64),
+            'package_type_id': np.array([bookings['package_type_id'][i] for i in index], dtype=np.int64),
+        }
+
+
+def parse_cutoff(value, months):
+    if value:
+        return datetime.combine(date.fromisoformat(value), datetime.min.time())
+    today = date.today()
+    month = today.year * 12 + today.month - 1 - months
+    return datetime(month // 12, month % 12 + 1, 1)
+
+
+archive_cli = AppGroup('archive', help='Move closed bookings into monthly Arrow partitions.')
+
+
+@archive_cli.command('run')
+@click.option('--before', help='Archive bookings dated before this ISO date.')
+@click.option('--older-than-months', default=24, show_default=True,
+              help='Without --before: archive bookings before the first of the month this many months ago.')
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True)
+def run_command(before, older_than_months, batch_size):
+    from models.analytics import refresh_cube
+    try:
+        cutoff = parse_cutoff(before, older_than_months)
+    except ValueError:
+        raise click.BadParameter('--before must be an ISO date.')
+    # Fold every payment into the revenue cube before any of them leave the table
+    refresh_cube()
+    bookings, payments, months = archive_bookings(cutoff, batch_size)
+    click.echo(f'{bookings} bookings and {payments} payments before {cutoff:%Y-%m-%d} archived '
+               f'into {len(months)} monthly partitions.')
+
+
+@archive_cli.command('stats')
+def stats_command():
+    for kind in (BOOKINGS, PAYMENTS):
+        for month in archived_months(kind):
+            path = partition_path(kind, month)
+            rows = read_partition(kind, month, ['id']).num_rows
+            click.echo(f'{kind:<9} {month}  {rows:>8} rows  {os.path.getsize(path) / 1024:>9.1f} KiB')
@@ -0,0 +1,250 @@
+import itertools
+from datetime import datetime, timedelta, timezone
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import and_, event, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from extensions import db
+from models.model import Booking, CheckIn, OccupancyHour
+from models.memberships import ACTIVE_STATUSES, EXPIRED
+from models.reference import reference_cache, invalidate_reference_data, ACTIVE_MEMBERS
+
+
+IN, OUT = 'in', 'out'
+DIRECTIONS = (IN, OUT)
+
+CHECKIN_MAX_BATCH = 5000
+# A member whose membership lapsed while inside can still be let out
+CHECKOUT_GRACE = timedelta(hours=12)
+
+# Rejection reasons reported back to the device, per event
+INVALID = 'invalid'
+UNKNOWN_MEMBER = 'no_membership'
+EXPIRED_MEMBERSHIP = 'membership_expired'
+
+
+class CheckInError(Exception):
+    """Raised for a batch that cannot be taken at all (too large, malformed)."""
+
+
+def _load_active_members():
+    # user_id -> (booking_id, expires_at) of the membership that lasts longest.
+    # Memberships that lapsed within the grace period are kept so their
+    # holders can still check out.
+    since = datetime.utcnow() - CHECKOUT_GRACE
+    rows = db.session.execute(
+        select(Booking.user_id, Booking.id, Booking.expires_at)
+        .where(Booking.status.in_(ACTIVE_STATUSES + (EXPIRED,)),
+               or_(Booking.expires_at.is_(None), Booking.expires_at >= since)))
+    members = {}
+    for user_id, booking_id, expires_at in rows:
+        current = members.get(user_id)
+        if current is None or (current[1] is not None and (expires_at is None or expires_at > current[1])):
+            members[user_id] = (booking_id, expires_at)
+    return members
+
+
+def active_members():
+    """The cached active-member index. Rebuilt after any booking commit and
+    at most ACTIVE_MEMBER_TTL seconds old otherwise; expiry is checked
+    against each event's own time, so a stale entry never admits anyone
+    after their membership ends."""
+    return reference_cache.get_or_load((ACTIVE_MEMBERS, 'index'), _load_active_members,
+                                       ttl=current_app.config.get('ACTIVE_MEMBER_TTL', 60))
+
+
+@event.listens_for(Session, 'after_flush')
+def _note_membership_changes(session, flush_context):
+    # New bookings, renewals and status changes all change who may come in
+    if any(isinstance(instance, Booking) for instance in itertools.chain(session.new, session.dirty)):
+        session.info['memberships_changed'] = True
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_active_members(session):
+    if session.info.pop('memberships_changed', False):
+        invalidate_reference_data(ACTIVE_MEMBERS)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_membership_changes(session):
+    session.info.pop('memberships_changed', None)
+
+
+def _parse_event(raw):
+    try:
+        occurred_at = datetime.fromisoformat(raw['occurred_at'])
+        if occurred_at.tzinfo is not None:
+            # Stored naive UTC like every other timestamp in the schema
+            occurred_at = occurred_at.astimezone(timezone.utc).replace(tzinfo=None)
+        event_id = str(raw['event_id'])
+        direction = raw.get('direction', IN)
+        user_id = int(raw['user_id'])
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return None
+    if direction not in DIRECTIONS or not event_id or len(event_id) > 64:
+        return None
+    return {'event_id': event_id, 'user_id': user_id, 'direction': direction, 'occurred_at': occurred_at}
+
+
+def validate_events(device_id, events, members):
+    """Split raw device events into rows to insert and rejections.
+
+    Everything is checked in memory against the active-member index: no
+    query per event.
+    """
+    rows, rejected, seen = [], [], set()
+    received_at = datetime.utcnow()
+    for index, raw in enumerate(events):
+        parsed = _parse_event(raw) if isinstance(raw, dict) else None
+        if parsed is None:
+            rejected.append({'index': index, 'event_id': raw.get('event_id') if isinstance(raw, dict) else None,
+                             'reason': INVALID})
+            continue
+        if parsed['event_id'] in seen:
+            continue
+        seen.add(parsed['event_id'])
+        membership = members.get(parsed['user_id'])
+        if membership is None:
+            rejected.append({'index': index, 'event_id': parsed['event_id'], 'reason': UNKNOWN_MEMBER})
+            continue
+        booking_id, expires_at = membership
+        if expires_at is not None:
+            allowed_until = expires_at + CHECKOUT_GRACE if parsed['direction'] == OUT else expires_at
+            if parsed['occurred_at'] > allowed_until:
+                rejected.append({'index': index, 'event_id': parsed['event_id'], 'reason': EXPIRED_MEMBERSHIP})
+                continue
+        rows.append(dict(parsed, device_id=device_id, booking_id=booking_id, received_at=received_at))
+    return rows, rejected
+
+
+def _already_recorded(device_id, event_ids):
+    # Devices resend a batch when they miss the response; those events are
+    # acknowledged again rather than stored twice.
+    found = set()
+    event_ids = list(event_ids)
+    for start in range(0, len(event_ids), 1000):
+        found.update(db.session.scalars(
+            select(CheckIn.event_id).where(CheckIn.device_id == device_id,
+                                           CheckIn.event_id.in_(event_ids[start:start + 1000]))))
+    return found
+
+
+def hour_of(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _hourly(rows):
+    deltas = {}
+    for row in rows:
+        hour = hour_of(row['occurred_at'])
+        entries, exits = deltas.get(hour, (0, 0))
+        deltas[hour] = (entries + 1, exits) if row['direction'] == IN else (entries, exits + 1)
+    return deltas
+
+
+def adjust_occupancy(session, deltas):
+    # deltas: {hour: (entries, exits)}. Same transaction as the check-ins and
+    # the same value = value + delta upsert as the dashboard counters.
+    connection = session.connection()
+    table = OccupancyHour.__table__
+    for hour, (entries, exits) in sorted(deltas.items()):
+        result = connection.execute(update(table).where(table.c.hour == hour)
+                                    .values(entries=table.c.entries + entries, exits=table.c.exits + exits))
+        if result.rowcount == 0:
+            # A concurrent batch inserting the same new hour fails on the
+            # primary key; record_check_ins retries, and then this is an UPDATE.
+            connection.execute(insert(table).values(hour=hour, entries=entries, exits=exits))
+
+
+def record_check_ins(device_id, events):
+    """Validate and store one batch from a door device.
+
+    Returns {'accepted', 'duplicates', 'rejected': [{'index', 'event_id', 'reason'}]}.
+    Accepted rows go in with one multi-row INSERT and the hourly occupancy
+    is adjusted in the same transaction.
+    """
+    if not isinstance(device_id, str) or not 0 < len(device_id) <= 50:
+        raise CheckInError('device_id must be a string of at most 50 characters.')
+    if not isinstance(events, list):
+        raise CheckInError('events must be a list.')
+    max_batch = current_app.config.get('CHECKIN_MAX_BATCH', CHECKIN_MAX_BATCH)
+    if len(events) > max_batch:
+        raise CheckInError(f'At most {max_batch} events per batch.')
+
+    rows, rejected = validate_events(device_id, events, active_members())
+    for attempt in range(2):
+        recorded = _already_recorded(device_id, (row['event_id'] for row in rows))
+        new_rows = [row for row in rows if row['event_id'] not in recorded]
+        if not new_rows:
+            break
+        deltas = _hourly(new_rows)
+        try:
+            db.session.execute(insert(CheckIn), new_rows)
+            adjust_occupancy(db.session, deltas)
+            db.session.commit()
+            break
+        except IntegrityError:
+            # A resend of this batch, or another door opening the same hour,
+            # got there first: look again at what is recorded and retry once
+            db.session.rollback()
+            if attempt:
+                raise
+    # Duplicates: repeated within the batch or already stored by an earlier send
+    return {'accepted': len(new_rows), 'duplicates': len(events) - len(new_rows) - len(rejected),
+            'rejected': rejected}
+
+
+def occupancy(day):
+    """Hourly entries, exits and people inside for one day, from the rollups."""
+    start = datetime.combine(day, datetime.min.time())
+    rows = db.session.execute(select(OccupancyHour.hour, OccupancyHour.entries, OccupancyHour.exits)
+                              .where(OccupancyHour.hour >= start, OccupancyHour.hour < start + timedelta(days=1))
+                              .order_by(OccupancyHour.hour)).all()
+    inside, hours = 0, []
+    for hour, entries, exits in rows:
+        # Missed exits would otherwise carry over; nobody is inside below zero
+        inside = max(inside + entries - exits, 0)
+        hours.append({'hour': hour.isoformat(), 'entries': entries, 'exits': exits, 'inside': inside})
+    return hours
+
+
+def rebuild_occupancy(start=None, end=None):
+    # Recount the rollups from check_ins, e.g. after deleting bad device data.
+    # Whole hours only: the rows deleted and the check-ins recounted must
+    # cover the same span, or a partial hour lands next to the row kept.
+    start = hour_of(start) if start is not None else None
+    end = hour_of(end) if end is not None else None
+    criteria = []
+    if start is not None:
+        criteria.append(OccupancyHour.hour >= start)
+    if end is not None:
+        criteria.append(OccupancyHour.hour < end)
+    db.session.execute(OccupancyHour.__table__.delete().where(and_(*criteria)) if criteria
+                       else OccupancyHour.__table__.delete())
+    check_ins = select(CheckIn.occurred_at, CheckIn.direction)
+    if start is not None:
+        check_ins = check_ins.where(CheckIn.occurred_at >= start)
+    if end is not None:
+        check_ins = check_ins.where(CheckIn.occurred_at < end)
+    hourly = _hourly(db.session.execute(check_ins.execution_options(yield_per=10000)).mappings())
+    if hourly:
+        db.session.execute(insert(OccupancyHour), [{'hour': hour, 'entries': entries, 'exits': exits}
+                                                   for hour, (entries, exits) in sorted(hourly.items())])
+    db.session.commit()
+    return len(hourly)
+
+
+attendance_cli = AppGroup('attendance', help='Check-ins and hourly occupancy.')
+
+
+@attendance_cli.command('rebuild-occupancy')
+@click.option('--since', help='ISO date; rebuild only from here on (from the start of its hour).')
+def rebuild_occupancy_command(since):
+    try:
+        start = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        raise click.BadParameter('expected an ISO date or timestamp', param_hint='--since')
+    click.echo(f'{rebuild_occupancy(start)} hourly rollups rebuilt.')
@@ -0,0 +1,390 @@
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+import click
+from flask import current_app, g, has_request_context, request
+from flask.cli import AppGroup
+from sqlalchemy import event, insert, inspect, select
+from sqlalchemy.orm import Session
+from extensions import db
+from models.model import (AuditEvent, Booking, Category, ClassSlot, Package, PackageType, Payment,
+                          User)
+
+
+logger = logging.getLogger(__name__)
+
+AUDITED = {User, Category, PackageType, Package, Booking, Payment, ClassSlot}
+# Never copied into the trail
+REDACTED = {'password_hash'}
+
+AUDIT_BUFFER_SIZE = 10000
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_SECONDS = 1.0
+AUDIT_SEGMENT_BYTES = 64 * 1024 * 1024
+AUDIT_QUERY_LIMIT = 1000
+
+# Session.info key for the events of the current transaction
+PENDING = 'audit_events'
+
+
+def _value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def _columns(instance):
+    return [attr for attr in inspect(instance).mapper.column_attrs if attr.key not in REDACTED]
+
+
+def _context():
+    # Who and where, read from what the request already loaded: asking
+    # current_user here could run a query in the middle of a flush.
+    if not has_request_context():
+        return None, None, None
+    user = getattr(g, '_login_user', None)
+    actor_id = user.id if user is not None and user.is_authenticated else None
+    return actor_id, request.endpoint, request.remote_addr
+
+
+def make_event(action, entity, entity_id, changes):
+    actor_id, endpoint, ip = _context()
+    return {'occurred_at': datetime.utcnow().isoformat(), 'actor_id': actor_id, 'action': action,
+            'entity': entity, 'entity_id': entity_id, 'changes': changes, 'endpoint': endpoint, 'ip': ip}
+
+
+def _row_events(session):
+    events = []
+    for instance in session.new:
+        if type(instance) in AUDITED:
+            changes = {attr.key: _value(getattr(instance, attr.key)) for attr in _columns(instance)}
+            events.append(make_event('insert', instance.__tablename__, instance.id, changes))
+    for instance in session.dirty:
+        if type(instance) not in AUDITED or instance in session.deleted:
+            continue
+        state = inspect(instance)
+        changes = {}
+        for attr in _columns(instance):
+            history = state.attrs[attr.key].history
+            if history.has_changes():
+                old = history.deleted[0] if history.deleted else None
+                new = history.added[0] if history.added else None
+                changes[attr.key] = [_value(old), _value(new)]
+        if changes:
+            events.append(make_event('update', instance.__tablename__, instance.id, changes))
+    for instance in session.deleted:
+        if type(instance) in AUDITED:
+            # The row as it was, so a deleted package or category can be traced
+            state = inspect(instance)
+            changes = {attr.key: _value(state.dict[attr.key]) for attr in _columns(instance)
+                       if attr.key in state.dict}
+            events.append(make_event('delete', instance.__tablename__, instance.id, changes))
+    return events
+
+
+@event.listens_for(Session, 'after_flush')
+def capture_row_changes(session, flush_context):
+    events = _row_events(session)
+    if events:
+        session.info.setdefault(PENDING, []).extend(events)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def capture_bulk_changes(execute_state):
+    # UPDATE/DELETE statements (ledger balances, membership sweeps) skip the
+    # flush, so the statement itself is what gets recorded.
+    if not (execute_state.is_update or execute_state.is_delete):
+        return
+    mapper = execute_state.bind_mapper
+    if mapper is None or mapper.class_ not in AUDITED:
+        return
+    compiled = execute_state.statement.compile()
+    changes = {'statement': str(compiled), 'params': {key: _value(value) for key, value in compiled.params.items()}}
+    if isinstance(execute_state.parameters, list):
+        changes['rows'] = len(execute_state.parameters)
+    action = 'bulk_update' if execute_state.is_update else 'bulk_delete'
+    execute_state.session.info.setdefault(PENDING, []).append(
+        make_event(action, mapper.local_table.name, None, changes))
+
+
+@event.listens_for(Session, 'after_commit')
+def publish_committed_changes(session):
+    events = session.info.pop(PENDING, None)
+    if events:
+        audit_log.record(events)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_rolled_back_changes(session):
+    session.info.pop(PENDING, None)
+
+
+def _matches(event_, entity, entity_id, actor_id):
+    return ((entity is None or event_['entity'] == entity)
+            and (entity_id is None or event_['entity_id'] == entity_id)
+            and (actor_id is None or event_['actor_id'] == actor_id))
+
+
+class TableSink:
+    """Appends batches to the audit_events table over its own connection."""
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def write(self, events):
+        rows = [dict(event_, occurred_at=datetime.fromisoformat(event_['occurred_at']),
+                     changes=json.dumps(event_['changes'])) for event_ in events]
+        with self.engine.begin() as connection:
+            connection.execute(insert(AuditEvent.__table__), rows)
+
+    def query(self, start, end, entity=None, entity_id=None, actor_id=None, limit=AUDIT_QUERY_LIMIT):
+        table = AuditEvent.__table__
+        statement = select(table).where(table.c.occurred_at >= start, table.c.occurred_at < end)
+        if entity is not None:
+            statement = statement.where(table.c.entity == entity)
+        if entity_id is not None:
+            statement = statement.where(table.c.entity_id == entity_id)
+        if actor_id is not None:
+            statement = statement.where(table.c.actor_id == actor_id)
+        statement = statement.order_by(table.c.occurred_at, table.c.id).limit(limit)
+        with self.engine.connect() as connection:
+            rows = connection.execute(statement).mappings().all()
+        return [dict(row, occurred_at=row['occurred_at'].isoformat(),
+                     changes=json.loads(row['changes']) if row['changes'] else None) for row in rows]
+
+
+class NdjsonSink:
+    """Appends batches to NDJSON segment files, one JSON event per line.
+
+    Each process writes its own segments, named after the time of their
+    first event and the pid, and starts a new one after ``max_bytes``, so
+    old segments can be shipped or deleted whole.
+    """
+
+    def __init__(self, directory, max_bytes=AUDIT_SEGMENT_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._path = None
+        self._pid = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment(self, first_event):
+        if self._path is None or self._pid != os.getpid() or os.path.getsize(self._path) >= self.max_bytes:
+            stamp = datetime.fromisoformat(first_event['occurred_at']).strftime('%Y%m%dT%H%M%S%f')
+            self._path = os.path.join(self.directory, f'audit-{stamp}-{os.getpid()}.ndjson')
+            self._pid = os.getpid()
+        return self._path
+
+    def write(self, events):
+        data = ''.join(json.dumps(event_, separators=(',', ':')) + '\n' for event_ in events)
+        with open(self._segment(events[0]), 'a', encoding='utf-8') as segment:
+            segment.write(data)
+
+    def segments(self, start, end):
+        # A segment holds events from the time in its name up to its last write
+        for path in sorted(glob.glob(os.path.join(self.directory, 'audit-*.ndjson'))):
+            first = datetime.strptime(os.path.basename(path).split('-')[1], '%Y%m%dT%H%M%S%f')
+            if first < end and datetime.utcfromtimestamp(os.path.getmtime(path)) >= start:
+                yield path
+
+    def query(self, start, end, entity=None, entity_id=None, actor_id=None, limit=AUDIT_QUERY_LIMIT):
+        start_at, end_at = start.isoformat(), end.isoformat()
+        events = []
+        for path in self.segments(start, end):
+            with open(path, encoding='utf-8') as segment:
+                for line in segment:
+                    event_ = json.loads(line)
+                    if start_at <= event_['occurred_at'] < end_at and _matches(event_, entity, entity_id, actor_id):
+                        events.append(event_)
+        events.sort(key=lambda event_: event_['occurred_at'])
+        return events[:limit]
+
+
+class AuditLog:
+    """Buffers committed change events and writes them from a background thread.
+
+    record() never waits on the sink: events go into a bounded in-memory
+    buffer and a writer thread drains it every ``flush_interval`` seconds,
+    or as soon as ``batch_size`` events are waiting. When the buffer is full
+    new events are dropped and counted rather than slowing the request
+    down. close() (registered with atexit) writes whatever is left.
+    """
+
+    def __init__(self):
+        self.sink = None
+        self.max_buffer = AUDIT_BUFFER_SIZE
+        self.batch_size = AUDIT_BATCH_SIZE
+        self.flush_interval = AUDIT_FLUSH_SECONDS
+        self._reset()
+
+    def _reset(self):
+        self._buffer = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = os.getpid()
+        self._writing = 0
+        self._stopping = False
+        self.recorded = self.written = self.dropped = self.failures = 0
+
+    def configure(self, sink, max_buffer=AUDIT_BUFFER_SIZE, batch_size=AUDIT_BATCH_SIZE,
+                  flush_interval=AUDIT_FLUSH_SECONDS):
+        self.close()
+        self.sink = sink
+        self.max_buffer = max_buffer
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+    def record(self, events):
+        if self.sink is None:
+            return
+        if self._pid != os.getpid():
+            # Forked after the parent recorded: a thread started before
+            # gunicorn forks does not exist in the workers, and the parent's
+            # buffer is the parent's to write.
+            self._reset()
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+            room = max(self.max_buffer - len(self._buffer), 0)
+            if room < len(events):
+                self.dropped += len(events) - room
+                logger.warning('Audit buffer full (%d events); dropped %d', self.max_buffer, len(events) - room)
+                events = events[:room]
+            self._buffer.extend(events)
+            self.recorded += len(events)
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+
+    def _take(self):
+        batch = []
+        while self._buffer and len(batch) < self.batch_size:
+            batch.append(self._buffer.popleft())
+        self._writing += len(batch)
+        return batch
+
+    def _write(self, batch):
+        try:
+            self.sink.write(batch)
+        except Exception:
+            logger.exception('Writing %d audit events failed; retrying', len(batch))
+            with self._condition:
+                self.failures += 1
+                self._writing -= len(batch)
+                # Back to the front, unless newer events have filled the buffer
+                room = max(self.max_buffer - len(self._buffer), 0)
+                self.dropped += max(len(batch) - room, 0)
+                self._buffer.extendleft(reversed(batch[:room]))
+                self._condition.notify_all()
+            return False
+        with self._condition:
+            self._writing -= len(batch)
+            self.written += len(batch)
+            self._condition.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._buffer) >= self.batch_size or self._stopping,
+                                         timeout=self.flush_interval)
+                if self._stopping:
+                    return
+                batch = self._take()
+            if batch and not self._write(batch):
+                time.sleep(self.flush_interval)
+
+    def flush(self, timeout=10):
+        """Wait until everything recorded so far has been written."""
+        if self._thread is None or self._pid != os.getpid():
+            return True
+        with self._condition:
+            self._condition.notify_all()
+            return self._condition.wait_for(lambda: not self._buffer and not self._writing, timeout=timeout)
+
+    def close(self):
+        # Stop the writer and write the rest from the calling thread
+        if self._thread is not None and self._pid == os.getpid():
+            with self._condition:
+                self._stopping = True
+                self._condition.notify_all()
+            self._thread.join(timeout=10)
+            while True:
+                with self._condition:
+                    batch = self._take()
+                if not batch or not self._write(batch):
+                    break
+        self._reset()
+
+    def query(self, start, end, entity=None, entity_id=None, actor_id=None, limit=AUDIT_QUERY_LIMIT):
+        """Events with ``start <= occurred_at < end``, oldest first."""
+        if self.sink is None:
+            return []
+        self.flush()
+        return self.sink.query(start, end, entity, entity_id, actor_id, limit)
+
+    def stats(self):
+        with self._condition:
+            return {'sink': type(self.sink).__name__ if self.sink else None, 'buffered': len(self._buffer),
+                    'max_buffer': self.max_buffer, 'recorded': self.recorded, 'written': self.written,
+                    'dropped': self.dropped, 'failures': self.failures}
+
+
+audit_log = AuditLog()
+atexit.register(audit_log.close)
+
+
+def audit_sink_from_config(app):
+    kind = app.config.get('AUDIT_SINK', 'table')
+    if kind == 'table':
+        with app.app_context():
+            return TableSink(db.engine)
+    if kind == 'ndjson':
+        directory = app.config.get('AUDIT_DIR') or os.path.join(app.instance_path, 'audit')
+        return NdjsonSink(directory, app.config.get('AUDIT_SEGMENT_BYTES', AUDIT_SEGMENT_BYTES))
+    if kind in ('off', '', None):
+        return None
+    raise ValueError(f'Unsupported AUDIT_SINK {kind!r}')
+
+
+def configure_audit(app):
+    audit_log.configure(audit_sink_from_config(app),
+                        max_buffer=app.config.get('AUDIT_BUFFER_SIZE', AUDIT_BUFFER_SIZE),
+                        batch_size=app.config.get('AUDIT_BATCH_SIZE', AUDIT_BATCH_SIZE),
+                        flush_interval=app.config.get('AUDIT_FLUSH_SECONDS', AUDIT_FLUSH_SECONDS))
+
+
+def parse_timestamp(value, default=None):
+    try:
+        return datetime.fromisoformat(value) if value else default
+    except ValueError:
+        return None
+
+
+audit_cli = AppGroup('audit', help='Query the audit trail.')
+
+
+@audit_cli.command('show')
+@click.option('--since', help='ISO date or timestamp, inclusive (default: 24 hours ago).')
+@click.option('--until', help='ISO date or timestamp, exclusive (default: now).')
+@click.option('--entity', help='Table name, e.g. packages.')
+@click.option('--entity-id', type=int)
+@click.option('--actor', 'actor_id', type=int, help='User id that made the change.')
+@click.option('--limit', default=AUDIT_QUERY_LIMIT, show_default=True)
+def show_command(since, until, entity, entity_id, actor_id, limit):
+    end = parse_timestamp(until, datetime.utcnow())
+    start = parse_timestamp(since, end - timedelta(days=1) if end else None)
+    if start is None or end is None:
+        raise click.BadParameter('--since and --until must be ISO dates or timestamps.')
+    for event_ in audit_log.query(start, end, entity, entity_id, actor_id, limit):
+        click.echo(json.dumps(event_, separators=(',', ':')))
+    if current_app.config.get('AUDIT_SINK', 'table') == 'off':
+        click.echo('Auditing is off (AUDIT_SINK=off).', err=True)
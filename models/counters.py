@@ -0,0 +1,163 @@
+from collections import Counter
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, func, insert, inspect, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from extensions import db
+from models.model import Booking, Package, Category, PackageType, DashboardCounter
+from models.reference import reference_cache, invalidate_reference_data, DASHBOARD
+from models.archive import archived_counts
+
+
+# Row counts kept in dashboard_counters, keyed by counter name.
+COUNTED_MODELS = {
+    Booking: 'bookings',
+    Package: 'packages',
+    Category: 'categories',
+    PackageType: 'package_types',
+}
+
+counters_cli = AppGroup('counters', help='Maintain the precomputed dashboard counters.')
+
+
+def status_counter(status):
+    return f'bookings:{status}'
+
+
+def _row_deltas(session):
+    deltas = Counter()
+    for instance in session.new:
+        name = COUNTED_MODELS.get(type(instance))
+        if name:
+            deltas[name] += 1
+            if isinstance(instance, Booking):
+                deltas[status_counter(instance.status)] += 1
+    for instance in session.deleted:
+        name = COUNTED_MODELS.get(type(instance))
+        if name:
+            deltas[name] -= 1
+            if isinstance(instance, Booking):
+                history = inspect(instance).attrs.status.history
+                old_status = history.deleted[0] if history.deleted else instance.status
+                deltas[status_counter(old_status)] -= 1
+    for instance in session.dirty:
+        if isinstance(instance, Booking) and instance not in session.deleted:
+            history = inspect(instance).attrs.status.history
+            if history.deleted and history.added:
+                deltas[status_counter(history.deleted[0])] -= 1
+                deltas[status_counter(history.added[0])] += 1
+    return {name: delta for name, delta in deltas.items() if delta}
+
+
+def _current_count(connection, name):
+    if name.startswith('bookings:'):
+        status = name.split(':', 1)[1]
+        return connection.scalar(select(func.count()).select_from(Booking).where(Booking.status == status))
+    model = next(model for model, counter in COUNTED_MODELS.items() if counter == name)
+    return connection.scalar(select(func.count()).select_from(model))
+
+
+@event.listens_for(Booking.status, 'set', active_history=True)
+def _load_previous_status(target, value, oldvalue, initiator):
+    # Registered only for active_history: it makes SQLAlchemy load the old
+    # status before overwriting it, even when the booking was expired by a
+    # commit, so the flush below can move one count between statuses.
+    return value
+
+
+@event.listens_for(Session, 'after_flush')
+def apply_counter_deltas(session, flush_context):
+    deltas = _row_deltas(session)
+    if deltas:
+        adjust_counters(session, deltas)
+
+
+def adjust_counters(session, deltas):
+    # Runs inside the caller's transaction, so the counters commit or roll back
+    # together with the rows they count. value = value + delta is atomic.
+    # Bulk UPDATEs that bypass the flush call this directly.
+    session.info['dashboard_changed'] = True
+    connection = session.connection()
+    counters = DashboardCounter.__table__
+    for name, delta in sorted(deltas.items()):
+        increment = update(counters).where(counters.c.name == name).values(value=counters.c.value + delta)
+        if connection.execute(increment).rowcount:
+            continue
+        # First time this counter is seen: seed it from the table, which
+        # already includes the rows just flushed. If a concurrent transaction
+        # seeds it first, the insert fails on the key and ours is an increment.
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(counters).values(name=name, value=_current_count(connection, name)))
+        except IntegrityError:
+            connection.execute(increment)
+
+
+@event.listens_for(Session, 'after_commit')
+def invalidate_cached_totals(session):
+    if session.info.pop('dashboard_changed', False):
+        invalidate_reference_data(DASHBOARD)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_cached_totals_flag(session):
+    session.info.pop('dashboard_changed', None)
+
+
+def compute_counts():
+    counts = {name: db.session.scalar(select(func.count()).select_from(model))
+              for model, name in COUNTED_MODELS.items()}
+    for status, count in db.session.execute(
+            select(Booking.status, func.count()).group_by(Booking.status)):
+        counts[status_counter(status)] = count
+    # Archiving moves bookings out of the table, not out of the totals
+    for status, count in archived_counts().items():
+        counts['bookings'] += count
+        counts[status_counter(status)] = counts.get(status_counter(status), 0) + count
+    return counts
+
+
+def rebuild_counters():
+    # Recount everything and overwrite the stored values. Returns the counters
+    # whose stored value had drifted, as {name: (stored, actual)}.
+    actual = compute_counts()
+    stored = {counter.name: counter for counter in DashboardCounter.query.all()}
+    drift = {}
+    for name, value in actual.items():
+        counter = stored.pop(name, None)
+        if counter is None:
+            db.session.add(DashboardCounter(name=name, value=value))
+            drift[name] = (None, value)
+        elif counter.value != value:
+            drift[name] = (counter.value, value)
+            counter.value = value
+    for name, counter in stored.items():
+        # Statuses that no longer occur on any booking
+        if counter.value:
+            drift[name] = (counter.value, 0)
+        counter.value = 0
+    db.session.commit()
+    invalidate_reference_data(DASHBOARD)
+    return drift
+
+
+def _load_totals():
+    totals = dict(db.session.execute(select(DashboardCounter.name, DashboardCounter.value)).all())
+    if not all(name in totals for name in COUNTED_MODELS.values()):
+        rebuild_counters()
+        totals = dict(db.session.execute(select(DashboardCounter.name, DashboardCounter.value)).all())
+    return totals
+
+
+def dashboard_totals():
+    return reference_cache.get_or_load((DASHBOARD, 'totals'), _load_totals, ttl=60)
+
+
+@counters_cli.command('rebuild')
+def rebuild_command():
+    """Recount every dashboard counter and report any drift."""
+    drift = rebuild_counters()
+    for name, (stored, actual) in sorted(drift.items()):
+        click.echo(f'{name}: {stored} -> {actual}')
+    click.echo(f'{len(drift)} counter(s) corrected.' if drift else 'All counters were accurate.')
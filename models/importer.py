@@ -0,0 +1,295 @@
+import csv
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, insert, select
+from extensions import db
+from models.model import User, Package, Booking
+from models.counters import rebuild_counters
+from models.memberships import membership_expiry, package_durations
+from models.search import index_where
+from services.hashing import hasher
+
+
+IMPORT_BATCH_SIZE = 1000
+BOOKING_STATUSES = ('confirmed', 'pending', 'cancelled')
+_EMAIL = re.compile(r'^[^@\s]+@[^@\s]+\.[^@\s]+$')
+
+import_cli = AppGroup('import', help='Bulk-load members and bookings from CSV or NDJSON.')
+
+
+class ImportResult:
+
+    def __init__(self, kind, resumed_from=0):
+        self.kind = kind
+        self.resumed_from = resumed_from
+        self.last_line = resumed_from
+        self.inserted = 0
+        self.rejected = []
+        self.started = time.perf_counter()
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        processed = self.inserted + len(self.rejected)
+        return processed / self.seconds if self.seconds else 0.0
+
+    def summary(self):
+        return (f'{self.kind}: {self.inserted} inserted, {len(self.rejected)} rejected '
+                f'in {self.seconds:.1f}s ({self.rows_per_second:.0f} rows/s)')
+
+
+def read_records(stream, fmt):
+    # Yields (line number, dict) without reading the whole file into memory
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            yield reader.line_num, {key.strip(): (value or '').strip() for key, value in record.items() if key}
+    elif fmt == 'ndjson':
+        for line_no, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                # Valid JSON that is not an object ('1', '[]') is as unreadable as a broken line
+                yield line_no, record if isinstance(record, dict) else None
+    else:
+        raise ValueError(f'Unsupported import format {fmt!r}')
+
+
+def _chunks(records, size):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _prepare_users(chunk, result):
+    emails = {str(record.get('email', '')).strip().lower() for _, record in chunk if record}
+    usernames = {str(record.get('username', '')).strip() for _, record in chunk if record}
+    # One round trip per chunk to find rows that already exist. Stored emails
+    # may be mixed case, so both sides are compared lowercased.
+    taken_emails = {email.lower() for email in db.session.scalars(
+        select(User.email).where(func.lower(User.email).in_(emails)))}
+    taken_usernames = set(db.session.scalars(select(User.username).where(User.username.in_(usernames))))
+
+    rows, passwords = [], []
+    for line_no, record in chunk:
+        if not record:
+            result.rejected.append((line_no, 'unreadable row'))
+            continue
+        username = str(record.get('username', '')).strip()
+        email = str(record.get('email', '')).strip().lower()
+        password = str(record.get('password', ''))
+        role = str(record.get('role') or 'registered')
+        if not username or not email or not password:
+            reason = 'username, email and password are required'
+        elif not _EMAIL.match(email):
+            reason = f'invalid email {email!r}'
+        elif email in taken_emails:
+            reason = f'email {email!r} already exists'
+        elif username in taken_usernames:
+            reason = f'username {username!r} already exists'
+        elif role not in ('registered', 'admin'):
+            reason = f'unknown role {role!r}'
+        else:
+            taken_emails.add(email)
+            taken_usernames.add(username)
+            rows.append({'username': username, 'email': email, 'role': role, 'created_at': datetime.utcnow()})
+            passwords.append(password)
+            continue
+        result.rejected.append((line_no, reason))
+
+    for row, password_hash in zip(rows, hasher.hash_many(passwords)):
+        row['password_hash'] = password_hash
+    return rows
+
+
+def _prepare_bookings(chunk, result, package_prices, durations):
+    emails = {str(record.get('email', '')).strip().lower() for _, record in chunk if record and record.get('email')}
+    user_ids = {email.lower(): user_id for email, user_id in db.session.execute(
+        select(User.email, User.id).where(func.lower(User.email).in_(emails)))}
+
+    rows = []
+    for line_no, record in chunk:
+        if not record:
+            result.rejected.append((line_no, 'unreadable row'))
+            continue
+        user_id = user_ids.get(str(record.get('email', '')).strip().lower())
+        status = str(record.get('status') or 'confirmed')
+        try:
+            package_id = int(record.get('package_id'))
+            booking_date = (datetime.fromisoformat(str(record['booking_date']))
+                            if record.get('booking_date') else datetime.utcnow())
+        except (TypeError, ValueError):
+            result.rejected.append((line_no, 'package_id and booking_date must be an integer and an ISO date'))
+            continue
+        if user_id is None:
+            reason = f"no member with email {record.get('email')!r}"
+        elif package_id not in package_prices:
+            reason = f'unknown package_id {package_id}'
+        elif status not in BOOKING_STATUSES:
+            reason = f'unknown status {status!r}'
+        else:
+            rows.append({'user_id': user_id, 'package_id': package_id, 'booking_date': booking_date,
+                         'status': status, 'total_amount': package_prices[package_id],
+                         'expires_at': membership_expiry(booking_date, package_id, durations)})
+            continue
+        result.rejected.append((line_no, reason))
+    return rows
+
+
+def _load_checkpoint(path):
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return None
+
+
+def _save_checkpoint(path, result):
+    if not path:
+        return
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'kind': result.kind, 'last_line': result.last_line, 'inserted': result.inserted,
+                   'rejected': len(result.rejected)}, f)
+    os.replace(tmp, path)
+
+
+def import_records(kind, stream, fmt='csv', batch_size=IMPORT_BATCH_SIZE, checkpoint=None, progress=None):
+    """Validate and insert rows in batches, one transaction per batch.
+
+    When ``checkpoint`` names a file, the last committed line is recorded
+    there after every batch and rows up to it are skipped on the next run,
+    so a failed import can be restarted without duplicating rows.
+    """
+    if kind not in ('users', 'bookings'):
+        raise ValueError(f'Unknown import kind {kind!r}')
+    state = _load_checkpoint(checkpoint)
+    resume_after = state['last_line'] if state and state.get('kind') == kind else 0
+    result = ImportResult(kind, resumed_from=resume_after)
+    model = User if kind == 'users' else Booking
+    package_prices = dict(db.session.execute(select(Package.id, Package.price)).all()) if kind == 'bookings' else None
+    durations = package_durations() if kind == 'bookings' else None
+
+    records = ((line_no, record) for line_no, record in read_records(stream, fmt) if line_no > resume_after)
+    try:
+        for chunk in _chunks(records, batch_size):
+            if kind == 'users':
+                rows = _prepare_users(chunk, result)
+            else:
+                rows = _prepare_bookings(chunk, result, package_prices, durations)
+            try:
+                if rows:
+                    # A list of parameter dicts is sent as a single executemany
+                    db.session.execute(insert(model), rows)
+                    if kind == 'users':
+                        # Core inserts skip the session events that maintain the search index
+                        index_where('members', User.email.in_([row['email'] for row in rows]))
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                _save_checkpoint(checkpoint, result)
+                raise
+            result.inserted += len(rows)
+            result.last_line = chunk[-1][0]
+            _save_checkpoint(checkpoint, result)
+            if progress:
+                progress(result)
+    finally:
+        if kind == 'bookings' and result.inserted:
+            # Core inserts bypass the session events that keep dashboard
+            # counters current; batches committed before a failure count too
+            rebuild_counters()
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    return result
+
+
+def _run_import(kind, path, fmt, batch_size, resume, errors):
+    fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+    checkpoint = path + '.checkpoint'
+    if not resume and os.path.exists(checkpoint):
+        raise click.ClickException(f'{checkpoint} exists from an interrupted run; pass --resume or delete it.')
+
+    def progress(result):
+        click.echo(f'  line {result.last_line}: {result.inserted} inserted, '
+                   f'{len(result.rejected)} rejected, {result.rows_per_second:.0f} rows/s')
+
+    with open(path, newline='', encoding='utf-8') as stream:
+        try:
+            result = import_records(kind, stream, fmt, batch_size, checkpoint, progress)
+        except Exception as error:
+            raise click.ClickException(f'Import failed ({error}); rerun with --resume to continue '
+                                       f'from the checkpoint in {checkpoint}.')
+    click.echo(result.summary())
+    if result.rejected:
+        if errors:
+            with open(errors, 'w', newline='') as f:
+                csv.writer(f).writerows([('line', 'reason')] + result.rejected)
+            click.echo(f'Rejected rows written to {errors}')
+        else:
+            for line_no, reason in result.rejected[:20]:
+                click.echo(f'  line {line_no}: {reason}')
+
+
+def _import_options(command):
+    command = click.option('--errors', type=click.Path(dir_okay=False), help='Write rejected rows to this CSV.')(command)
+    command = click.option('--resume', is_flag=True, help='Continue after the last committed batch.')(command)
+    command = click.option('--batch-size', default=IMPORT_BATCH_SIZE, show_default=True)(command)
+    command = click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']))(command)
+    return click.argument('path', type=click.Path(exists=True, dir_okay=False))(command)
+
+
+@import_cli.command('users')
+@_import_options
+def import_users_command(path, fmt, batch_size, resume, errors):
+    """Import members (username, email, password[, role])."""
+    _run_import('users', path, fmt, batch_size, resume, errors)
+
+
+@import_cli.command('bookings')
+@_import_options
+def import_bookings_command(path, fmt, batch_size, resume, errors):
+    """Import bookings (email, package_id[, booking_date, status])."""
+    _run_import('bookings', path, fmt, batch_size, resume, errors)
+
+
+def import_directory():
+    directory = current_app.config.get('IMPORTS_DIR') or os.path.join(current_app.instance_path, 'imports')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def save_upload(upload):
+    """Store an uploaded file for the import job; returns (path, format)."""
+    fmt = 'ndjson' if (upload.filename or '').endswith(('.ndjson', '.jsonl')) else 'csv'
+    path = os.path.join(import_directory(), f'{uuid.uuid4().hex}.{fmt}')
+    upload.save(path)
+    return path, fmt
+
+
+def import_file(kind, path, fmt, batch_size=IMPORT_BATCH_SIZE):
+    # Run by the import_upload job. A retried job resumes from the checkpoint
+    # left by the failed attempt; rejected rows go to PATH.errors.csv.
+    with open(path, newline='', encoding='utf-8') as stream:
+        result = import_records(kind, stream, fmt, batch_size, checkpoint=path + '.checkpoint')
+    if result.rejected:
+        with open(path + '.errors.csv', 'w', newline='') as f:
+            csv.writer(f).writerows([('line', 'reason')] + result.rejected)
+    os.remove(path)
+    return result
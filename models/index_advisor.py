@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.sql import visitors
+from sqlalchemy.sql.expression import ColumnClause
+from extensions import db
+from models.model import Booking, Payment, User, Inquiry, Package, Category, PackageType
+from models.queries import booking_history_query, encode_cursor
+from models.listing import booking_listing, package_listing
+from models.reports import report_statement, grouped_statement, per_day_statement
+
+
+# Representative values; only the shape of each query matters to the planner.
+SAMPLE_ID = 1
+SAMPLE_DATE = datetime(2024, 1, 1)
+
+
+def query_shapes():
+    sample_booking = Booking(id=SAMPLE_ID, booking_date=SAMPLE_DATE)
+    report_start, report_end = SAMPLE_DATE.date(), SAMPLE_DATE.date() + timedelta(days=365)
+    yield 'login: user by email', User.query.filter_by(email='member@example.com').limit(1)
+    yield 'booking history: first page', booking_history_query(SAMPLE_ID).limit(21)
+    yield 'booking history: next page', booking_history_query(
+        SAMPLE_ID, after=encode_cursor(sample_booking)).limit(21)
+    yield 'booking history: payments', Payment.query.filter(Payment.booking_id.in_([1, 2, 3]))
+    yield 'admin bookings: newest', booking_listing.query('booking_date', 'desc', {}).limit(26)
+    yield 'admin bookings: by status', booking_listing.query(
+        'booking_date', 'desc', {'status': 'pending'}).limit(26)
+    yield 'admin bookings: by category', booking_listing.query(
+        'booking_date', 'desc', {'category_id': SAMPLE_ID}).limit(26)
+    yield 'admin bookings: date range', booking_listing.query(
+        'booking_date', 'asc', {'booked_from': SAMPLE_DATE,
+                                'booked_to': SAMPLE_DATE + timedelta(days=30)}).limit(26)
+    yield 'admin packages: by category', package_listing.query(
+        'name', 'asc', {'category_id': SAMPLE_ID}).limit(26)
+    yield 'reports: bookings in range', report_statement(report_start, report_end)
+    yield 'reports: per package', grouped_statement(Package.name, report_start, report_end)
+    yield 'reports: per category', grouped_statement(Category.name, report_start, report_end)
+    yield 'reports: per package type', grouped_statement(PackageType.name, report_start, report_end)
+    yield 'reports: per day', per_day_statement(report_start, report_end)
+    yield 'inquiries: newest', Inquiry.query.order_by(Inquiry.created_at.desc()).limit(50)
+
+
+def explain_sqlite(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+    return [row[-1] for row in rows]
+
+
+def filtered_tables(statement):
+    # Tables (or aliases) the WHERE clause tests a column of, including from
+    # inside a correlated subquery such as the EXISTS of relationship.has()
+    if statement.whereclause is None:
+        return set()
+    return {element.table.name for element in visitors.iterate(statement.whereclause)
+            if isinstance(element, ColumnClause) and getattr(element, 'table', None) is not None}
+
+
+def is_scan(step, filtered=()):
+    # SQLite reports "SEARCH t USING INDEX ..." for seeks and "SCAN t" for a full
+    # pass over the table. "SCAN t USING INDEX ..." walks an index in order and
+    # stops at the LIMIT, but only when every row it reads is kept: with a
+    # filter the index cannot seek on it may read the whole table to fill the
+    # page. A temp B-tree for ORDER BY means every matching row is sorted
+    # before the LIMIT applies, which on a large table is as bad as the scan
+    # that feeds it; one for GROUP BY or DISTINCT only groups the rows the
+    # seek before it found, which an aggregate has to read anyway.
+    if step.startswith('SCAN'):
+        if 'SUBQUERY' in step or 'CONSTANT ROW' in step:
+            return False
+        return 'INDEX' not in step or step.split()[1] in filtered
+    return step.startswith('USE TEMP B-TREE') and 'ORDER BY' in step
+
+
+def advise(engine):
+    report = []
+    with engine.connect() as connection:
+        if connection.dialect.name != 'sqlite':
+            raise click.ClickException(
+                f'Index advisor only understands SQLite query plans, not {connection.dialect.name}. '
+                'Run it with --database sqlite:///advisor.db to check the shapes locally.')
+        for name, query in query_shapes():
+            statement = getattr(query, 'statement', query)  # ORM queries and select()s
+            plan = explain_sqlite(connection, statement)
+            filtered = filtered_tables(statement)
+            report.append((name, [step for step in plan if is_scan(step, filtered)], plan))
+    return report
+
+
+@click.command('index-advisor')
+@click.option('--database', default=None,
+              help='Database URL to replay against (defaults to the app database).')
+@click.option('--verbose', is_flag=True, help='Print the full plan for every query.')
+@with_appcontext
+def index_advisor_command(database, verbose):
+    """Replay the app's query shapes and report the ones that scan a table."""
+    engine = create_engine(database) if database else db.engine
+    if not inspect(engine).has_table(Booking.__tablename__):
+        db.metadata.create_all(engine)
+
+    scanning = 0
+    for name, scans, plan in advise(engine):
+        status = 'SCAN' if scans else 'ok'
+        scanning += bool(scans)
+        click.echo(f'[{status:>4}] {name}')
+        for step in plan if verbose else scans:
+            click.echo(f'         {step}')
+    click.echo(f'{scanning} of {len(list(query_shapes()))} query shapes scan a table.')
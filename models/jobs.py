@@ -0,0 +1,290 @@
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select, update
+from extensions import db
+from models.model import Job
+
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+DEAD = 'dead'
+
+DEFAULT_PRIORITY = 100
+HIGH_PRIORITY = 10
+LOW_PRIORITY = 200
+
+# Handlers by job name, filled in by @job when these modules are imported
+registry = {}
+HANDLER_MODULES = ('models.tasks',)
+
+jobs_cli = AppGroup('jobs', help='Run and inspect the background job queue.')
+
+
+class JobDefinition:
+
+    def __init__(self, name, fn, max_attempts, priority):
+        self.name = name
+        self.fn = fn
+        self.max_attempts = max_attempts
+        self.priority = priority
+
+
+def job(name, max_attempts=5, priority=DEFAULT_PRIORITY):
+    def decorator(fn):
+        registry[name] = JobDefinition(name, fn, max_attempts, priority)
+        return fn
+    return decorator
+
+
+def load_handlers():
+    # Deferred so importing the queue does not drag in every task's dependencies
+    for module in HANDLER_MODULES:
+        importlib.import_module(module)
+
+
+def enqueue(name, payload=None, priority=None, delay=0, max_attempts=None):
+    """Add a job to the current session.
+
+    Nothing is committed here: the job is written in the caller's
+    transaction, so it exists exactly when the change that caused it does.
+    """
+    if name not in registry:
+        load_handlers()
+    definition = registry.get(name)
+    if definition is None:
+        raise KeyError(f'No job named {name!r} is registered')
+    queued = Job(name=name, payload=json.dumps(payload or {}),
+                 priority=definition.priority if priority is None else priority,
+                 max_attempts=max_attempts or definition.max_attempts,
+                 run_at=datetime.utcnow() + timedelta(seconds=delay), status=QUEUED)
+    db.session.add(queued)
+    return queued
+
+
+def backoff_seconds(attempts):
+    # 2s, 4s, 8s ... capped at ten minutes
+    return min(2 ** attempts, 600)
+
+
+def claim_jobs(worker_id, limit=10, now=None):
+    now = now or datetime.utcnow()
+    candidates = db.session.scalars(
+        select(Job.id)
+        .where(Job.status == QUEUED, Job.run_at <= now)
+        .order_by(Job.priority, Job.run_at, Job.id)
+        .limit(limit)).all()
+    claimed = []
+    for job_id in candidates:
+        # Conditional update: if another worker got there first this matches nothing
+        result = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == QUEUED)
+            .values(status=RUNNING, locked_by=worker_id, locked_at=now, started_at=now,
+                    attempts=Job.attempts + 1)
+            .execution_options(synchronize_session=False))
+        if result.rowcount == 1:
+            claimed.append(job_id)
+    db.session.commit()
+    return claimed
+
+
+@contextmanager
+def heartbeat(job_id, worker_id, attempts, interval):
+    """Refresh the job's lock while it runs, so requeue_stale only takes back
+    jobs whose worker has really gone, however long they take."""
+    engine = db.engine
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(interval):
+            try:
+                with engine.begin() as connection:
+                    connection.execute(update(Job).where(Job.id == job_id, Job.locked_by == worker_id,
+                                                         Job.attempts == attempts)
+                                       .values(locked_at=datetime.utcnow()))
+            except Exception:
+                logger.exception('Heartbeat for job %s failed', job_id)
+
+    thread = threading.Thread(target=beat, name=f'job-heartbeat-{job_id}', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def _release(job_id, worker_id, attempts, **values):
+    # Only the claim this worker holds is finished or retried; a job that was
+    # taken back as stale and claimed again belongs to its new run.
+    result = db.session.execute(
+        update(Job)
+        .where(Job.id == job_id, Job.status == RUNNING, Job.locked_by == worker_id, Job.attempts == attempts)
+        .values(locked_by=None, locked_at=None, **values)
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    if result.rowcount == 0:
+        logger.warning('Job %s was taken back from %s before it finished; its result is not recorded.',
+                       job_id, worker_id)
+    return result.rowcount == 1
+
+
+def run_job(job_id, worker_id=None, heartbeat_seconds=None):
+    queued = db.session.get(Job, job_id)
+    worker_id = worker_id or queued.locked_by
+    attempts, max_attempts, name = queued.attempts, queued.max_attempts, queued.name
+    if heartbeat_seconds is None:
+        heartbeat_seconds = current_app.config.get('JOB_STALE_SECONDS', 300) / 3
+    definition = registry.get(name)
+    try:
+        if definition is None:
+            raise LookupError(f'No handler registered for {name!r}')
+        with heartbeat(job_id, worker_id, attempts, heartbeat_seconds):
+            definition.fn(**json.loads(queued.payload))
+    except Exception as error:
+        db.session.rollback()
+        last_error = ''.join(traceback.format_exception_only(type(error), error)).strip()
+        if attempts >= max_attempts:
+            # Dead-lettered: kept for inspection, retried only by hand
+            if _release(job_id, worker_id, attempts, status=DEAD, last_error=last_error,
+                        finished_at=datetime.utcnow()):
+                logger.error('Job %s (%s) failed permanently after %d attempts: %s',
+                             job_id, name, attempts, last_error)
+        else:
+            run_at = datetime.utcnow() + timedelta(seconds=backoff_seconds(attempts))
+            if _release(job_id, worker_id, attempts, status=QUEUED, last_error=last_error, run_at=run_at):
+                logger.warning('Job %s (%s) failed, retry %d/%d: %s', job_id, name,
+                               attempts, max_attempts, last_error)
+        return False
+    return _release(job_id, worker_id, attempts, status=DONE, finished_at=datetime.utcnow())
+
+
+def requeue_stale(timeout_seconds=300):
+    # Jobs whose worker died mid-run go back on the queue; a live worker
+    # keeps locked_at fresh with its heartbeat
+    cutoff = datetime.utcnow() - timedelta(seconds=timeout_seconds)
+    result = db.session.execute(
+        update(Job)
+        .where(Job.status == RUNNING, Job.locked_at < cutoff)
+        .values(status=QUEUED, locked_by=None, locked_at=None, last_error='worker lost')
+        .execution_options(synchronize_session=False))
+    db.session.commit()
+    return result.rowcount
+
+
+def work(worker_id=None, batch_size=10, poll_interval=1.0, burst=False, stop=None):
+    """Process jobs until ``stop`` is set (or the queue is empty, with ``burst``)."""
+    load_handlers()
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    stale_timeout = current_app.config.get('JOB_STALE_SECONDS', 300)
+    processed = 0
+    last_stale_check = 0.0
+    while not (stop and stop.is_set()):
+        if time.monotonic() - last_stale_check > stale_timeout / 2:
+            requeue_stale(stale_timeout)
+            last_stale_check = time.monotonic()
+        claimed = claim_jobs(worker_id, batch_size)
+        for job_id in claimed:
+            run_job(job_id, worker_id, stale_timeout / 3)
+            processed += 1
+        if not claimed:
+            if burst:
+                break
+            time.sleep(poll_interval)
+    return processed
+
+
+def queue_stats(window=timedelta(hours=1)):
+    now = datetime.utcnow()
+    depth = dict(db.session.execute(select(Job.status, func.count()).group_by(Job.status)).all())
+    oldest = db.session.scalar(select(func.min(Job.run_at)).where(Job.status == QUEUED, Job.run_at <= now))
+    finished = db.session.execute(
+        select(Job.name, Job.created_at, Job.started_at, Job.finished_at)
+        .where(Job.status == DONE, Job.finished_at >= now - window)).all()
+
+    per_job = {}
+    for name, created_at, started_at, finished_at in finished:
+        stats = per_job.setdefault(name, {'completed': 0, 'wait_ms': 0.0, 'run_ms': 0.0})
+        stats['completed'] += 1
+        stats['wait_ms'] += (started_at - created_at).total_seconds() * 1000
+        stats['run_ms'] += (finished_at - started_at).total_seconds() * 1000
+    for stats in per_job.values():
+        stats['avg_wait_ms'] = round(stats.pop('wait_ms') / stats['completed'], 1)
+        stats['avg_run_ms'] = round(stats.pop('run_ms') / stats['completed'], 1)
+
+    return {
+        'depth': {status: depth.get(status, 0) for status in (QUEUED, RUNNING, DONE, DEAD)},
+        'oldest_ready_age_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0,
+        'last_hour': per_job,
+    }
+
+
+def _worker_process(batch_size, poll_interval, burst):
+    from app import create_app
+
+    with create_app().app_context():
+        # Connections inherited through fork belong to the parent
+        db.engine.dispose(close=False)
+        work(batch_size=batch_size, poll_interval=poll_interval, burst=burst)
+
+
+@jobs_cli.command('work')
+@click.option('--processes', default=1, show_default=True, help='Worker processes to start.')
+@click.option('--batch-size', default=10, show_default=True, help='Jobs claimed per poll.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to sleep when idle.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+def work_command(processes, batch_size, poll_interval, burst):
+    """Run job workers."""
+    if processes == 1:
+        stop = threading.Event()
+        try:
+            count = work(batch_size=batch_size, poll_interval=poll_interval, burst=burst, stop=stop)
+        except KeyboardInterrupt:
+            stop.set()
+            return
+        click.echo(f'Processed {count} job(s).')
+        return
+    children = [multiprocessing.Process(target=_worker_process, args=(batch_size, poll_interval, burst))
+                for _ in range(processes)]
+    for child in children:
+        child.start()
+    try:
+        for child in children:
+            child.join()
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+
+
+@jobs_cli.command('stats')
+def stats_command():
+    """Show queue depth and job latency."""
+    click.echo(json.dumps(queue_stats(), indent=2))
+
+
+@jobs_cli.command('retry-dead')
+@click.option('--name', default=None, help='Only jobs with this name.')
+def retry_dead_command(name):
+    """Put dead-lettered jobs back on the queue."""
+    query = update(Job).where(Job.status == DEAD)
+    if name:
+        query = query.where(Job.name == name)
+    result = db.session.execute(query.values(status=QUEUED, attempts=0, run_at=datetime.utcnow(),
+                                             finished_at=None).execution_options(synchronize_session=False))
+    db.session.commit()
+    click.echo(f'Requeued {result.rowcount} job(s).')
@@ -0,0 +1,93 @@
+import math
+from datetime import datetime
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import contains_eager, joinedload
+from extensions import db
+from models.model import Booking, Payment, User
+
+
+SEARCH_LIMIT = 20
+
+
+class PaymentError(Exception):
+    pass
+
+
+def _existing_payment(idempotency_key):
+    return db.session.scalar(select(Payment).where(Payment.idempotency_key == idempotency_key))
+
+
+def _replayed(existing, booking_id):
+    # A key is issued for one payment form; reused on another booking it is a
+    # client bug, not a retry, and must not report that booking as paid.
+    if existing.booking_id != booking_id:
+        raise PaymentError('This payment key was already used for another booking.')
+    return existing
+
+
+def record_payment(booking_id, amount, payment_type, idempotency_key=None):
+    """Add a payment to a booking and return ``(payment, created)``.
+
+    The balance is raised with ``amount_paid = amount_paid + :amount`` in
+    the database, never read-modify-written in Python, so concurrent
+    cashiers cannot lose each other's updates; that UPDATE also holds the
+    booking row lock until commit, which serialises the idempotency check.
+    A repeated ``idempotency_key`` returns the original payment with
+    ``created`` False and charges nothing.
+    """
+    amount = float(amount)
+    if not math.isfinite(amount) or amount <= 0:
+        raise PaymentError('Payment amount must be positive.')
+
+    result = db.session.execute(
+        update(Booking)
+        .where(Booking.id == booking_id)
+        .values(amount_paid=Booking.amount_paid + amount)
+        .execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        db.session.rollback()
+        raise PaymentError(f'Booking #{booking_id} does not exist.')
+
+    if idempotency_key:
+        existing = _existing_payment(idempotency_key)
+        if existing is not None:
+            db.session.rollback()
+            return _replayed(_existing_payment(idempotency_key), booking_id), False
+
+    payment = Payment(booking_id=booking_id, amount=amount, payment_type=payment_type,
+                      payment_status='completed', payment_date=datetime.utcnow(),
+                      idempotency_key=idempotency_key or None)
+    db.session.add(payment)
+    try:
+        db.session.flush()
+    except IntegrityError:
+        # The same key committed on another booking/terminal between our check and insert
+        db.session.rollback()
+        existing = _existing_payment(idempotency_key) if idempotency_key else None
+        if existing is None:
+            raise
+        return _replayed(existing, booking_id), False
+
+    # Re-read the balance we just updated (still under our row lock)
+    booking = db.session.get(Booking, booking_id, populate_existing=True)
+    if booking.amount_paid >= booking.total_amount and booking.status != 'paid':
+        booking.status = 'paid'
+    db.session.commit()
+    return payment, True
+
+
+def search_bookings(term, limit=SEARCH_LIMIT):
+    # "#123" or "123" finds a booking by id; anything else is a prefix match
+    # on the member's username or email, which the unique indexes serve.
+    term = (term or '').strip().lstrip('#')
+    if not term:
+        return []
+    query = Booking.query.join(Booking.user).options(contains_eager(Booking.user), joinedload(Booking.package))
+    if term.isdigit():
+        query = query.filter(Booking.id == int(term))
+    else:
+        pattern = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        query = query.filter(or_(User.username.like(pattern, escape='\\'),
+                                 User.email.like(pattern, escape='\\')))
+    return query.order_by(Booking.booking_date.desc(), Booking.id.desc()).limit(limit).all()
@@ -0,0 +1,171 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from sqlalchemy import select
+from models.model import Booking, Package, Category
+from models.queries import loader_options, seek_filter
+
+
+def _dump_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+def _load_value(column, value):
+    if value is None:
+        return None
+    python_type = column.type.python_type
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    if python_type is date:
+        return date.fromisoformat(value)
+    return python_type(value)
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ListingPage:
+    def __init__(self, items, next_cursor, sort, direction, filters):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.sort = sort
+        self.direction = direction
+        self.filters = filters
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+class Listing:
+    """Keyset-paginated, sortable, filterable listing of one model.
+
+    ``sort_columns`` maps the names accepted in ``?sort=`` to columns; each
+    should be backed by an index so a page is a single seek. Rows with a
+    NULL sort value are paged through by id after (descending) or before
+    (ascending) the rest.
+    ``filters`` maps query-string names to ``(parse, build)`` pairs where
+    ``build(value)`` returns a WHERE clause.
+    """
+
+    def __init__(self, model, sort_columns, default_sort, default_direction='desc',
+                 filters=None, loaders=None, per_page=25, max_per_page=200):
+        self.model = model
+        self.sort_columns = sort_columns
+        self.default_sort = default_sort
+        self.default_direction = default_direction
+        self.filters = filters or {}
+        self.loaders = loaders or {}
+        self.per_page = per_page
+        self.max_per_page = max_per_page
+
+    def encode_cursor(self, item, sort):
+        value = getattr(item, self.sort_columns[sort].key)
+        raw = json.dumps([_dump_value(value), item.id]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor, sort):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+            return _load_value(self.sort_columns[sort], value), int(row_id)
+        except (TypeError, ValueError, binascii.Error):
+            return None
+
+    def query(self, sort, direction, filters):
+        sort_column = self.sort_columns[sort]
+        id_column = self.model.id
+        query = self.model.query.options(*loader_options(self.model, self.loaders))
+        for name, value in filters.items():
+            query = query.filter(self.filters[name][1](value))
+        if direction == 'desc':
+            return query.order_by(sort_column.desc(), id_column.desc())
+        return query.order_by(sort_column.asc(), id_column.asc())
+
+    def page(self, args):
+        sort = args.get('sort', self.default_sort)
+        if sort not in self.sort_columns:
+            sort = self.default_sort
+        direction = args.get('direction', self.default_direction)
+        if direction not in ('asc', 'desc'):
+            direction = self.default_direction
+        try:
+            per_page = max(1, min(int(args.get('per_page', self.per_page)), self.max_per_page))
+        except ValueError:
+            per_page = self.per_page
+
+        filters = {}
+        for name, (parse, _) in self.filters.items():
+            raw = args.get(name)
+            if raw in (None, ''):
+                continue
+            value = parse(raw)
+            if value is not None:
+                filters[name] = value
+
+        query = self.query(sort, direction, filters)
+        position = self.decode_cursor(args['after'], sort) if args.get('after') else None
+        if position:
+            query = query.filter(seek_filter(self.sort_columns[sort], self.model.id,
+                                             direction == 'desc', *position))
+
+        items = query.limit(per_page + 1).all()
+        next_cursor = None
+        if len(items) > per_page:
+            items = items[:per_page]
+            next_cursor = self.encode_cursor(items[-1], sort)
+        return ListingPage(items, next_cursor, sort, direction, filters)
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except ValueError:
+        return None
+
+
+booking_listing = Listing(
+    Booking,
+    sort_columns={'booking_date': Booking.booking_date, 'id': Booking.id, 'status': Booking.status},
+    default_sort='booking_date',
+    filters={
+        'status': (str, lambda value: Booking.status == value),
+        'booked_from': (_parse_date, lambda value: Booking.booking_date >= value),
+        'booked_to': (_parse_date, lambda value: Booking.booking_date <= value),
+        # package_id IN (uncorrelated subquery): read once, then ix_bookings_package_id
+        # can serve it, where package.has() ran an EXISTS for every booking
+        'category_id': (_int_or_none, lambda value: Booking.package_id.in_(
+            select(Package.id).where(Package.category_id == value))),
+        'package_type_id': (_int_or_none, lambda value: Booking.package_id.in_(
+            select(Package.id).where(Package.package_type_id == value))),
+    },
+    loaders={'user': 'joined', 'package': 'joined'},
+)
+
+package_listing = Listing(
+    Package,
+    sort_columns={'name': Package.name, 'price': Package.price, 'id': Package.id},
+    default_sort='name',
+    default_direction='asc',
+    filters={
+        'category_id': (_int_or_none, lambda value: Package.category_id == value),
+        'package_type_id': (_int_or_none, lambda value: Package.package_type_id == value),
+    },
+    loaders={'category': 'joined', 'package_type': 'joined'},
+)
+
+category_listing = Listing(
+    Category,
+    sort_columns={'name': Category.name, 'id': Category.id},
+    default_sort='name',
+    default_direction='asc',
+)
@@ -0,0 +1,217 @@
+import calendar
+from collections import Counter
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, case, event, exists, func, select, update
+from sqlalchemy.orm import Session, aliased
+from extensions import db
+from models.model import Booking, Package, PackageType
+from models.counters import adjust_counters, status_counter
+from models.jobs import enqueue
+from models.queries import seek_filter, decode_cursor
+from models.reference import reference_cache, admin_setting, set_admin_setting, PACKAGES
+
+
+# Bookings in these statuses move to EXPIRED once expires_at has passed
+ACTIVE_STATUSES = ('confirmed', 'paid')
+EXPIRED = 'expired'
+
+SWEEP_BATCH_SIZE = 1000
+# Position of the last reminder sent, as a booking cursor (expires_at_id)
+REMINDER_CURSOR_SETTING = 'membership_reminder_cursor'
+
+memberships_cli = AppGroup('memberships', help='Expire memberships and send renewal reminders.')
+
+
+class MembershipError(Exception):
+    pass
+
+
+def add_months(moment, months):
+    # Calendar months, clamped to the end of shorter months (31 Jan + 1 = 28/29 Feb)
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+
+def package_durations():
+    return reference_cache.get_or_load((PACKAGES, 'durations'), lambda: dict(db.session.execute(
+        select(Package.id, PackageType.duration_in_months)
+        .join(PackageType, Package.package_type_id == PackageType.id)).all()))
+
+
+def membership_expiry(booking_date, package_id, durations=None):
+    months = (durations if durations is not None else package_durations()).get(package_id)
+    return add_months(booking_date, months) if months is not None else None
+
+
+@event.listens_for(Session, 'before_flush')
+def set_expiry(session, flush_context, instances):
+    # Every booking added through the ORM gets its expiry precomputed once;
+    # Core bulk inserts (importer, bench seed) set expires_at themselves.
+    with session.no_autoflush:
+        for instance in session.new:
+            if not isinstance(instance, Booking) or instance.expires_at is not None:
+                continue
+            if instance.booking_date is None:
+                instance.booking_date = datetime.utcnow()
+            package = instance.package
+            if package is not None and package.package_type is not None:
+                instance.expires_at = add_months(instance.booking_date, package.package_type.duration_in_months)
+            elif instance.package_id is not None:
+                instance.expires_at = membership_expiry(instance.booking_date, instance.package_id)
+
+
+def backfill_expiry(batch_size=SWEEP_BATCH_SIZE, progress=None):
+    # For bookings created before expires_at existed. Walks the primary key in
+    # batches, one executemany UPDATE and one commit per batch.
+    durations = package_durations()
+    bookings = Booking.__table__
+    statement = (update(bookings).where(bookings.c.id == bindparam('booking_id'))
+                 .values(expires_at=bindparam('expiry')))
+    last_id, updated = 0, 0
+    while True:
+        rows = db.session.execute(
+            select(Booking.id, Booking.package_id, Booking.booking_date)
+            .where(Booking.expires_at.is_(None), Booking.id > last_id)
+            .order_by(Booking.id).limit(batch_size)).all()
+        if not rows:
+            return updated
+        params = [{'booking_id': booking_id, 'expiry': membership_expiry(booking_date, package_id, durations)}
+                  for booking_id, package_id, booking_date in rows if booking_date is not None]
+        params = [row for row in params if row['expiry'] is not None]
+        if params:
+            db.session.connection().execute(statement, params)
+        db.session.commit()
+        updated += len(params)
+        last_id = rows[-1][0]
+        if progress:
+            progress(updated)
+
+
+def superseded():
+    # The member already holds an active booking that runs past this one,
+    # usually its renewal: no expiry notice or reminder for the old term
+    later = aliased(Booking)
+    return exists().where(later.user_id == Booking.user_id, later.id != Booking.id,
+                          later.status.in_(ACTIVE_STATUSES), later.expires_at > Booking.expires_at)
+
+
+def expire_memberships(now=None, batch_size=SWEEP_BATCH_SIZE):
+    """Move active bookings whose expiry has passed to EXPIRED.
+
+    Only bookings that are still active and already past expires_at are
+    read, through ix_bookings_status_expires_at, so each run touches just
+    the memberships that lapsed since the previous one.
+    """
+    now = now or datetime.utcnow()
+    expired = 0
+    while True:
+        # CASE WHEN EXISTS: SQL Server does not take a bare EXISTS as a column
+        rows = db.session.execute(
+            select(Booking.id, Booking.status, case((superseded(), True), else_=False))
+            .where(Booking.status.in_(ACTIVE_STATUSES), Booking.expires_at <= now)
+            .order_by(Booking.expires_at, Booking.id).limit(batch_size)).all()
+        if not rows:
+            return expired
+        by_status = {}
+        for booking_id, status, _ in rows:
+            by_status.setdefault(status, []).append(booking_id)
+        deltas = Counter()
+        updated = set()
+        for status, booking_ids in by_status.items():
+            # The status guard skips rows another process changed since the
+            # SELECT; only the rows this UPDATE changed are counted and notified
+            changed_ids = db.session.scalars(
+                update(Booking).where(Booking.id.in_(booking_ids), Booking.status == status)
+                .values(status=EXPIRED).returning(Booking.id)
+                .execution_options(synchronize_session=False)).all()
+            deltas[status_counter(status)] -= len(changed_ids)
+            deltas[status_counter(EXPIRED)] += len(changed_ids)
+            updated.update(changed_ids)
+        changed = {name: delta for name, delta in deltas.items() if delta}
+        if changed:
+            # A bulk UPDATE bypasses the flush, so the dashboard counters are adjusted here
+            adjust_counters(db.session, changed)
+        notify = [booking_id for booking_id, _, renewed in rows if booking_id in updated and not renewed]
+        if notify:
+            enqueue('send_expiry_notices', {'booking_ids': notify})
+        db.session.commit()
+        expired += len(updated)
+
+
+def send_renewal_reminders(now=None, days=None, batch_size=SWEEP_BATCH_SIZE):
+    # Reminders cover (last cursor, now + days]; the cursor moves forward with
+    # each batch in the same transaction as its job, so nobody is reminded twice.
+    now = now or datetime.utcnow()
+    days = current_app.config.get('MEMBERSHIP_REMINDER_DAYS', 7) if days is None else days
+    horizon = now + timedelta(days=days)
+    position = decode_cursor(admin_setting(REMINDER_CURSOR_SETTING) or '')
+    reminded = 0
+    while True:
+        query = (select(Booking.id, Booking.expires_at)
+                 .where(Booking.status.in_(ACTIVE_STATUSES), Booking.expires_at <= horizon, ~superseded())
+                 .order_by(Booking.expires_at, Booking.id).limit(batch_size))
+        if position:
+            query = query.where(seek_filter(Booking.expires_at, Booking.id, False, *position))
+        else:
+            # First run: start from now rather than reminding about lapsed memberships
+            query = query.where(Booking.expires_at > now)
+        bookings = db.session.execute(query).all()
+        if not bookings:
+            return reminded
+        enqueue('send_renewal_reminders', {'booking_ids': [booking.id for booking in bookings]})
+        last = bookings[-1]
+        position = (last.expires_at, last.id)
+        # set_admin_setting commits, taking the queued job with it
+        set_admin_setting(REMINDER_CURSOR_SETTING, f'{last.expires_at.isoformat()}_{last.id}')
+        reminded += len(bookings)
+
+
+def renew_membership(booking, now=None):
+    # The new term starts when the member's latest term of this package ends,
+    # or now if it already has; renewing twice extends rather than overlaps
+    if booking.status not in ACTIVE_STATUSES + (EXPIRED,):
+        raise MembershipError(f'A {booking.status} booking cannot be renewed.')
+    now = now or datetime.utcnow()
+    latest = db.session.scalar(select(func.max(Booking.expires_at))
+                               .where(Booking.user_id == booking.user_id, Booking.package_id == booking.package_id,
+                                      Booking.status.in_(ACTIVE_STATUSES)))
+    starts_at = max(now, booking.expires_at or now, latest or now)
+    package = booking.package
+    renewal = Booking(user_id=booking.user_id, package_id=package.id, status='confirmed',
+                      total_amount=package.price, booking_date=now,
+                      expires_at=add_months(starts_at, package.package_type.duration_in_months))
+    db.session.add(renewal)
+    return renewal
+
+
+def run_sweep(now=None, batch_size=SWEEP_BATCH_SIZE):
+    return {'expired': expire_memberships(now, batch_size),
+            'reminded': send_renewal_reminders(now, batch_size=batch_size)}
+
+
+@memberships_cli.command('sweep')
+@click.option('--now', 'now', default=None, help='Evaluate expiry as of this ISO timestamp.')
+@click.option('--batch-size', default=SWEEP_BATCH_SIZE, show_default=True)
+def sweep_command(now, batch_size):
+    """Expire lapsed memberships and queue renewal reminders. Run daily from cron."""
+    try:
+        now = datetime.fromisoformat(now) if now else None
+    except ValueError:
+        raise click.BadParameter('expected an ISO timestamp', param_hint='--now')
+    started = datetime.utcnow()
+    result = run_sweep(now, batch_size)
+    seconds = (datetime.utcnow() - started).total_seconds()
+    click.echo(f"{result['expired']} expired, {result['reminded']} reminded in {seconds:.2f}s")
+
+
+@memberships_cli.command('backfill')
+@click.option('--batch-size', default=SWEEP_BATCH_SIZE, show_default=True)
+def backfill_command(batch_size):
+    """Compute expires_at for bookings that do not have one yet."""
+    updated = backfill_expiry(batch_size, progress=lambda count: click.echo(f'  {count} updated'))
+    click.echo(f'{updated} booking(s) backfilled.')
@@ -1,15 +1,9 @@
-from app import db
+from extensions import db
 from datetime import datetime
-from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, SubmitField, SelectField
-from wtforms.validators import DataRequired, Email, EqualTo, ValidationError
-from functools import wraps
-from flask import redirect, url_for, flash
-from flask_login import current_user
-from datetime import date  # Example import
+from flask_login import UserMixin
 
 
-class User(db.Model):
+class User(UserMixin, db.Model):
     __tablename__ = 'users'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -20,6 +14,10 @@ class User(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, onupdate=datetime.utcnow)
 
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
     def __repr__(self):
         return f'<User {self.username}>'
 
@@ -48,6 +46,10 @@ class PackageType(db.Model):
 
 class Package(db.Model):
     __tablename__ = 'packages'
+    __table_args__ = (
+        db.Index('ix_packages_category_id_name', 'category_id', 'name', 'id'),
+        db.Index('ix_packages_package_type_id', 'package_type_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -65,16 +67,37 @@ class Package(db.Model):
 
 class Booking(db.Model):
     __tablename__ = 'bookings'
+    __table_args__ = (
+        # Member history: WHERE user_id = ? ORDER BY booking_date DESC, id DESC
+        db.Index('ix_bookings_user_id_booking_date', 'user_id', 'booking_date', 'id',
+                 mssql_include=['package_id', 'status']),
+        # Reports and the admin listing: booking_date ranges and ordering
+        db.Index('ix_bookings_booking_date', 'booking_date', 'id'),
+        db.Index('ix_bookings_status_booking_date', 'status', 'booking_date', 'id'),
+        db.Index('ix_bookings_package_id', 'package_id'),
+        # Expiry sweeps: WHERE status IN (active) AND expires_at <= ?
+        db.Index('ix_bookings_status_expires_at', 'status', 'expires_at', 'id'),
+        # A member's later active term (renewals), checked per swept row
+        db.Index('ix_bookings_user_id_status_expires_at', 'user_id', 'status', 'expires_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     package_id = db.Column(db.Integer, db.ForeignKey('packages.id'), nullable=False)
     booking_date = db.Column(db.DateTime, default=datetime.utcnow)
-    status = db.Column(db.String(20), nullable=False)  # e.g., 'confirmed', 'pending', 'cancelled'
+    status = db.Column(db.String(20), nullable=False)  # e.g., 'confirmed', 'pending', 'cancelled', 'paid'
+    total_amount = db.Column(db.Float, nullable=False, default=0)
+    # Running balance, only ever changed by an atomic SQL increment in models/ledger.py
+    amount_paid = db.Column(db.Float, nullable=False, default=0)
+    # booking_date + the package type's duration, filled in by models/memberships.py
+    expires_at = db.Column(db.DateTime)
     
     user = db.relationship('User', backref=db.backref('bookings', lazy=True))
     package = db.relationship('Package', backref=db.backref('bookings', lazy=True))
 
+    # True for models.archive.ArchivedBooking, read back from the archive
+    archived = False
+
     def __repr__(self):
         return f'<Booking {self.id} - User: {self.user_id} - Package: {self.package_id}>'
 
@@ -82,12 +105,23 @@ class Booking(db.Model):
 
 class Payment(db.Model):
     __tablename__ = 'payments'
+    __table_args__ = (
+        db.Index('ix_payments_booking_id', 'booking_id', 'payment_date',
+                 mssql_include=['amount', 'payment_status']),
+        # Filtered so any number of payments may have no key (a plain UNIQUE
+        # constraint on SQL Server allows a single NULL)
+        db.Index('ux_payments_idempotency_key', 'idempotency_key', unique=True,
+                 mssql_where=db.text('idempotency_key IS NOT NULL'),
+                 sqlite_where=db.text('idempotency_key IS NOT NULL')),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     booking_id = db.Column(db.Integer, db.ForeignKey('bookings.id'), nullable=False)
     amount = db.Column(db.Float, nullable=False)
     payment_date = db.Column(db.DateTime, default=datetime.utcnow)
     payment_status = db.Column(db.String(20), nullable=False)  # e.g., 'completed', 'pending'
+    payment_type = db.Column(db.String(20))  # e.g., 'cash', 'card'
+    idempotency_key = db.Column(db.String(64))
 
     booking = db.relationship('Booking', backref=db.backref('payments', lazy=True))
 
@@ -109,6 +143,9 @@ class AdminSettings(db.Model):
     
 class Inquiry(db.Model):
     __tablename__ = 'inquiries'
+    __table_args__ = (
+        db.Index('ix_inquiries_created_at', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), nullable=False)
@@ -119,79 +156,152 @@ class Inquiry(db.Model):
     def __repr__(self):
         return f'<Inquiry {self.name}>'
 
-class RegistrationForm(FlaskForm):
-    username = StringField('Username', validators=[DataRequired()])
-    email = StringField('Email', validators=[DataRequired(), Email()])
-    password = PasswordField('Password', validators=[DataRequired()])
-    confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password')])
-    submit = SubmitField('Register')
-    
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Email already in use.')
-        
-class LoginForm(FlaskForm):
-    email = StringField('Email', validators=[DataRequired(), Email()])
-    password = PasswordField('Password', validators=[DataRequired()])
-    submit = SubmitField('Login')
-
-class UpdateProfileForm(FlaskForm):
-    username = StringField('Username', validators=[DataRequired()])
-    email = StringField('Email', validators=[DataRequired(), Email()])
-    submit = SubmitField('Update')
-
-class BookingForm(FlaskForm):
-    package = SelectField('Package', choices=[], coerce=int)
-    submit = SubmitField('Book')
-
-
-class ChangePasswordForm(FlaskForm):
-    current_password = PasswordField('Current Password', validators=[DataRequired()])
-    new_password = PasswordField('New Password', validators=[DataRequired()])
-    confirm_new_password = PasswordField('Confirm New Password', validators=[DataRequired(), EqualTo('new_password')])
-    submit = SubmitField('Change Password')
-
-
-from flask_wtf import FlaskForm
-from wtforms import StringField, SubmitField, SelectField
-from wtforms.validators import DataRequired, Length
-
-class CategoryForm(FlaskForm):
-    name = StringField('Category Name', validators=[DataRequired(), Length(min=2, max=50)])
-    submit = SubmitField('Save')
-
-class PackageForm(FlaskForm):
-    name = StringField('Package Name', validators=[DataRequired(), Length(min=2, max=50)])
-    category = SelectField('Category', coerce=int)
-    submit = SubmitField('Save')
-
-class UpdateBookingForm(FlaskForm):
-    status = SelectField('Booking Status', choices=[('pending', 'Pending'), ('confirmed', 'Confirmed')], validators=[DataRequired()])
-    submit = SubmitField('Update')
-
-class ReportForm(FlaskForm):
-    start_date = StringField('Start Date', validators=[DataRequired()])
-    end_date = StringField('End Date', validators=[DataRequired()])
-    submit = SubmitField('Generate Report')
-
-class AdminProfileForm(FlaskForm):
-    username = StringField('Username', validators=[DataRequired(), Length(min=2, max=50)])
-    email = StringField('Email', validators=[DataRequired()])
-    submit = SubmitField('Update Profile')
-
-
-def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if not current_user.is_admin:
-            flash('You do not have permission to access this page.', 'danger')
-            return redirect(url_for('main.index'))
-        return f(*args, **kwargs)
-    return decorated_function
-
-class PaymentForm(FlaskForm):
-    booking_id = SelectField('Booking', coerce=int, validators=[DataRequired()])
-    amount = DecimalField('Amount', validators=[DataRequired()])
-    payment_type = StringField('Payment Type', validators=[DataRequired()])
-    submit = SubmitField('Process Payment')
+class ClassSlot(db.Model):
+    __tablename__ = 'class_slots'
+    __table_args__ = (
+        db.Index('ix_class_slots_package_id_starts_at', 'package_id', 'starts_at'),
+        db.Index('ix_class_slots_starts_at', 'starts_at'),
+        # _take_seat compares seats_taken < capacity; a zero or negative
+        # capacity would make every reservation a waitlist place
+        db.CheckConstraint('capacity > 0', name='ck_class_slots_capacity_positive'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    package_id = db.Column(db.Integer, db.ForeignKey('packages.id'), nullable=False)
+    starts_at = db.Column(db.DateTime, nullable=False)
+    duration_minutes = db.Column(db.Integer, nullable=False, default=60)
+    capacity = db.Column(db.Integer, nullable=False)
+    # Only changed by conditional UPDATEs in models/slots.py
+    seats_taken = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    package = db.relationship('Package', backref=db.backref('slots', lazy=True))
+
+    @property
+    def seats_left(self):
+        return max(self.capacity - self.seats_taken, 0)
+
+    def __repr__(self):
+        return f'<ClassSlot {self.id} - Package: {self.package_id} - {self.starts_at}>'
+
+
+class SlotReservation(db.Model):
+    __tablename__ = 'slot_reservations'
+    __table_args__ = (
+        db.UniqueConstraint('slot_id', 'user_id', name='uq_slot_reservations_slot_id_user_id'),
+        # Waitlist order: WHERE slot_id = ? AND status = 'waitlisted' ORDER BY created_at, id
+        db.Index('ix_slot_reservations_slot_id_status', 'slot_id', 'status', 'created_at', 'id'),
+        db.Index('ix_slot_reservations_user_id', 'user_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    slot_id = db.Column(db.Integer, db.ForeignKey('class_slots.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # 'reserved', 'waitlisted', 'cancelled'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    slot = db.relationship('ClassSlot', backref=db.backref('reservations', lazy=True))
+    user = db.relationship('User', backref=db.backref('slot_reservations', lazy=True))
+
+    def __repr__(self):
+        return f'<SlotReservation {self.id} - Slot: {self.slot_id} - User: {self.user_id} - {self.status}>'
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Claim query: WHERE status = 'queued' AND run_at <= ? ORDER BY priority, run_at, id
+        db.Index('ix_jobs_status_priority_run_at', 'status', 'priority', 'run_at', 'id'),
+        db.Index('ix_jobs_status_locked_at', 'status', 'locked_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON
+    priority = db.Column(db.Integer, nullable=False, default=100)  # lower runs first
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.name} - {self.status}>'
+
+
+class DashboardCounter(db.Model):
+    __tablename__ = 'dashboard_counters'
+
+    name = db.Column(db.String(50), primary_key=True)  # e.g. 'bookings', 'bookings:confirmed'
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<DashboardCounter {self.name}={self.value}>'
+
+
+class CheckIn(db.Model):
+    __tablename__ = 'check_ins'
+    __table_args__ = (
+        # Devices resend batches; (device_id, event_id) makes that harmless
+        db.UniqueConstraint('device_id', 'event_id', name='uq_check_ins_device_id_event_id'),
+        db.Index('ix_check_ins_user_id_occurred_at', 'user_id', 'occurred_at'),
+        db.Index('ix_check_ins_occurred_at', 'occurred_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # The membership the member was let in on. No foreign key: closed
+    # bookings move to the archive (models/archive.py), check-ins stay.
+    booking_id = db.Column(db.Integer)
+    device_id = db.Column(db.String(50), nullable=False)
+    event_id = db.Column(db.String(64), nullable=False)
+    direction = db.Column(db.String(3), nullable=False)  # 'in', 'out'
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    user = db.relationship('User', backref=db.backref('check_ins', lazy=True))
+
+    def __repr__(self):
+        return f'<CheckIn {self.id} - User: {self.user_id} - {self.direction} at {self.occurred_at}>'
+
+
+class OccupancyHour(db.Model):
+    __tablename__ = 'occupancy_hours'
+
+    # Start of the hour; kept up to date by models/attendance.py as check-ins arrive
+    hour = db.Column(db.DateTime, primary_key=True)
+    entries = db.Column(db.Integer, nullable=False, default=0)
+    exits = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<OccupancyHour {self.hour} +{self.entries} -{self.exits}>'
+
+
+class AuditEvent(db.Model):
+    __tablename__ = 'audit_events'
+    __table_args__ = (
+        db.Index('ix_audit_events_occurred_at', 'occurred_at', 'id'),
+        db.Index('ix_audit_events_entity', 'entity', 'entity_id', 'occurred_at'),
+        db.Index('ix_audit_events_actor_id', 'actor_id', 'occurred_at'),
+    )
+
+    # Append-only: rows are inserted by the audit writer and never updated.
+    # actor_id has no foreign key so the trail outlives deleted users.
+    id = db.Column(db.Integer, primary_key=True)
+    occurred_at = db.Column(db.DateTime, nullable=False)
+    actor_id = db.Column(db.Integer)
+    action = db.Column(db.String(20), nullable=False)  # insert, update, delete, bulk_update, bulk_delete
+    entity = db.Column(db.String(50), nullable=False)  # table name
+    entity_id = db.Column(db.Integer)
+    changes = db.Column(db.Text)  # JSON
+    endpoint = db.Column(db.String(100))
+    ip = db.Column(db.String(45))
+
+    def __repr__(self):
+        return f'<AuditEvent {self.id} {self.action} {self.entity}#{self.entity_id}>'
@@ -0,0 +1,110 @@
+from datetime import datetime
+from itertools import islice
+from flask import current_app
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import joinedload, selectinload, lazyload
+from models.model import Booking
+from models.archive import archived_history, archived_months, union_rows, BOOKINGS
+
+
+# How each relationship touched by the history templates is loaded.
+# 'joined' rides along in the main SELECT, 'selectin' costs one extra
+# query for the whole page, 'lazy' falls back to one query per row.
+HISTORY_LOADERS = {
+    'package': 'joined',
+    'payments': 'selectin',
+}
+
+LOADER_STRATEGIES = {
+    'joined': joinedload,
+    'selectin': selectinload,
+    'lazy': lazyload,
+}
+
+HISTORY_PAGE_SIZE = 20
+
+
+def loader_options(model, strategies):
+    options = []
+    for name, strategy in strategies.items():
+        if strategy not in LOADER_STRATEGIES:
+            raise ValueError(f'Unknown loader strategy {strategy!r} for {model.__name__}.{name}')
+        options.append(LOADER_STRATEGIES[strategy](getattr(model, name)))
+    return options
+
+
+def history_loaders(overrides=None):
+    strategies = dict(HISTORY_LOADERS)
+    strategies.update(current_app.config.get('BOOKING_HISTORY_LOADERS', {}))
+    if overrides:
+        strategies.update(overrides)
+    return strategies
+
+
+def seek_filter(sort_column, id_column, descending, value, row_id):
+    # Rows strictly after (value, row_id) in the (sort_column, id) ordering.
+    # Written as OR/AND rather than a row-value comparison, which SQL Server lacks.
+    # NULLs sort lowest there and on SQLite: first ascending, last descending.
+    after_id = id_column < row_id if descending else id_column > row_id
+    if value is None:
+        tied = and_(sort_column.is_(None), after_id)
+        return tied if descending else or_(sort_column.is_not(None), tied)
+    after = or_(sort_column < value if descending else sort_column > value,
+                and_(sort_column == value, after_id))
+    if descending and getattr(sort_column.expression, 'nullable', False):
+        return or_(after, sort_column.is_(None))
+    return after
+
+
+# Cursor stamp for legacy bookings without a booking_date; seek_filter
+# takes the decoded None as the position among the NULLs, which come last
+NULL_STAMP = 'none'
+
+
+def encode_cursor(booking):
+    stamp = NULL_STAMP if booking.booking_date is None else booking.booking_date.isoformat()
+    return f'{stamp}_{booking.id}'
+
+
+def decode_cursor(cursor):
+    try:
+        stamp, _, booking_id = cursor.rpartition('_')
+        return None if stamp == NULL_STAMP else datetime.fromisoformat(stamp), int(booking_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def booking_history_query(user_id, after=None, strategies=None):
+    query = (Booking.query
+             .filter(Booking.user_id == user_id)
+             .options(*loader_options(Booking, history_loaders(strategies)))
+             .order_by(Booking.booking_date.desc(), Booking.id.desc()))
+
+    # Seek past the last row of the previous page instead of using OFFSET,
+    # so page N costs the same as page 1.
+    position = decode_cursor(after) if after else None
+    if position:
+        booking_date, booking_id = position
+        query = query.filter(seek_filter(Booking.booking_date, Booking.id, True, booking_date, booking_id))
+    return query
+
+
+def _history_key(booking):
+    # Sorts like the SQL ORDER BY: a NULL booking_date below every date
+    return booking.booking_date is not None, booking.booking_date or datetime.min, booking.id
+
+
+def booking_history_page(user_id, after=None, per_page=None, strategies=None):
+    per_page = per_page or current_app.config.get('BOOKING_HISTORY_PAGE_SIZE', HISTORY_PAGE_SIZE)
+
+    # Fetch one extra row to know whether there is a next page.
+    bookings = booking_history_query(user_id, after, strategies).limit(per_page + 1).all()
+    if archived_months(BOOKINGS):
+        # Same seek over the archive, newest months first, merged into the page
+        archived = archived_history(user_id, decode_cursor(after) if after else None, per_page + 1)
+        bookings = list(islice(union_rows(bookings, archived, _history_key, reverse=True), per_page + 1))
+    next_cursor = None
+    if len(bookings) > per_page:
+        bookings = bookings[:per_page]
+        next_cursor = encode_cursor(bookings[-1])
+    return bookings, next_cursor
@@ -0,0 +1,72 @@
+from extensions import db
+from models.model import Package, Category, PackageType, AdminSettings
+from services.cache import VersionedCache, MemoryBackend, backend_from_url
+
+
+# Catalog and settings rows change a few times a month but are read on
+# nearly every request. Only plain tuples/strings are cached, never ORM
+# instances, so nothing cached is tied to a session. With a shared
+# CACHE_URL every gunicorn worker sees an invalidation on its next read.
+reference_cache = VersionedCache(MemoryBackend(), maxsize=256, ttl=300)
+
+PACKAGES = 'packages'
+CATEGORIES = 'categories'
+PACKAGE_TYPES = 'package_types'
+SETTINGS = 'settings'
+DASHBOARD = 'dashboard'
+ANALYTICS = 'analytics'
+ACTIVE_MEMBERS = 'active_members'
+
+
+def configure_reference_cache(app):
+    if app.config.get('CACHE_URL'):
+        reference_cache.backend = backend_from_url(app.config['CACHE_URL'])
+    reference_cache.ttl = app.config.get('REFERENCE_CACHE_TTL', reference_cache.ttl)
+    reference_cache.maxsize = app.config.get('REFERENCE_CACHE_SIZE', reference_cache.maxsize)
+
+
+def package_choices():
+    return reference_cache.get_or_load(
+        (PACKAGES, 'choices'),
+        lambda: [(pkg_id, name) for pkg_id, name in
+                 db.session.execute(db.select(Package.id, Package.name).order_by(Package.name))])
+
+
+def category_choices():
+    return reference_cache.get_or_load(
+        (CATEGORIES, 'choices'),
+        lambda: [(cat_id, name) for cat_id, name in
+                 db.session.execute(db.select(Category.id, Category.name).order_by(Category.name))])
+
+
+def package_type_choices():
+    return reference_cache.get_or_load(
+        (PACKAGE_TYPES, 'choices'),
+        lambda: [(type_id, name) for type_id, name in
+                 db.session.execute(db.select(PackageType.id, PackageType.name).order_by(PackageType.name))])
+
+
+def admin_settings():
+    return reference_cache.get_or_load(
+        (SETTINGS, 'all'),
+        lambda: dict(db.session.execute(db.select(AdminSettings.setting_name, AdminSettings.setting_value)).all()))
+
+
+def admin_setting(name, default=None):
+    return admin_settings().get(name, default)
+
+
+def set_admin_setting(name, value):
+    setting = AdminSettings.query.filter_by(setting_name=name).first()
+    if setting is None:
+        setting = AdminSettings(setting_name=name, setting_value=value)
+        db.session.add(setting)
+    else:
+        setting.setting_value = value
+    db.session.commit()
+    invalidate_reference_data(SETTINGS)
+
+
+def invalidate_reference_data(*namespaces):
+    for namespace in namespaces:
+        reference_cache.invalidate(namespace)
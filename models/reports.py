@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+from itertools import islice
+from datetime import date, datetime, timedelta
+from sqlalchemy import Date, cast, func, select
+from extensions import db
+from models.model import Booking, Payment, User, Package, Category, PackageType
+from models.archive import archived_aggregates, archived_report_rows, union_rows
+
+
+REPORT_CHUNK_SIZE = 1000
+REPORT_PREVIEW_ROWS = 100
+
+REPORT_COLUMNS = ['booking_id', 'booking_date', 'status', 'username', 'email',
+                  'package', 'category', 'package_type', 'price']
+
+
+def parse_report_date(value):
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value.strip())
+    except (AttributeError, ValueError):
+        return None
+
+
+def _range_filter(start, end):
+    # The end date is inclusive for the user, so compare against the next midnight.
+    start_at = datetime.combine(start, datetime.min.time())
+    end_at = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    return Booking.booking_date >= start_at, Booking.booking_date < end_at
+
+
+def _day(column):
+    # SQLite stores DATETIME as text and CAST(... AS DATE) truncates it to the year.
+    if db.engine.dialect.name == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+
+def report_statement(start, end):
+    # Plain columns rather than entities so rows never enter the identity map.
+    return (select(Booking.id, Booking.booking_date, Booking.status, User.username, User.email,
+                   Package.name, Category.name, PackageType.name, Package.price)
+            .join(User, Booking.user_id == User.id)
+            .join(Package, Booking.package_id == Package.id)
+            .join(Category, Package.category_id == Category.id)
+            .join(PackageType, Package.package_type_id == PackageType.id)
+            .where(*_range_filter(start, end))
+            .order_by(Booking.booking_date, Booking.id))
+
+
+def _report_key(row):
+    return row[1], row[0]
+
+
+def report_rows(start, end, chunk_size=REPORT_CHUNK_SIZE):
+    # yield_per turns on a server-side cursor and buffers only chunk_size rows,
+    # so memory stays flat however long the range is. Archived months are
+    # merged in by (booking_date, id), one partition at a time.
+    result = db.session.execute(report_statement(start, end).execution_options(yield_per=chunk_size))
+    try:
+        yield from union_rows(result, archived_report_rows(start, end), _report_key)
+    finally:
+        result.close()
+
+
+def report_preview(start, end, limit=REPORT_PREVIEW_ROWS):
+    hot = db.session.execute(report_statement(start, end).limit(limit)).all()
+    return list(islice(union_rows(hot, archived_report_rows(start, end), _report_key), limit))
+
+
+def _chunked(rows, encode, chunk_size):
+    buffer = []
+    for row in rows:
+        buffer.append(encode(row))
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def csv_chunks(start, end, chunk_size=REPORT_CHUNK_SIZE):
+    out = io.StringIO()
+    writer = csv.writer(out)
+
+    def encode(row):
+        out.seek(0)
+        out.truncate()
+        writer.writerow(row)
+        return out.getvalue()
+
+    yield encode(REPORT_COLUMNS)
+    yield from _chunked(report_rows(start, end, chunk_size), encode, chunk_size)
+
+
+def ndjson_chunks(start, end, chunk_size=REPORT_CHUNK_SIZE):
+    def encode(row):
+        return json.dumps(dict(zip(REPORT_COLUMNS, row)), default=_json_default) + '\n'
+
+    yield from _chunked(report_rows(start, end, chunk_size), encode, chunk_size)
+
+
+REPORT_FORMATS = {
+    'csv': ('text/csv', csv_chunks),
+    'ndjson': ('application/x-ndjson', ndjson_chunks),
+}
+
+
+def grouped_statement(group_column, start, end):
+    return (select(group_column, func.count(func.distinct(Booking.id)), func.coalesce(func.sum(Payment.amount), 0))
+            .select_from(Booking)
+            .join(Package, Booking.package_id == Package.id)
+            .join(Category, Package.category_id == Category.id)
+            .join(PackageType, Package.package_type_id == PackageType.id)
+            .outerjoin(Payment, Payment.booking_id == Booking.id)
+            .where(*_range_filter(start, end))
+            .group_by(group_column)
+            .order_by(group_column))
+
+
+def per_day_statement(start, end):
+    day = _day(Booking.booking_date)
+    return (select(day, func.count(Booking.id))
+            .where(*_range_filter(start, end))
+            .group_by(day)
+            .order_by(day))
+
+
+def _grouped(group_column, start, end):
+    return db.session.execute(grouped_statement(group_column, start, end)).all()
+
+
+def _with_archived(rows, archived):
+    totals = {row[0]: list(row[1:]) for row in rows}
+    for key, values in archived.items():
+        current = totals.setdefault(key, [0] * len(values))
+        for index, value in enumerate(values):
+            current[index] += value
+    return [(key, *values) for key, values in sorted(totals.items())]
+
+
+def report_aggregates(start, end):
+    # Each breakdown is one GROUP BY in the database; Python only sees the totals.
+    archived = archived_aggregates(start, end)
+    # SQLite's date() gives strings, CAST(... AS DATE) gives dates
+    day_key = date.isoformat if db.engine.dialect.name == 'sqlite' else (lambda value: value)
+    return {
+        'per_package': _with_archived(_grouped(Package.name, start, end), archived['per_package']),
+        'per_category': _with_archived(_grouped(Category.name, start, end), archived['per_category']),
+        'per_package_type': _with_archived(_grouped(PackageType.name, start, end), archived['per_package_type']),
+        'per_day': _with_archived(db.session.execute(per_day_statement(start, end)).all(),
+                                  {day_key(key): (count,) for key, count in archived['per_day'].items()}),
+    }
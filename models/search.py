@@ -0,0 +1,215 @@
+import re
+import click
+from flask.cli import AppGroup
+from sqlalchemy import event, inspect, or_, select, text
+from sqlalchemy.orm import Session
+from extensions import db
+from models.model import User, Package, Inquiry
+
+
+SEARCH_LIMIT = 10
+
+# Indexed models: kind -> (model, searchable columns). On SQLite each kind
+# has an FTS5 table search_<kind> whose rowid is the source row's id.
+SEARCHABLE = {
+    'members': (User, ('username', 'email')),
+    'packages': (Package, ('name', 'description')),
+    'inquiries': (Inquiry, ('name', 'email', 'message')),
+}
+KIND_BY_MODEL = {model: kind for kind, (model, _) in SEARCHABLE.items()}
+
+search_cli = AppGroup('search', help='Maintain the full-text search index.')
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def search_tokens(term):
+    return _TOKEN.findall((term or '').lower())
+
+
+def fts_table(kind):
+    return f'search_{kind}'
+
+
+class LikeSearch:
+    # Fallback when no full-text index exists: prefix LIKE on the first
+    # column (served by its index for members), substring on the rest.
+    name = 'like'
+
+    def search(self, kind, term, limit):
+        model, columns = SEARCHABLE[kind]
+        query = select(model.id)
+        for token in search_tokens(term):
+            escaped = token.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            query = query.where(or_(*[getattr(model, column).like(
+                f'{escaped}%' if index == 0 else f'%{escaped}%', escape='\\')
+                for index, column in enumerate(columns)]))
+        return db.session.scalars(query.order_by(model.id.desc()).limit(limit)).all()
+
+    def index(self, connection, kind, rows):
+        pass
+
+    def remove(self, connection, kind, ids):
+        pass
+
+
+class SQLiteFTS5Search:
+    name = 'fts5'
+
+    def search(self, kind, term, limit):
+        # Every token is a prefix match and all must match: "ali exa" -> "ali"* "exa"*
+        match = ' '.join(f'"{token}"*' for token in search_tokens(term))
+        return db.session.scalars(
+            text(f'SELECT rowid FROM {fts_table(kind)} WHERE {fts_table(kind)} MATCH :match '
+                 f'ORDER BY rank LIMIT :limit'),
+            {'match': match, 'limit': limit}).all()
+
+    def index(self, connection, kind, rows):
+        # rows: (id, *columns); replacing by rowid keeps this idempotent
+        _, columns = SEARCHABLE[kind]
+        self.remove(connection, kind, [row[0] for row in rows])
+        placeholders = ', '.join(f':{column}' for column in columns)
+        connection.execute(
+            text(f'INSERT INTO {fts_table(kind)} (rowid, {", ".join(columns)}) VALUES (:id, {placeholders})'),
+            [dict(zip(('id',) + columns, row)) for row in rows])
+
+    def remove(self, connection, kind, ids):
+        if ids:
+            connection.execute(text(f'DELETE FROM {fts_table(kind)} WHERE rowid = :id'), [{'id': i} for i in ids])
+
+    def create(self, connection, kind):
+        _, columns = SEARCHABLE[kind]
+        # prefix= keeps 2-4 character prefixes in the index so typeahead is a lookup
+        connection.execute(text(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table(kind)} USING fts5('
+            f'{", ".join(columns)}, tokenize=\'unicode61 remove_diacritics 2\', prefix=\'2 3 4\')'))
+
+    def rebuild(self, connection, kind):
+        model, columns = SEARCHABLE[kind]
+        self.create(connection, kind)
+        connection.execute(text(f'DELETE FROM {fts_table(kind)}'))
+        connection.execute(text(
+            f'INSERT INTO {fts_table(kind)} (rowid, {", ".join(columns)}) '
+            f'SELECT id, {", ".join(columns)} FROM {model.__tablename__}'))
+
+
+class SQLServerFullTextSearch:
+    # SQL Server keeps its full-text indexes current itself (CHANGE_TRACKING
+    # AUTO, see the migration), so there is nothing to do on writes.
+    name = 'mssql-fulltext'
+
+    def search(self, kind, term, limit):
+        model, columns = SEARCHABLE[kind]
+        condition = ' AND '.join(f'"{token}*"' for token in search_tokens(term))
+        return db.session.scalars(
+            text(f'SELECT TOP (:limit) ft.[KEY] FROM CONTAINSTABLE({model.__tablename__}, '
+                 f'({", ".join(columns)}), :condition) AS ft ORDER BY ft.RANK DESC'),
+            {'condition': condition, 'limit': limit}).all()
+
+    def index(self, connection, kind, rows):
+        pass
+
+    def remove(self, connection, kind, ids):
+        pass
+
+
+_backends = {}
+
+
+def _detect_backend(connection):
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        if all(inspect(connection).has_table(fts_table(kind)) for kind in SEARCHABLE):
+            return SQLiteFTS5Search()
+    elif dialect == 'mssql':
+        installed = connection.scalar(text("SELECT FULLTEXTSERVICEPROPERTY('IsFullTextInstalled')"))
+        indexed = connection.scalar(text(
+            "SELECT COUNT(*) FROM sys.fulltext_indexes WHERE object_id = OBJECT_ID('users')"))
+        if installed and indexed:
+            return SQLServerFullTextSearch()
+    return LikeSearch()
+
+
+def search_backend(connection=None):
+    # Decided once per engine, from the connection already in use
+    connection = connection or db.session.connection()
+    backend = _backends.get(connection.engine)
+    if backend is None:
+        backend = _backends[connection.engine] = _detect_backend(connection)
+    return backend
+
+
+def search(kind, term, limit=SEARCH_LIMIT):
+    # Returns matching rows of the kind's model, best match first
+    if kind not in SEARCHABLE:
+        raise ValueError(f'Unknown search kind {kind!r}')
+    if not search_tokens(term):
+        return []
+    ids = search_backend().search(kind, term, limit)
+    model, _ = SEARCHABLE[kind]
+    rows = {row.id: row for row in db.session.scalars(select(model).where(model.id.in_(ids)))}
+    return [rows[row_id] for row_id in ids if row_id in rows]
+
+
+def index_where(kind, *criteria):
+    # For Core bulk inserts, which bypass the session events below
+    connection = db.session.connection()
+    model, columns = SEARCHABLE[kind]
+    rows = db.session.execute(select(model.id, *[getattr(model, column) for column in columns])
+                              .where(*criteria)).all()
+    if rows:
+        search_backend(connection).index(connection, kind, rows)
+
+
+def _changed_rows(session):
+    changed, removed = {}, {}
+    for instance in list(session.new) + list(session.dirty):
+        kind = KIND_BY_MODEL.get(type(instance))
+        if kind is None or instance in session.deleted:
+            continue
+        columns = SEARCHABLE[kind][1]
+        state = inspect(instance)
+        if instance in session.new or any(state.attrs[column].history.has_changes() for column in columns):
+            changed.setdefault(kind, []).append((instance.id,) + tuple(getattr(instance, c) for c in columns))
+    for instance in session.deleted:
+        kind = KIND_BY_MODEL.get(type(instance))
+        if kind is not None:
+            removed.setdefault(kind, []).append(instance.id)
+    return changed, removed
+
+
+@event.listens_for(Session, 'after_flush')
+def update_search_index(session, flush_context):
+    changed, removed = _changed_rows(session)
+    if not changed and not removed:
+        return
+    # Same transaction as the rows themselves, so the index never drifts
+    connection = session.connection()
+    backend = search_backend(connection)
+    for kind, rows in changed.items():
+        backend.index(connection, kind, rows)
+    for kind, ids in removed.items():
+        backend.remove(connection, kind, ids)
+
+
+def rebuild_search_index():
+    engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return None
+    fts = SQLiteFTS5Search()
+    connection = db.session.connection()
+    for kind in SEARCHABLE:
+        fts.rebuild(connection, kind)
+    db.session.commit()
+    _backends[engine] = fts
+    return fts
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Create the FTS5 tables if needed and re-index every row (SQLite)."""
+    if rebuild_search_index() is None:
+        click.echo(f'{db.engine.dialect.name} keeps its own full-text index; nothing to rebuild.')
+        return
+    counts = {kind: db.session.scalar(text(f'SELECT COUNT(*) FROM {fts_table(kind)}')) for kind in SEARCHABLE}
+    click.echo(', '.join(f'{count} {kind}' for kind, count in counts.items()) + ' indexed.')
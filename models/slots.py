@@ -0,0 +1,159 @@
+from datetime import datetime
+from sqlalchemy import or_, select, update
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models.model import Booking, ClassSlot, SlotReservation
+from models.memberships import ACTIVE_STATUSES
+
+
+RESERVED = 'reserved'
+WAITLISTED = 'waitlisted'
+CANCELLED = 'cancelled'
+
+
+class SlotError(Exception):
+    pass
+
+
+# Every write below touches the class_slots row first and slot_reservations
+# second. Taking locks in one fixed order is what keeps hundreds of
+# concurrent attempts on the same slot from deadlocking each other.
+
+def _take_seat(slot_id):
+    # Succeeds for exactly `capacity` callers, however many race for it:
+    # the WHERE clause is re-checked under the row lock by the database.
+    result = db.session.execute(
+        update(ClassSlot)
+        .where(ClassSlot.id == slot_id, ClassSlot.seats_taken < ClassSlot.capacity)
+        .values(seats_taken=ClassSlot.seats_taken + 1, version=ClassSlot.version + 1)
+        .execution_options(synchronize_session=False))
+    return result.rowcount == 1
+
+
+def _lock_slot(slot_id):
+    result = db.session.execute(
+        update(ClassSlot)
+        .where(ClassSlot.id == slot_id)
+        .values(version=ClassSlot.version + 1)
+        .execution_options(synchronize_session=False))
+    if result.rowcount == 0:
+        raise SlotError(f'Class slot #{slot_id} does not exist.')
+
+
+def _reservation(slot_id, user_id):
+    # populate_existing: a row already in the session may be stale by now
+    return db.session.scalar(select(SlotReservation)
+                             .where(SlotReservation.slot_id == slot_id, SlotReservation.user_id == user_id)
+                             .execution_options(populate_existing=True))
+
+
+def _check_membership(slot_id, user_id):
+    # Plain reads, before any row is locked: the lock order below is unchanged
+    slot = db.session.execute(select(ClassSlot.package_id, ClassSlot.starts_at)
+                              .where(ClassSlot.id == slot_id)).first()
+    if slot is None:
+        raise SlotError(f'Class slot #{slot_id} does not exist.')
+    booking_id = db.session.scalar(
+        select(Booking.id)
+        .where(Booking.user_id == user_id, Booking.package_id == slot.package_id,
+               Booking.status.in_(ACTIVE_STATUSES),
+               or_(Booking.expires_at.is_(None), Booking.expires_at >= slot.starts_at))
+        .limit(1))
+    if booking_id is None:
+        raise SlotError('You need an active membership for this package on the day of the class.')
+
+
+def reserve_seat(slot_id, user_id):
+    """Reserve a seat, or join the waitlist when the slot is full.
+
+    Only members with an active booking for the slot's package that still
+    runs when the class starts may reserve. Returns the member's
+    reservation; calling it again while the member already holds a seat or
+    a waitlist place changes nothing.
+    """
+    existing = _reservation(slot_id, user_id)
+    if existing is not None and existing.status != CANCELLED:
+        return existing
+    _check_membership(slot_id, user_id)
+
+    if _take_seat(slot_id):
+        status = RESERVED
+    else:
+        _lock_slot(slot_id)  # raises if the slot does not exist
+        status = WAITLISTED
+
+    # Read again now that the slot row is locked: the same member's other
+    # request may have rebooked since the first read. Theirs stands, and the
+    # rollback hands back the seat this call just took.
+    current = _reservation(slot_id, user_id)
+    if current is not None and current.status != CANCELLED:
+        db.session.rollback()
+        return _reservation(slot_id, user_id)
+
+    if current is not None:
+        # Rebooking after a cancellation reuses the row (one per member per slot)
+        reservation = current
+        reservation.status = status
+        reservation.created_at = datetime.utcnow()
+    else:
+        reservation = SlotReservation(slot_id=slot_id, user_id=user_id, status=status)
+        db.session.add(reservation)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The same member's other request won the race; theirs stands, ours never happened
+        db.session.rollback()
+        return _reservation(slot_id, user_id)
+    return reservation
+
+
+def cancel_reservation(slot_id, user_id):
+    """Cancel a member's seat or waitlist place.
+
+    A freed seat goes straight to the longest-waiting member, so seats_taken
+    only drops when nobody is waiting. Returns the promoted reservation, if any.
+    """
+    _lock_slot(slot_id)
+    reservation = _reservation(slot_id, user_id)
+    if reservation is None or reservation.status == CANCELLED:
+        db.session.rollback()
+        raise SlotError('You have no reservation for this class.')
+
+    promoted = None
+    if reservation.status == RESERVED:
+        promoted = db.session.scalar(
+            select(SlotReservation)
+            .where(SlotReservation.slot_id == slot_id, SlotReservation.status == WAITLISTED)
+            .order_by(SlotReservation.created_at, SlotReservation.id)
+            .limit(1))
+        if promoted is not None:
+            promoted.status = RESERVED
+        else:
+            db.session.execute(
+                update(ClassSlot)
+                .where(ClassSlot.id == slot_id, ClassSlot.seats_taken > 0)
+                .values(seats_taken=ClassSlot.seats_taken - 1)
+                .execution_options(synchronize_session=False))
+    reservation.status = CANCELLED
+    db.session.commit()
+    return promoted
+
+
+def waitlist_position(reservation):
+    if reservation.status != WAITLISTED:
+        return None
+    ahead = db.session.scalar(
+        select(db.func.count())
+        .select_from(SlotReservation)
+        .where(SlotReservation.slot_id == reservation.slot_id,
+               SlotReservation.status == WAITLISTED,
+               (SlotReservation.created_at < reservation.created_at)
+               | ((SlotReservation.created_at == reservation.created_at) & (SlotReservation.id < reservation.id))))
+    return ahead + 1
+
+
+def upcoming_slots(package_id=None, now=None, limit=50):
+    query = ClassSlot.query.filter(ClassSlot.starts_at >= (now or datetime.utcnow()))
+    if package_id:
+        query = query.filter(ClassSlot.package_id == package_id)
+    return query.order_by(ClassSlot.starts_at, ClassSlot.id).limit(limit).all()
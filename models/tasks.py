@@ -0,0 +1,139 @@
+import logging
+import os
+import smtplib
+import tempfile
+from email.message import EmailMessage
+from flask import current_app
+from extensions import db
+from sqlalchemy import select
+from sqlalchemy.orm import joinedload
+from models.model import Booking, Inquiry
+from models.jobs import job, enqueue, HIGH_PRIORITY, LOW_PRIORITY
+from models.reports import REPORT_FORMATS, parse_report_date
+from services.replicas import replica_reads
+
+
+logger = logging.getLogger(__name__)
+
+
+def send_email(to, subject, body):
+    # Without MAIL_SERVER configured messages are only logged, which keeps
+    # development and the benchmarks free of SMTP.
+    server = current_app.config.get('MAIL_SERVER')
+    if not server:
+        logger.info('Email to %s: %s', to, subject)
+        return
+    message = EmailMessage()
+    message['From'] = current_app.config.get('MAIL_DEFAULT_SENDER', 'no-reply@localhost')
+    message['To'] = to
+    message['Subject'] = subject
+    message.set_content(body)
+    with smtplib.SMTP(server, current_app.config.get('MAIL_PORT', 25), timeout=30) as smtp:
+        if current_app.config.get('MAIL_USE_TLS'):
+            smtp.starttls()
+        if current_app.config.get('MAIL_USERNAME'):
+            smtp.login(current_app.config['MAIL_USERNAME'], current_app.config.get('MAIL_PASSWORD', ''))
+        smtp.send_message(message)
+
+
+@job('process_inquiry', priority=HIGH_PRIORITY)
+def process_inquiry(name, email, message):
+    # Stored once, with the emails queued in the same transaction: an SMTP
+    # failure retries only the sending, never the insert.
+    inquiry = Inquiry(name=name, email=email, message=message)
+    db.session.add(inquiry)
+    db.session.flush()
+    enqueue('send_inquiry_emails', {'inquiry_id': inquiry.id})
+    db.session.commit()
+
+
+@job('send_inquiry_emails', priority=HIGH_PRIORITY)
+def send_inquiry_emails(inquiry_id):
+    inquiry = db.session.get(Inquiry, inquiry_id)
+    if inquiry is None:
+        return
+    send_email(inquiry.email, 'We received your inquiry',
+               f'Hi {inquiry.name},\n\nThanks for getting in touch. We will reply shortly.\n')
+    staff = current_app.config.get('INQUIRY_NOTIFY_EMAIL')
+    if staff:
+        send_email(staff, f'New inquiry from {inquiry.name}',
+                   f'{inquiry.name} <{inquiry.email}> wrote:\n\n{inquiry.message}\n')
+
+
+@job('send_booking_confirmation')
+def send_booking_confirmation(booking_id):
+    booking = db.session.get(Booking, booking_id)
+    if booking is None:
+        return
+    send_email(booking.user.email, 'Your booking is confirmed',
+               f'Hi {booking.user.username},\n\nYour booking #{booking.id} for {booking.package.name} '
+               f'on {booking.booking_date:%Y-%m-%d} is {booking.status}.\n')
+
+
+def _bookings_with_members(booking_ids):
+    return db.session.scalars(select(Booking).where(Booking.id.in_(booking_ids))
+                              .options(joinedload(Booking.user), joinedload(Booking.package))).all()
+
+
+@job('send_expiry_notices', priority=LOW_PRIORITY)
+def send_expiry_notices(booking_ids):
+    for booking in _bookings_with_members(booking_ids):
+        send_email(booking.user.email, 'Your membership has expired',
+                   f'Hi {booking.user.username},\n\nYour {booking.package.name} membership ended on '
+                   f'{booking.expires_at:%Y-%m-%d}. You can renew it from your booking history.\n')
+
+
+@job('send_renewal_reminders', priority=LOW_PRIORITY)
+def send_renewal_reminders(booking_ids):
+    for booking in _bookings_with_members(booking_ids):
+        send_email(booking.user.email, 'Your membership is about to expire',
+                   f'Hi {booking.user.username},\n\nYour {booking.package.name} membership expires on '
+                   f'{booking.expires_at:%Y-%m-%d}. Renew it from your booking history to keep training.\n')
+
+
+def report_directory():
+    directory = current_app.config.get('REPORTS_DIR') or os.path.join(current_app.instance_path, 'reports')
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def report_filename(start_date, end_date, export_format):
+    return f'bookings_{start_date}_{end_date}.{export_format}'
+
+
+@job('build_report', max_attempts=3, priority=LOW_PRIORITY)
+def build_report(start_date, end_date, export_format='csv', notify=None):
+    start, end = parse_report_date(start_date), parse_report_date(end_date)
+    _, chunks = REPORT_FORMATS[export_format]
+    filename = report_filename(start, end, export_format)
+    directory = report_directory()
+    # Written under a temporary name of its own, so a half-built file is never
+    # served and two runs of the same report cannot write into each other
+    fd, partial = tempfile.mkstemp(prefix=filename + '.', suffix='.partial', dir=directory)
+    try:
+        with open(fd, 'w', newline='', encoding='utf-8') as out, replica_reads():
+            for chunk in chunks(start, end):
+                out.write(chunk)
+        os.replace(partial, os.path.join(directory, filename))
+    except BaseException:
+        os.unlink(partial)
+        raise
+    if notify:
+        send_email(notify, 'Your report is ready', f'{filename} is ready to download from the reports page.\n')
+
+
+@job('import_upload', max_attempts=3, priority=LOW_PRIORITY)
+def import_upload(kind, path, fmt, notify=None):
+    # Imported here: bcrypt and the importer are only needed by workers
+    from models.importer import import_file
+    result = import_file(kind, path, fmt)
+    logger.info('Import of %s finished: %s', path, result.summary())
+    if notify:
+        rejected = ''.join(f'  line {line_no}: {reason}\n' for line_no, reason in result.rejected[:20])
+        send_email(notify, 'Your import has finished', f'{result.summary()}\n{rejected}')
+
+
+@job('refresh_revenue_cube', max_attempts=3, priority=LOW_PRIORITY)
+def refresh_revenue_cube():
+    from models.analytics import refresh_cube
+    refresh_cube()
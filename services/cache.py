@@ -0,0 +1,363 @@
+import base64
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+
+MISSING = object()
+# Marks a JSON object that stands for a value JSON has no type for
+TYPE_TAG = '__cache_type__'
+
+
+class TTLCache:
+    """Thread-safe mapping whose entries expire after ``ttl`` seconds and
+    which evicts the least recently used entry beyond ``maxsize``.
+
+    Keys are tuples whose first item is a namespace (e.g. ``('packages',)``)
+    so a whole family of entries can be dropped with ``invalidate``.
+    """
+
+    def __init__(self, maxsize=256, ttl=300, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, MISSING)
+            if entry is not MISSING:
+                expires_at, value = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        expires_at = self.clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, ttl=None):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            # Loaded outside the lock: two threads may both load on a cold key,
+            # which is cheaper than serialising every miss behind one query.
+            value = loader()
+            self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, namespace):
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == namespace]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += 1
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+class CacheBackend:
+    """The subset of the Redis command set the app relies on. Values are bytes."""
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def incr(self, key):
+        raise NotImplementedError
+
+
+class MemoryBackend(CacheBackend):
+    # Single-process stand-in for tests and local runs.
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= self.clock():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, self.clock() + ttl if ttl else None)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._live(key) or 0) + 1
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+
+class SQLiteBackend(CacheBackend):
+    # Shared between every worker process on one host through a WAL-mode
+    # SQLite file; good enough for local multi-worker runs without Redis.
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS cache '
+                               '(key TEXT PRIMARY KEY, value BLOB, expires_at REAL)')
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connect().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, self.clock())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl=None):
+        self._connect().execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)',
+            (key, value, self.clock() + ttl if ttl else None))
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def incr(self, key):
+        connection = self._connect()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone()
+            value = int(row[0]) + 1 if row else 1
+            connection.execute('INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, NULL)',
+                               (key, str(value).encode()))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+
+class RedisBackend(CacheBackend):
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('CACHE_URL points at Redis but the redis package is not installed.')
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=int(ttl) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+def backend_from_url(url):
+    if url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f'Unsupported CACHE_URL {url!r}')
+
+
+def _tag(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    if isinstance(value, list):
+        return [_tag(item) for item in value]
+    if isinstance(value, tuple):
+        return {TYPE_TAG: 'tuple', 'items': [_tag(item) for item in value]}
+    if isinstance(value, dict):
+        if TYPE_TAG not in value and all(isinstance(key, str) for key in value):
+            return {key: _tag(item) for key, item in value.items()}
+        # Integer ids as keys, e.g. the active-member index
+        return {TYPE_TAG: 'dict', 'items': [[_tag(key), _tag(item)] for key, item in value.items()]}
+    if isinstance(value, datetime):
+        return {TYPE_TAG: 'datetime', 'value': value.isoformat()}
+    if isinstance(value, date):
+        return {TYPE_TAG: 'date', 'value': value.isoformat()}
+    if isinstance(value, bytes):
+        return {TYPE_TAG: 'bytes', 'value': base64.b64encode(value).decode('ascii')}
+    if isinstance(value, Decimal):
+        return {TYPE_TAG: 'decimal', 'value': str(value)}
+    raise TypeError(f'{type(value).__name__} values cannot be stored in the shared cache')
+
+
+def _untag(value):
+    if isinstance(value, list):
+        return [_untag(item) for item in value]
+    if not isinstance(value, dict):
+        return value
+    kind = value.get(TYPE_TAG)
+    if kind is None:
+        return {key: _untag(item) for key, item in value.items()}
+    if kind == 'tuple':
+        return tuple(_untag(item) for item in value['items'])
+    if kind == 'dict':
+        return {_untag(key): _untag(item) for key, item in value['items']}
+    if kind == 'datetime':
+        return datetime.fromisoformat(value['value'])
+    if kind == 'date':
+        return date.fromisoformat(value['value'])
+    if kind == 'bytes':
+        return base64.b64decode(value['value'])
+    if kind == 'decimal':
+        return Decimal(value['value'])
+    raise ValueError(f'Unknown cached type {kind!r}')
+
+
+def dumps(value):
+    # JSON, never pickle: whoever can write to Redis or the cache file must
+    # not be able to run code in the workers that read it back
+    return json.dumps(_tag(value), separators=(',', ':')).encode()
+
+
+def loads(raw):
+    return _untag(json.loads(raw))
+
+
+class VersionedCache:
+    """Two-level cache that stays consistent across worker processes.
+
+    Every namespace has a version number in the shared backend and every key
+    is stored under the version it was loaded at. ``invalidate`` bumps the
+    version, so all workers stop seeing the old entries on their next read
+    without having to be told; stale entries simply age out.
+    Lookups go local TTL/LRU cache -> shared backend -> loader.
+    """
+
+    def __init__(self, backend, maxsize=256, ttl=300, prefix='gym:'):
+        self.backend = backend
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.prefix = prefix
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    @property
+    def ttl(self):
+        return self.local.ttl
+
+    @ttl.setter
+    def ttl(self, value):
+        self.local.ttl = value
+
+    @property
+    def maxsize(self):
+        return self.local.maxsize
+
+    @maxsize.setter
+    def maxsize(self, value):
+        self.local.maxsize = value
+
+    def version(self, namespace):
+        raw = self.backend.get(f'{self.prefix}version:{namespace}')
+        return int(raw) if raw else 0
+
+    def _shared_key(self, key, version):
+        return f'{self.prefix}{key[0]}:{version}:{":".join(map(str, key[1:]))}'
+
+    def get_or_load(self, key, loader, ttl=None):
+        version = self.version(key[0])
+        local_key = (key[0], version) + tuple(key[1:])
+        value = self.local.get(local_key, MISSING)
+        if value is not MISSING:
+            return value
+
+        shared_key = self._shared_key(key, version)
+        raw = self.backend.get(shared_key)
+        value = MISSING
+        if raw is not None:
+            try:
+                value = loads(raw)
+                self.shared_hits += 1
+            except ValueError:
+                # Not ours (or written by an older release): load it afresh
+                pass
+        if value is MISSING:
+            self.shared_misses += 1
+            value = loader()
+            self.backend.set(shared_key, dumps(value), ttl or self.local.ttl)
+        self.local.set(local_key, value, ttl)
+        return value
+
+    def invalidate(self, namespace):
+        self.backend.incr(f'{self.prefix}version:{namespace}')
+        return self.local.invalidate(namespace)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        stats = self.local.stats()
+        stats.update(backend=type(self.backend).__name__,
+                     shared_hits=self.shared_hits,
+                     shared_misses=self.shared_misses)
+        return stats
@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+
+
+DEFAULT_ROUNDS = 12
+_COST = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool already has its maximum of queued work."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed or non-bcrypt hash stored for this account
+        return False
+
+
+class PasswordHasher:
+    """Runs bcrypt in a small process pool so a burst of logins cannot tie up
+    the request threads, and refuses work beyond ``max_pending`` queued calls
+    rather than letting latency grow without bound.
+    """
+
+    def __init__(self, rounds=DEFAULT_ROUNDS, workers=2, max_pending=16, timeout=10):
+        self.configure(rounds, workers, max_pending, timeout)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def configure(self, rounds=DEFAULT_ROUNDS, workers=2, max_pending=16, timeout=10):
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def _pool(self):
+        # Created on first use, in the process that uses it: an executor made
+        # before gunicorn forks its workers would be shared and broken.
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _discard(self, executor):
+        # A pool whose child process died (OOM kill, segfault) fails every
+        # later call; drop it so the next one starts a fresh pool
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _retrying(self, call):
+        # One retry on a fresh pool; a second break is a real problem
+        for attempt in range(2):
+            executor = self._pool()
+            try:
+                return call(executor)
+            except BrokenProcessPool:
+                self._discard(executor)
+                if attempt:
+                    raise
+
+    def _submit(self, executor, fn, *args):
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HashingBusy()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            slots.release()
+            raise
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            raise HashingBusy()
+
+    def _run(self, fn, *args):
+        return self._retrying(lambda executor: self._submit(executor, fn, *args))
+
+    def hash(self, password):
+        return self._run(_hash, password, self.rounds)
+
+    def verify(self, password_hash, password):
+        return self._run(_verify, password_hash, password)
+
+    def hash_many(self, passwords, chunksize=16):
+        # Batch path for imports: spreads the work over every pool process and
+        # is not subject to the request queue limit.
+        return self._retrying(lambda executor: list(
+            executor.map(_hash, passwords, [self.rounds] * len(passwords), chunksize=chunksize)))
+
+    def needs_rehash(self, password_hash):
+        match = _COST.match(password_hash or '')
+        return match is None or int(match.group(1)) != self.rounds
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hasher = PasswordHasher()
+
+
+def configure_hasher(app):
+    hasher.configure(rounds=app.config.get('BCRYPT_LOG_ROUNDS', DEFAULT_ROUNDS),
+                     workers=app.config.get('HASH_WORKERS', 2),
+                     max_pending=app.config.get('HASH_MAX_PENDING', 16),
+                     timeout=app.config.get('HASH_TIMEOUT', 10))
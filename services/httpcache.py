@@ -0,0 +1,113 @@
+import hashlib
+import os
+import time
+from functools import wraps
+from urllib.parse import urlencode
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from werkzeug.http import http_date
+
+
+class _Uncacheable(Exception):
+
+    def __init__(self, response):
+        self.response = response
+
+
+def build_id(app):
+    # Changes whenever a template changes, so a deploy invalidates every
+    # ETag, but is the same in every worker process of one deploy.
+    if app.config.get('PAGE_CACHE_BUILD_ID'):
+        return app.config['PAGE_CACHE_BUILD_ID']
+    digest = hashlib.sha1()
+    for root, _, files in sorted(os.walk(os.path.join(app.root_path, app.template_folder))):
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(f'{path}:{os.stat(path).st_mtime_ns}'.encode())
+    return digest.hexdigest()[:12]
+
+
+def cache_control(response, max_age, public=True, stale_while_revalidate=None):
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.cache_control.max_age = max_age
+    if stale_while_revalidate:
+        response.cache_control['stale-while-revalidate'] = str(stale_while_revalidate)
+    return response
+
+
+def _personalised():
+    # Signed-in users and pending flash messages change what a page shows
+    return current_user.is_authenticated or bool(session.get('_flashes'))
+
+
+def _page_key(query_args):
+    # Only the listed query arguments select a different page; anything else
+    # (tracking parameters, cache busters) maps to the same entry and ETag
+    args = [(name, value) for name in sorted(query_args) for value in request.args.getlist(name)]
+    return f'{request.endpoint}:{request.path}?{urlencode(args)}'
+
+
+def cached_page(cache, namespaces=(), max_age=300, stale_while_revalidate=None, query_args=()):
+    """Serve a view's anonymous responses from ``cache`` with HTTP validators.
+
+    The ETag is built from the template build id and the current version of
+    each cache namespace the page depends on, so a conditional GET can be
+    answered with 304 before the view, the cache body or the database is
+    touched. Changing any listed namespace (invalidate_reference_data)
+    changes the ETag and drops the cached body. Pages are keyed on the path
+    and the ``query_args`` the view actually reads.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or _personalised():
+                response = make_response(view(*args, **kwargs))
+                response.cache_control.private = True
+                response.cache_control.no_cache = True
+                return response
+
+            versions = '.'.join(str(cache.version(namespace)) for namespace in namespaces)
+            page = _page_key(query_args)
+            etag = hashlib.sha1(f'{current_app.config["PAGE_CACHE_BUILD_ID"]}:{versions}:{page}'
+                                .encode()).hexdigest()[:20]
+            if etag in request.if_none_match:
+                response = current_app.response_class(status=304)
+                response.set_etag(etag)
+                response.vary.add('Cookie')
+                return cache_control(response, max_age, stale_while_revalidate=stale_while_revalidate)
+
+            def render():
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    raise _Uncacheable(response)
+                return {'body': response.get_data(), 'mimetype': response.mimetype,
+                        'last_modified': time.time()}
+
+            try:
+                # Keyed on the ETag, which already includes the namespace versions
+                entry = cache.get_or_load(('pages', etag), render, ttl=current_app.config.get('PAGE_CACHE_TTL'))
+            except _Uncacheable as uncacheable:
+                return uncacheable.response
+            response = current_app.response_class(entry['body'], mimetype=entry['mimetype'])
+            response.set_etag(etag)
+            response.headers['Last-Modified'] = http_date(entry['last_modified'])
+            response.vary.add('Cookie')
+            cache_control(response, max_age, stale_while_revalidate=stale_while_revalidate)
+            # Handles If-Modified-Since (and Range) against the cached validators
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+def cached_fragment(cache, namespace, name, render, *key):
+    # Rendered HTML for part of a page, dropped when ``namespace`` is invalidated
+    return cache.get_or_load((namespace, 'fragment', name) + key, render,
+                             ttl=current_app.config.get('PAGE_CACHE_TTL'))
+
+
+def configure_page_cache(app):
+    app.config.setdefault('PAGE_CACHE_TTL', 3600)
+    app.config['PAGE_CACHE_BUILD_ID'] = build_id(app)
@@ -0,0 +1,51 @@
+import importlib
+import click
+
+
+def _resolve(import_path):
+    module, _, attribute = import_path.partition(':')
+    return getattr(importlib.import_module(module), attribute)
+
+
+class LazyGroup(click.Group):
+    """A CLI group whose module is only imported when one of its commands runs.
+
+    ``flask --help`` and every unrelated command (``flask db upgrade``) skip
+    the import, and with it whatever that module pulls in.
+    """
+
+    def __init__(self, name, import_path, help=None):
+        super().__init__(name, help=help)
+        self.import_path = import_path
+        self._group = None
+
+    def _load(self):
+        if self._group is None:
+            self._group = _resolve(self.import_path)
+        return self._group
+
+    def list_commands(self, ctx):
+        return self._load().list_commands(ctx)
+
+    def get_command(self, ctx, name):
+        return self._load().get_command(ctx, name)
+
+
+class LazyCommand(click.Command):
+    """Same as LazyGroup, for a single command."""
+
+    def __init__(self, name, import_path, help=None):
+        super().__init__(name, help=help)
+        self.import_path = import_path
+        self._command = None
+
+    def _load(self):
+        if self._command is None:
+            self._command = _resolve(self.import_path)
+        return self._command
+
+    def get_params(self, ctx):
+        return self._load().get_params(ctx)
+
+    def invoke(self, ctx):
+        return self._load().invoke(ctx)
@@ -0,0 +1,120 @@
+import logging
+import threading
+import time
+from sqlalchemy.pool import QueuePool
+
+
+logger = logging.getLogger(__name__)
+
+SLOW_CHECKOUT_MS = 100
+
+
+class PoolMetrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.slow_checkouts = 0
+        self.timeouts = 0
+        self.connects = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.total_hold_ms = 0.0
+        self.max_hold_ms = 0.0
+        self.checkins = 0
+
+    def record_wait(self, wait_ms, slow):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.slow_checkouts += slow
+
+    def record_hold(self, hold_ms):
+        with self._lock:
+            self.checkins += 1
+            self.total_hold_ms += hold_ms
+            self.max_hold_ms = max(self.max_hold_ms, hold_ms)
+
+    def record(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'checkouts': self.checkouts,
+                'slow_checkouts': self.slow_checkouts,
+                'timeouts': self.timeouts,
+                'connects': self.connects,
+                'avg_wait_ms': round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                'max_wait_ms': round(self.max_wait_ms, 3),
+                'avg_hold_ms': round(self.total_hold_ms / self.checkins, 3) if self.checkins else 0.0,
+                'max_hold_ms': round(self.max_hold_ms, 3),
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times how long callers wait for a connection and how
+    long they hold it.
+
+    SQLAlchemy's pool events fire only once a connection has been handed
+    out, so the wait itself is measured around ``_do_get``.
+    """
+
+    slow_checkout_ms = SLOW_CHECKOUT_MS
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        # engine.dispose() swaps in a fresh pool; keep counting into the same metrics
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        pool.slow_checkout_ms = self.slow_checkout_ms
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except Exception:
+            self.metrics.record('timeouts')
+            logger.warning('Connection pool checkout failed after %.0f ms (%s)',
+                           (time.perf_counter() - started) * 1000, self.status())
+            raise
+        checked_out_at = time.perf_counter()
+        wait_ms = (checked_out_at - started) * 1000
+        slow = wait_ms >= self.slow_checkout_ms
+        self.metrics.record_wait(wait_ms, slow)
+        if slow:
+            logger.warning('Slow connection pool checkout: waited %.0f ms (%s)', wait_ms, self.status())
+        record.info['checked_out_at'] = checked_out_at
+        return record
+
+    def _do_return_conn(self, record):
+        checked_out_at = record.info.pop('checked_out_at', None)
+        if checked_out_at is not None:
+            self.metrics.record_hold((time.perf_counter() - checked_out_at) * 1000)
+        super()._do_return_conn(record)
+
+    def _create_connection(self):
+        self.metrics.record('connects')
+        return super()._create_connection()
+
+
+def configure_pool_metrics(app, engine):
+    if isinstance(engine.pool, InstrumentedQueuePool):
+        engine.pool.slow_checkout_ms = app.config.get('DB_SLOW_CHECKOUT_MS', SLOW_CHECKOUT_MS)
+
+
+def pool_stats(engine):
+    pool = engine.pool
+    stats = {'pool_class': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(size=pool.size(), checked_in=pool.checkedin(),
+                     checked_out=pool.checkedout(), overflow=pool.overflow())
+    if isinstance(pool, InstrumentedQueuePool):
+        stats.update(pool.metrics.snapshot())
+    return stats
@@ -0,0 +1,154 @@
+import logging
+import threading
+import time
+from collections import Counter
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+logger = logging.getLogger(__name__)
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_ms = 0.0
+        self.render_ms = 0.0
+        self.total_ms = 0.0
+        self.max_total_ms = 0.0
+        self.with_duplicates = 0
+
+    def add(self, profile, total_ms):
+        self.requests += 1
+        self.queries += profile.query_count
+        self.max_queries = max(self.max_queries, profile.query_count)
+        self.db_ms += profile.db_ms
+        self.render_ms += profile.render_ms
+        self.total_ms += total_ms
+        self.max_total_ms = max(self.max_total_ms, total_ms)
+        self.with_duplicates += bool(profile.duplicates())
+
+    def as_dict(self):
+        n = self.requests or 1
+        return {
+            'requests': self.requests,
+            'avg_queries': round(self.queries / n, 2),
+            'max_queries': self.max_queries,
+            'avg_db_ms': round(self.db_ms / n, 3),
+            'avg_render_ms': round(self.render_ms / n, 3),
+            'avg_total_ms': round(self.total_ms / n, 3),
+            'max_total_ms': round(self.max_total_ms, 3),
+            'requests_with_duplicate_queries': self.with_duplicates,
+        }
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.statements = Counter()
+        self.query_count = 0
+        self.db_ms = 0.0
+        self.render_ms = 0.0
+        self._render_started = []
+
+    def duplicates(self, threshold=2):
+        # The same SQL text run again and again in one request is the N+1 signature
+        return {statement: count for statement, count in self.statements.items() if count >= threshold}
+
+
+class PerfRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, endpoint, profile, total_ms):
+        with self._lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()).add(profile, total_ms)
+
+    def snapshot(self):
+        with self._lock:
+            return {endpoint: stats.as_dict() for endpoint, stats in sorted(self.endpoints.items())}
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
+
+
+perf_registry = PerfRegistry()
+
+
+def current_profile():
+    if has_request_context():
+        return g.get('_sql_profile')
+    return None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_profile() is not None:
+        conn.info.setdefault('_profile_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = current_profile()
+    started = conn.info.get('_profile_started')
+    if profile is None or not started:
+        return
+    profile.db_ms += (time.perf_counter() - started.pop()) * 1000
+    profile.query_count += 1
+    profile.statements[statement] += 1
+
+
+def _before_render(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None:
+        profile._render_started.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    profile = current_profile()
+    if profile is not None and profile._render_started:
+        profile.render_ms += (time.perf_counter() - profile._render_started.pop()) * 1000
+
+
+def _start_profile():
+    g._sql_profile = RequestProfile()
+
+
+def _finish_profile(response):
+    profile = g.pop('_sql_profile', None)
+    if profile is None:
+        return response
+    total_ms = (time.perf_counter() - profile.started) * 1000
+    endpoint = request.endpoint or request.path
+    perf_registry.record(endpoint, profile, total_ms)
+
+    duplicates = profile.duplicates()
+    response.headers['X-DB-Queries'] = str(profile.query_count)
+    response.headers['X-DB-Time-ms'] = f'{profile.db_ms:.2f}'
+    response.headers['X-Render-Time-ms'] = f'{profile.render_ms:.2f}'
+    response.headers['X-DB-Duplicate-Queries'] = str(sum(duplicates.values()) - len(duplicates))
+    logger.info('%s %s queries=%d db_ms=%.2f render_ms=%.2f total_ms=%.2f duplicates=%d',
+                request.method, endpoint, profile.query_count, profile.db_ms,
+                profile.render_ms, total_ms, len(duplicates))
+    for statement, count in sorted(duplicates.items(), key=lambda item: -item[1])[:3]:
+        logger.warning('%s ran the same query %d times: %s', endpoint, count, ' '.join(statement.split())[:200])
+    return response
+
+
+def init_profiling(app):
+    if not app.config.get('SQL_PROFILING'):
+        return
+    # Listening on the Engine class covers every engine the app creates
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+    app.before_request(_start_profile)
+    app.after_request(_finish_profile)
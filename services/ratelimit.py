@@ -0,0 +1,228 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request
+
+
+class RateLimited(Exception):
+    """Raised when a request exceeds one of its rate limits."""
+
+    def __init__(self, limit, retry_after):
+        super().__init__(f'Rate limit {limit} exceeded')
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+# Every store implements GCRA, a token bucket kept as a single number per
+# key: the "theoretical arrival time" (tat) of the next request. A hit costs
+# one read and one write whatever the window, so checks are O(1) in time
+# and space. ``interval`` is seconds per token, ``burst`` the bucket size.
+
+def _gcra(tat, now, interval, burst):
+    tat = max(tat or now, now)
+    allow_at = tat + interval - burst * interval
+    if now < allow_at:
+        return False, tat, allow_at - now
+    return True, tat + interval, 0.0
+
+
+class MemoryRateStore:
+    """Per-process buckets; limits are per worker rather than global."""
+
+    def __init__(self, maxsize=100000, clock=time.time):
+        self.maxsize = maxsize
+        self.clock = clock
+        self._tats = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hit(self, key, interval, burst):
+        now = self.clock()
+        with self._lock:
+            allowed, tat, retry_after = _gcra(self._tats.get(key), now, interval, burst)
+            if allowed:
+                self._tats[key] = tat
+                self._tats.move_to_end(key)
+                while len(self._tats) > self.maxsize:
+                    # Oldest buckets are the ones that have refilled the longest
+                    self._tats.popitem(last=False)
+            return allowed, retry_after
+
+    def clear(self):
+        with self._lock:
+            self._tats.clear()
+
+
+class SQLiteRateStore:
+    """Buckets shared by every process on one host through a small SQLite file."""
+
+    def __init__(self, path, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('CREATE TABLE IF NOT EXISTS rate_limits (key TEXT PRIMARY KEY, tat REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def hit(self, key, interval, burst):
+        connection = self._connect()
+        now = self.clock()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tat FROM rate_limits WHERE key = ?', (key,)).fetchone()
+            allowed, tat, retry_after = _gcra(row[0] if row else None, now, interval, burst)
+            if allowed:
+                connection.execute('INSERT OR REPLACE INTO rate_limits (key, tat) VALUES (?, ?)', (key, tat))
+            if int(now) % 60 == 0:
+                connection.execute('DELETE FROM rate_limits WHERE tat < ?', (now,))
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        return allowed, retry_after
+
+    def clear(self):
+        self._connect().execute('DELETE FROM rate_limits')
+
+
+# KEYS[1] = bucket; ARGV = now, interval, burst. Runs atomically in Redis.
+_GCRA_SCRIPT = '''
+local now = tonumber(ARGV[1])
+local interval = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then tat = now end
+local allow_at = tat + interval - burst * interval
+if now < allow_at then
+  return {0, tostring(allow_at - now)}
+end
+redis.call('SET', KEYS[1], tostring(tat + interval), 'PX', math.ceil((tat + interval - now) * 1000))
+return {1, '0'}
+'''
+
+
+class RedisRateStore:
+    """Buckets shared by every process and host through Redis."""
+
+    def __init__(self, url, prefix='gym:rate:', clock=time.time):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError('RATELIMIT_STORAGE_URL points at Redis but the redis package is not installed.')
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(_GCRA_SCRIPT)
+        self.prefix = prefix
+        self.clock = clock
+
+    def hit(self, key, interval, burst):
+        allowed, retry_after = self.script(keys=[self.prefix + key], args=[self.clock(), interval, burst])
+        return bool(allowed), float(retry_after)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def rate_store_from_url(url):
+    if not url or url.startswith('memory://'):
+        return MemoryRateStore()
+    if url.startswith('sqlite:///'):
+        return SQLiteRateStore(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisRateStore(url)
+    raise ValueError(f'Unsupported RATELIMIT_STORAGE_URL {url!r}')
+
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_rate(rate):
+    # '5/minute' or '5/10 minutes' -> (count, seconds)
+    count, _, period = rate.partition('/')
+    parts = period.split()
+    multiplier = int(parts[0]) if len(parts) == 2 else 1
+    return int(count), multiplier * _PERIODS[parts[-1].rstrip('s')]
+
+
+class RateLimiter:
+
+    def __init__(self, store=None):
+        self.store = store or MemoryRateStore()
+        self.enabled = True
+        self.limits = {}
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def configure(self, store=None, enabled=True, limits=None):
+        if store is not None:
+            self.store = store
+        self.enabled = enabled
+        self.limits.update(limits or {})
+
+    def _count(self, name, outcome):
+        with self._stats_lock:
+            stats = self._stats.setdefault(name, {'allowed': 0, 'rejected': 0})
+            stats[outcome] += 1
+
+    def check(self, name, key, default_rate):
+        """Take one token from ``name``'s bucket for ``key`` or raise RateLimited.
+
+        The rate comes from RATE_LIMITS[name] when configured, so deployments
+        can tune limits without code changes. An empty key is not limited.
+        """
+        if not self.enabled or not key:
+            return
+        rate = self.limits.get(name, default_rate)
+        count, seconds = parse_rate(rate)
+        allowed, retry_after = self.store.hit(f'{name}:{key}', seconds / count, count)
+        self._count(name, 'allowed' if allowed else 'rejected')
+        if not allowed:
+            raise RateLimited(f'{name} ({rate})', retry_after)
+
+    def stats(self):
+        with self._stats_lock:
+            stats = {name: dict(counts) for name, counts in self._stats.items()}
+        return {'enabled': self.enabled, 'store': type(self.store).__name__,
+                'limits': dict(self.limits), 'counts': stats}
+
+
+limiter = RateLimiter()
+
+
+def client_ip():
+    # Behind a proxy this is the client only with TRUSTED_PROXIES set (ProxyFix)
+    return request.remote_addr or 'unknown'
+
+
+def form_value(field):
+    def key():
+        return (request.form.get(field) or '').strip().lower()
+    return key
+
+
+def rate_limit(name, rate, key=client_ip, methods=('POST',)):
+    """Limit a view to ``rate`` requests (e.g. '5/minute') per ``key()``.
+
+    Stack the decorator to limit by several keys, such as IP and account.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method in methods:
+                limiter.check(name, key(), rate)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def configure_rate_limits(app):
+    limiter.configure(store=rate_store_from_url(app.config.get('RATELIMIT_STORAGE_URL')),
+                      enabled=app.config.get('RATELIMIT_ENABLED', True),
+                      limits=app.config.get('RATE_LIMITS'))
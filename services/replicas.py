@@ -0,0 +1,267 @@
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from flask import has_request_context, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event, text
+
+
+logger = logging.getLogger(__name__)
+
+# Keys in Session.info
+READ_REPLICA = 'read_replica'
+WROTE = 'wrote'
+# The replica (or None for the primary) the session's reads stay on
+PINNED = 'replica_pinned'
+# Key in the signed cookie session: when the user last committed a write
+LAST_WRITE_AT = '_db_write_at'
+
+# How far a replica is behind, run on the replica itself. On an Always On
+# secondary last_commit_time is the primary's time of the last redone commit,
+# so an idle primary also reads as lag; that only sends reads back to the
+# primary while it has nothing else to do.
+LAG_QUERIES = {
+    'mssql': ('SELECT DATEDIFF(SECOND, last_commit_time, GETDATE()) FROM sys.dm_hadr_database_replica_states '
+              'WHERE is_local = 1 AND database_id = DB_ID()'),
+}
+
+
+class Replica:
+
+    def __init__(self, name, engine, lag_query=None):
+        self.name = name
+        self.engine = engine
+        self.lag_query = lag_query if lag_query is not None else LAG_QUERIES.get(engine.dialect.name)
+        self.lag = 0.0
+        self.healthy = True
+        self.checked_at = None
+        self.error = None
+        self.reads = 0
+
+    def probe(self):
+        # Seconds behind the primary; without a lag query (SQLite files) the
+        # replica is taken to be current and only the sticky window applies.
+        if not self.lag_query:
+            return 0.0
+        with self.engine.connect() as connection:
+            lag = connection.execute(text(self.lag_query)).scalar()
+        return float(lag or 0)
+
+    def refresh(self, clock):
+        try:
+            self.lag = self.probe()
+            self.healthy, self.error = True, None
+        except Exception as error:
+            # Unreachable or not a replica any more: read from the primary until the next check
+            logger.warning('Read replica %s failed its lag check: %s', self.name, error)
+            self.healthy, self.error = False, str(error)
+        self.checked_at = clock()
+
+    def snapshot(self):
+        return {'name': self.name, 'url': self.engine.url.render_as_string(hide_password=True),
+                'healthy': self.healthy, 'lag_seconds': self.lag, 'error': self.error, 'reads': self.reads}
+
+
+class ReplicaRouter:
+    """Chooses a replica for reads that are allowed to be slightly stale.
+
+    A replica is used only when it passed its last lag check, is at most
+    ``max_lag`` seconds behind, and is further behind than the current
+    user's last write, so a member sees their own booking straight away.
+    Otherwise the read falls back to the primary. Lag is probed by a
+    background thread; a request never waits on a replica's connect.
+    """
+
+    def __init__(self):
+        self.replicas = []
+        self.enabled = False
+        self.max_lag = 30
+        self.check_interval = 5
+        self.sticky_seconds = 10
+        self.clock = time.time
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        self._prober = None
+        self._prober_pid = None
+        self._stop = threading.Event()
+        self._counts = {'primary_reads': 0, 'replica_reads': 0, 'sticky_reads': 0, 'fallback_reads': 0}
+
+    def configure(self, replicas, max_lag=30, check_interval=5, sticky_seconds=10):
+        self._stop.set()
+        for replica in self.replicas:
+            replica.engine.dispose()
+        self.replicas = list(replicas)
+        self.enabled = bool(self.replicas)
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.sticky_seconds = sticky_seconds
+        self._stop = threading.Event()
+        self._prober = None
+
+    def _count(self, name, replica=None):
+        with self._lock:
+            self._counts[name] += 1
+            if replica is not None:
+                replica.reads += 1
+
+    def probe_all(self):
+        for replica in self.replicas:
+            replica.refresh(self.clock)
+
+    def _probe_loop(self, stop):
+        while True:
+            self.probe_all()
+            if stop.wait(self.check_interval):
+                return
+
+    def _ensure_prober(self):
+        # Started on first use in each process: a thread started before
+        # gunicorn forks does not exist in the workers.
+        if self._prober is not None and self._prober_pid == os.getpid():
+            return
+        with self._lock:
+            if self._prober is None or self._prober_pid != os.getpid():
+                self._prober = threading.Thread(target=self._probe_loop, args=(self._stop,),
+                                                name='replica-lag-probe', daemon=True)
+                self._prober_pid = os.getpid()
+                self._prober.start()
+
+    def _available(self, now, since_write):
+        available = []
+        for replica in self.replicas:
+            # Not probed yet, or the prober is stuck on it: not known to be current
+            if replica.checked_at is None or now - replica.checked_at > 3 * self.check_interval:
+                continue
+            if not replica.healthy or replica.lag > self.max_lag:
+                continue
+            if since_write is not None and since_write <= max(replica.lag, self.sticky_seconds):
+                continue
+            available.append(replica)
+        return available
+
+    def choose(self, last_write_at=None):
+        self._ensure_prober()
+        now = self.clock()
+        since_write = now - last_write_at if last_write_at else None
+        available = self._available(now, since_write)
+        if not available:
+            if since_write is not None and since_write <= self.sticky_seconds:
+                self._count('sticky_reads')
+            else:
+                self._count('fallback_reads')
+            return None
+        return available[next(self._next) % len(available)]
+
+    def count_replica_read(self, replica):
+        self._count('replica_reads', replica)
+
+    def count_primary_read(self):
+        self._count('primary_reads')
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        return dict(counts, enabled=self.enabled, max_lag_seconds=self.max_lag,
+                    sticky_seconds=self.sticky_seconds,
+                    replicas=[replica.snapshot() for replica in self.replicas])
+
+
+router = ReplicaRouter()
+
+
+def _last_write_at():
+    return http_session.get(LAST_WRITE_AT) if has_request_context() else None
+
+
+class RoutingSession(Session):
+    """Session that sends SELECTs to a read replica when asked to.
+
+    Reads go to a replica only inside a replica_reads() block or a
+    @read_replica view, and only until the transaction writes: flushes,
+    INSERT/UPDATE/DELETE statements and every read after them stay on the
+    primary so the transaction sees its own changes. The replica is chosen
+    once per transaction, so a page, its count and its lazy loads all see
+    the same point in time.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and router.enabled and self.info.get(READ_REPLICA):
+            if self._flushing or getattr(clause, 'is_dml', False):
+                self.info[WROTE] = True
+            elif getattr(clause, 'is_select', False):
+                if not self.info.get(WROTE):
+                    if PINNED not in self.info:
+                        self.info[PINNED] = router.choose(_last_write_at())
+                    replica = self.info[PINNED]
+                    if replica is not None:
+                        router.count_replica_read(replica)
+                        return replica.engine
+                router.count_primary_read()
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _mark_write(session, flush_context):
+    session.info[WROTE] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _remember_write(session):
+    # The user's next requests read from the primary until the replicas have
+    # caught up with this commit (read-your-writes).
+    session.info.pop(PINNED, None)
+    if session.info.pop(WROTE, False) and router.enabled and has_request_context():
+        http_session[LAST_WRITE_AT] = router.clock()
+
+
+@event.listens_for(RoutingSession, 'after_rollback')
+def _forget_write(session):
+    session.info.pop(PINNED, None)
+    session.info.pop(WROTE, None)
+
+
+@contextmanager
+def replica_reads(session=None):
+    from extensions import db
+    session = session or db.session()
+    previous = session.info.get(READ_REPLICA)
+    session.info[READ_REPLICA] = True
+    try:
+        yield session
+    finally:
+        session.info[READ_REPLICA] = previous
+        if not previous:
+            session.info.pop(PINNED, None)
+
+
+def read_replica(view):
+    # Left on for the rest of the request, so a streamed response body (the
+    # report exports) is read from the replica as well. The request's
+    # session is removed at teardown.
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        from extensions import db
+        db.session().info[READ_REPLICA] = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def configure_replicas(app):
+    from config import engine_options
+    from services.pool import configure_pool_metrics
+    replicas = []
+    for number, url in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()):
+        options = engine_options(url)
+        if url.startswith('mssql'):
+            # Login timeout, so an unreachable replica does not hold up the lag prober
+            options['connect_args'] = {'timeout': app.config.get('REPLICA_CONNECT_TIMEOUT', 3)}
+        engine = create_engine(url, **options)
+        configure_pool_metrics(app, engine)
+        replicas.append(Replica(f'replica{number}', engine, app.config.get('REPLICA_LAG_QUERY')))
+    router.configure(replicas, max_lag=app.config.get('REPLICA_MAX_LAG_SECONDS', 30),
+                     check_interval=app.config.get('REPLICA_LAG_CHECK_SECONDS', 5),
+                     sticky_seconds=app.config.get('REPLICA_STICKY_SECONDS', 10))
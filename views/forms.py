@@ -0,0 +1,88 @@
+from flask_wtf import FlaskForm
+from wtforms import StringField, PasswordField, SubmitField, SelectField, DecimalField, IntegerField, HiddenField
+from wtforms.validators import DataRequired, Email, EqualTo, InputRequired, Length, NumberRange, StopValidation, ValidationError
+from models.model import User
+
+
+def finite(form, field):
+    # DecimalField takes 'NaN' and 'Infinity'; stop before NumberRange compares them
+    if field.data is not None and not field.data.is_finite():
+        raise StopValidation('Enter a number.')
+
+
+class RegistrationForm(FlaskForm):
+    username = StringField('Username', validators=[DataRequired()])
+    email = StringField('Email', validators=[DataRequired(), Email()])
+    password = PasswordField('Password', validators=[DataRequired()])
+    confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password')])
+    submit = SubmitField('Register')
+    
+    def validate_email(self, email):
+        user = User.query.filter_by(email=email.data).first()
+        if user:
+            raise ValidationError('Email already in use.')
+        
+class LoginForm(FlaskForm):
+    email = StringField('Email', validators=[DataRequired(), Email()])
+    password = PasswordField('Password', validators=[DataRequired()])
+    submit = SubmitField('Login')
+
+class UpdateProfileForm(FlaskForm):
+    username = StringField('Username', validators=[DataRequired()])
+    email = StringField('Email', validators=[DataRequired(), Email()])
+    submit = SubmitField('Update')
+
+class BookingForm(FlaskForm):
+    package = SelectField('Package', choices=[], coerce=int)
+    submit = SubmitField('Book')
+
+
+class ChangePasswordForm(FlaskForm):
+    current_password = PasswordField('Current Password', validators=[DataRequired()])
+    new_password = PasswordField('New Password', validators=[DataRequired()])
+    confirm_new_password = PasswordField('Confirm New Password', validators=[DataRequired(), EqualTo('new_password')])
+    submit = SubmitField('Change Password')
+
+
+class CategoryForm(FlaskForm):
+    name = StringField('Category Name', validators=[DataRequired(), Length(min=2, max=50)])
+    submit = SubmitField('Save')
+
+class PackageForm(FlaskForm):
+    name = StringField('Package Name', validators=[DataRequired(), Length(min=2, max=50)])
+    description = StringField('Description', validators=[Length(max=200)])
+    price = DecimalField('Price', validators=[InputRequired(), finite, NumberRange(min=0)])
+    category = SelectField('Category', coerce=int)
+    package_type = SelectField('Package Type', coerce=int)
+    submit = SubmitField('Save')
+
+class UpdateBookingForm(FlaskForm):
+    status = SelectField('Booking Status', choices=[('pending', 'Pending'), ('confirmed', 'Confirmed')], validators=[DataRequired()])
+    submit = SubmitField('Update')
+
+class ReportForm(FlaskForm):
+    start_date = StringField('Start Date', validators=[DataRequired()])
+    end_date = StringField('End Date', validators=[DataRequired()])
+    submit = SubmitField('Generate Report')
+
+class AdminProfileForm(FlaskForm):
+    username = StringField('Username', validators=[DataRequired(), Length(min=2, max=50)])
+    email = StringField('Email', validators=[DataRequired()])
+    submit = SubmitField('Update Profile')
+
+
+class ClassSlotForm(FlaskForm):
+    package = SelectField('Package', coerce=int)
+    starts_at = StringField('Starts At', validators=[DataRequired()])
+    duration_minutes = IntegerField('Duration (minutes)', default=60, validators=[DataRequired()])
+    # InputRequired: DataRequired would report 0 as missing rather than too small
+    capacity = IntegerField('Capacity', validators=[InputRequired(), NumberRange(min=1)])
+    submit = SubmitField('Add Slot')
+
+class PaymentForm(FlaskForm):
+    booking_id = IntegerField('Booking', validators=[DataRequired()])
+    amount = DecimalField('Amount', validators=[DataRequired(), finite, NumberRange(min=0.01)])
+    payment_type = StringField('Payment Type', validators=[DataRequired()])
+    # Issued with the form so a resubmitted or retried POST is recorded once
+    idempotency_key = HiddenField()
+    submit = SubmitField('Process Payment')
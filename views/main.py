@@ -1,66 +1,130 @@
-from flask import render_template, request, flash, redirect, url_for
-from app import app, db
-from models.model import Inquiry,RegistrationForm, LoginForm , User , UpdateProfileForm, BookingForm, Booking,Package,ChangePasswordForm, Category, PackageType,admin_required,CategoryForm, PackageForm, UpdateBookingForm, ReportForm, AdminProfileForm, Payment,PaymentForm
-from app import app, db, bcrypt
+from flask import Blueprint, current_app, render_template, request, flash, redirect, url_for, Response, stream_with_context, abort, jsonify, send_from_directory
+from extensions import db
+from models.model import ClassSlot, SlotReservation, Inquiry, User, Booking,Package, Category, PackageType, Payment
+from views.forms import ClassSlotForm, RegistrationForm, LoginForm, UpdateProfileForm, BookingForm, ChangePasswordForm, CategoryForm, PackageForm, UpdateBookingForm, ReportForm, AdminProfileForm, PaymentForm
+from views.decorators import admin_required
+from services.hashing import hasher, HashingBusy
+from services.ratelimit import limiter, rate_limit, form_value, RateLimited
+from services.httpcache import cached_page, cached_fragment
 from flask_login import login_user, logout_user, login_required, current_user
-from datetime import date  # Example import
-
-@app.route('/')
-def home():
+from datetime import date, datetime, timedelta  # Example import
+import hmac
+import uuid
+from sqlalchemy.orm import contains_eager, joinedload
+from models.queries import booking_history_page
+from models.listing import booking_listing, package_listing, category_listing
+from models.reports import REPORT_FORMATS, parse_report_date, report_aggregates, report_preview
+from models.counters import dashboard_totals
+from models.importer import save_upload
+from models.ledger import record_payment, search_bookings, PaymentError
+from models.slots import reserve_seat, cancel_reservation, waitlist_position, upcoming_slots, SlotError, RESERVED
+from models.reference import reference_cache, package_choices, category_choices, package_type_choices, invalidate_reference_data, PACKAGES, CATEGORIES, PACKAGE_TYPES
+from models.jobs import enqueue, queue_stats
+from models.memberships import renew_membership, MembershipError
+from models.search import SEARCHABLE, search
+from models.tasks import report_directory, report_filename
+from models.audit import audit_log, parse_timestamp
+from models.attendance import record_check_ins, occupancy, CheckInError
+from services.pool import pool_stats
+from services.replicas import read_replica, router as replica_router
+from services.profiling import perf_registry
+
+bp = Blueprint('main', __name__)
+
+@bp.app_errorhandler(HashingBusy)
+def hashing_busy(error):
+    # Every hashing worker is busy and the queue is full: shed load instead of queueing
+    return 'The server is busy, please try again in a few seconds.', 503, {'Retry-After': '5'}
+
+
+@bp.app_errorhandler(RateLimited)
+def rate_limited(error):
+    retry_after = max(1, int(error.retry_after + 0.999))
+    return 'Too many requests, please slow down.', 429, {'Retry-After': str(retry_after)}
+
+
+@bp.route('/')
+@cached_page(reference_cache, max_age=3600)
+def index():
     return render_template('home.html')
 
-@app.route('/trainers')
+@bp.route('/trainers')
+@cached_page(reference_cache, max_age=3600)
 def trainers():
     return render_template('trainers.html')
 
-@app.route('/equipment')
+@bp.route('/equipment')
+@cached_page(reference_cache, max_age=3600)
 def equipment():
     return render_template('equipment.html')
 
 
-@app.route('/contact', methods=['GET', 'POST'])
+@bp.route('/packages')
+@cached_page(reference_cache, (PACKAGES, CATEGORIES, PACKAGE_TYPES), max_age=300, stale_while_revalidate=600)
+def package_catalog():
+    def render():
+        packages = (Package.query.join(Package.category)
+                    .options(contains_eager(Package.category), joinedload(Package.package_type))
+                    .order_by(Category.name, Package.name).all())
+        return render_template('fragments/package_catalog.html', packages=packages)
+
+    # Also reused for signed-in members, whose pages are not cached whole
+    catalog = cached_fragment(reference_cache, PACKAGES, 'catalog', render,
+                              reference_cache.version(CATEGORIES), reference_cache.version(PACKAGE_TYPES))
+    return render_template('packages.html', catalog=catalog)
+
+
+@bp.route('/contact', methods=['GET', 'POST'])
+@rate_limit('contact-ip', '5/10 minutes')
+@rate_limit('contact-email', '3/hour', key=form_value('email'))
 def contact():
     if request.method == 'POST':
         name = request.form.get('name')
         email = request.form.get('email')
         message = request.form.get('message')
         
-        # Save inquiry to the database
-        inquiry = Inquiry(name=name, email=email, message=message)
-        db.session.add(inquiry)
+        # Saved and acknowledged by a worker; the request only queues it
+        enqueue('process_inquiry', {'name': name, 'email': email, 'message': message})
         db.session.commit()
         
         flash('Your inquiry has been sent!', 'success')
-        return redirect(url_for('contact'))
+        return redirect(url_for('main.contact'))
     
     return render_template('contact.html')
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
+@rate_limit('register-ip', '5/hour')
 def register():
     form = RegistrationForm()
     if form.validate_on_submit():
-        hashed_password = bcrypt.generate_password_hash(form.password.data).decode('utf-8')
+        hashed_password = hasher.hash(form.password.data)
         user = User(username=form.username.data, email=form.email.data, password_hash=hashed_password, role='registered')
         db.session.add(user)
         db.session.commit()
         flash('Your account has been created!', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('main.login'))
     return render_template('register.html', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('login-ip', '20/minute')
+@rate_limit('login-account', '5/minute', key=form_value('email'))
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(email=form.email.data).first()
-        if user and bcrypt.check_password_hash(user.password_hash, form.password.data):
+        if user and hasher.verify(user.password_hash, form.password.data):
+            # Upgrade hashes made with an older work factor while we have the plaintext
+            if hasher.needs_rehash(user.password_hash):
+                user.password_hash = hasher.hash(form.password.data)
+                db.session.commit()
             login_user(user)
             flash('Login successful!', 'success')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.admin_dashboard' if user.role == 'admin' else 'main.profile'))
         else:
             flash('Login unsuccessful. Check email and password.', 'danger')
     return render_template('login.html', form=form)
 
 
-@app.route('/profile', methods=['GET', 'POST'])
+@bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     form = UpdateProfileForm()
@@ -69,74 +133,132 @@ def profile():
         current_user.email = form.email.data
         db.session.commit()
         flash('Your profile has been updated!', 'success')
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
     elif request.method == 'GET':
         form.username.data = current_user.username
         form.email.data = current_user.email
     return render_template('profile.html', form=form)
 
 
-@app.route('/book', methods=['GET', 'POST'])
+@bp.route('/book', methods=['GET', 'POST'])
 @login_required
 def book():
     form = BookingForm()
-    form.package.choices = [(pkg.id, pkg.name) for pkg in Package.query.all()]
+    form.package.choices = package_choices()
     if form.validate_on_submit():
-        booking = Booking(user_id=current_user.id, package_id=form.package.data, status='confirmed')
+        package = db.session.get(Package, form.package.data)
+        booking = Booking(user_id=current_user.id, package_id=package.id, status='confirmed',
+                          total_amount=package.price)
         db.session.add(booking)
+        db.session.flush()
+        # Queued in the same transaction, so there is never a confirmation without a booking
+        enqueue('send_booking_confirmation', {'booking_id': booking.id})
         db.session.commit()
         flash('Your package has been booked!', 'success')
-        return redirect(url_for('booking_history'))
+        return redirect(url_for('main.booking_history'))
     return render_template('book.html', form=form)
 
 
 
 
-@app.route('/booking-history')
+@bp.route('/slots')
+@login_required
+def slots():
+    upcoming = upcoming_slots(package_id=request.args.get('package_id', type=int))
+    reservations = {reservation.slot_id: reservation for reservation in SlotReservation.query.filter(
+        SlotReservation.user_id == current_user.id,
+        SlotReservation.slot_id.in_([slot.id for slot in upcoming]))}
+    return render_template('slots.html', slots=upcoming, reservations=reservations)
+
+
+@bp.route('/slots/<int:slot_id>/reserve', methods=['POST'])
+@login_required
+def reserve_slot(slot_id):
+    try:
+        reservation = reserve_seat(slot_id, current_user.id)
+    except SlotError as error:
+        flash(str(error), 'danger')
+    else:
+        if reservation.status == RESERVED:
+            flash('Your seat is reserved!', 'success')
+        else:
+            flash(f'The class is full; you are number {waitlist_position(reservation)} on the waitlist.', 'info')
+    return redirect(url_for('main.slots'))
+
+
+@bp.route('/slots/<int:slot_id>/cancel', methods=['POST'])
 @login_required
+def cancel_slot(slot_id):
+    try:
+        cancel_reservation(slot_id, current_user.id)
+        flash('Your reservation has been cancelled.', 'success')
+    except SlotError as error:
+        flash(str(error), 'danger')
+    return redirect(url_for('main.slots'))
+
+
+@bp.route('/booking-history')
+@login_required
+@read_replica
 def booking_history():
-    bookings = Booking.query.filter_by(user_id=current_user.id).all()
-    return render_template('booking_history.html', bookings=bookings)
+    bookings, next_cursor = booking_history_page(current_user.id, after=request.args.get('after'))
+    return render_template('booking_history.html', bookings=bookings, next_cursor=next_cursor)
+
+
+@bp.route('/bookings/<int:booking_id>/renew', methods=['POST'])
+@login_required
+def renew_booking(booking_id):
+    booking = db.session.get(Booking, booking_id)
+    if booking is None or booking.user_id != current_user.id:
+        abort(404)
+    try:
+        renewal = renew_membership(booking)
+    except MembershipError as error:
+        flash(str(error), 'danger')
+        return redirect(url_for('main.booking_history'))
+    db.session.flush()
+    enqueue('send_booking_confirmation', {'booking_id': renewal.id})
+    db.session.commit()
+    flash(f'Your membership has been renewed until {renewal.expires_at:%Y-%m-%d}.', 'success')
+    return redirect(url_for('main.booking_history'))
 
 
-@app.route('/change-password', methods=['GET', 'POST'])
+@bp.route('/change-password', methods=['GET', 'POST'])
 @login_required
 def change_password():
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        if bcrypt.check_password_hash(current_user.password_hash, form.current_password.data):
-            hashed_password = bcrypt.generate_password_hash(form.new_password.data).decode('utf-8')
-            current_user.password_hash = hashed_password
+        if hasher.verify(current_user.password_hash, form.current_password.data):
+            current_user.password_hash = hasher.hash(form.new_password.data)
             db.session.commit()
             flash('Your password has been updated!', 'success')
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         else:
             flash('Current password is incorrect.', 'danger')
     return render_template('change_password.html', form=form)
 
 
-@app.route('/admin/dashboard')
+@bp.route('/admin/dashboard')
 @login_required
 @admin_required
 def admin_dashboard():
-    total_bookings = Booking.query.count()
-    active_packages = Package.query.filter_by(is_active=True).count()
-    total_categories = Category.query.count()
-    total_package_types = PackageType.query.count()
-    return render_template('admin/dashboard.html', total_bookings=total_bookings,
-                           active_packages=active_packages,
-                           total_categories=total_categories,
-                           total_package_types=total_package_types)
+    # One read of the precomputed counters instead of a COUNT(*) per table
+    totals = dashboard_totals()
+    return render_template('admin/dashboard.html', total_bookings=totals['bookings'],
+                           active_packages=totals['packages'],
+                           total_categories=totals['categories'],
+                           total_package_types=totals['package_types'],
+                           totals=totals)
 
 
-@app.route('/admin/categories')
+@bp.route('/admin/categories')
 @login_required
 @admin_required
 def manage_categories():
-    categories = Category.query.all()
-    return render_template('admin/categories.html', categories=categories)
+    page = category_listing.page(request.args)
+    return render_template('admin/categories.html', categories=page.items, page=page)
 
-@app.route('/admin/categories/add', methods=['GET', 'POST'])
+@bp.route('/admin/categories/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def add_category():
@@ -145,61 +267,232 @@ def add_category():
         new_category = Category(name=form.name.data)
         db.session.add(new_category)
         db.session.commit()
+        invalidate_reference_data(CATEGORIES)
         flash('Category added successfully!')
-        return redirect(url_for('manage_categories'))
+        return redirect(url_for('main.manage_categories'))
     return render_template('admin/add_category.html', form=form)
 
-@app.route('/admin/categories/delete/<int:id>', methods=['POST'])
+@bp.route('/admin/categories/delete/<int:id>', methods=['POST'])
 @login_required
 @admin_required
 def delete_category(id):
     category = Category.query.get_or_404(id)
     db.session.delete(category)
     db.session.commit()
+    invalidate_reference_data(CATEGORIES)
     flash('Category deleted successfully!')
-    return redirect(url_for('manage_categories'))
+    return redirect(url_for('main.manage_categories'))
 
 
-@app.route('/admin/packages')
+@bp.route('/admin/packages')
 @login_required
 @admin_required
 def manage_packages():
-    packages = Package.query.all()
-    return render_template('admin/packages.html', packages=packages)
+    page = package_listing.page(request.args)
+    return render_template('admin/packages.html', packages=page.items, page=page)
 
-@app.route('/admin/packages/add', methods=['GET', 'POST'])
+@bp.route('/admin/packages/add', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def add_package():
     form = PackageForm()
+    form.category.choices = category_choices()
+    form.package_type.choices = package_type_choices()
     if form.validate_on_submit():
-        new_package = Package(name=form.name.data, description=form.description.data,
-                              price=form.price.data, package_type_id=form.package_type.data)
+        new_package = Package(name=form.name.data, description=form.description.data or None,
+                              price=float(form.price.data), category_id=form.category.data,
+                              package_type_id=form.package_type.data)
         db.session.add(new_package)
         db.session.commit()
+        invalidate_reference_data(PACKAGES)
         flash('Package added successfully!')
-        return redirect(url_for('manage_packages'))
+        return redirect(url_for('main.manage_packages'))
     return render_template('admin/add_package.html', form=form)
 
-@app.route('/admin/packages/delete/<int:id>', methods=['POST'])
+@bp.route('/admin/packages/delete/<int:id>', methods=['POST'])
 @login_required
 @admin_required
 def delete_package(id):
     package = Package.query.get_or_404(id)
     db.session.delete(package)
     db.session.commit()
+    invalidate_reference_data(PACKAGES)
     flash('Package deleted successfully!')
-    return redirect(url_for('manage_packages'))
+    return redirect(url_for('main.manage_packages'))
 
 
-@app.route('/admin/bookings')
+@bp.route('/admin/import', methods=['GET', 'POST'])
 @login_required
 @admin_required
+def bulk_import():
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        upload = request.files.get('file')
+        if kind not in ('users', 'bookings') or not upload:
+            flash('Choose what to import and a CSV or NDJSON file.', 'danger')
+            return redirect(url_for('main.bulk_import'))
+        # Thousands of bcrypt hashes: imported by a worker, not on this request
+        path, fmt = save_upload(upload)
+        queued = enqueue('import_upload', {'kind': kind, 'path': path, 'fmt': fmt, 'notify': current_user.email})
+        db.session.commit()
+        flash(f'Import #{queued.id} is queued; you will get an email when it has finished.', 'info')
+        return render_template('admin/import.html', result=None), 202
+    return render_template('admin/import.html', result=None)
+
+
+@bp.route('/admin/cache-stats')
+@login_required
+@admin_required
+def cache_stats():
+    return jsonify(reference_cache.stats())
+
+
+@bp.route('/admin/analytics/revenue')
+@login_required
+@admin_required
+def revenue_analytics():
+    # Imported here so NumPy only loads once someone asks for analytics
+    from models.analytics import GRANULARITIES, revenue_rollup, parse_period, schedule_refresh
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in GRANULARITIES:
+        abort(400)
+    start, end = parse_period(request.args.get('start')), parse_period(request.args.get('end'))
+    # Served from the saved cube; newer payments are folded in by a worker
+    refreshing = schedule_refresh()
+    return jsonify(granularity=granularity, rows=revenue_rollup(granularity, start, end), refreshing=refreshing)
+
+
+@bp.route('/admin/analytics/retention')
+@login_required
+@admin_required
+def retention_analytics():
+    from models.analytics import cohort_retention, schedule_refresh
+    refreshing = schedule_refresh()
+    return jsonify(cohorts=cohort_retention(), refreshing=refreshing)
+
+
+@bp.route('/admin/rate-limits')
+@login_required
+@admin_required
+def rate_limit_stats():
+    return jsonify(limiter.stats())
+
+
+@bp.route('/admin/jobs')
+@login_required
+@admin_required
+def job_stats():
+    return jsonify(queue_stats())
+
+
+@bp.route('/admin/pool-stats')
+@login_required
+@admin_required
+def connection_pool_stats():
+    return jsonify(pool_stats(db.engine))
+
+
+def _checkin_device():
+    # Bearer token -> device name, compared in constant time
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return None
+    for known, device in current_app.config.get('CHECKIN_DEVICE_TOKENS', {}).items():
+        if hmac.compare_digest(known.encode(), token.encode()):
+            return device
+    return None
+
+
+@bp.route('/api/check-ins', methods=['POST'])
+def ingest_check_ins():
+    # {"events": [{"event_id": "...", "user_id": 7, "occurred_at": "2026-10-18T07:02:11Z", "direction": "in"}]}
+    device = _checkin_device()
+    if device is None:
+        return jsonify(error='Unknown device token.'), 401
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify(error='Expected a JSON object with an "events" list.'), 400
+    try:
+        result = record_check_ins(device, body.get('events'))
+    except CheckInError as error:
+        return jsonify(error=str(error)), 400
+    return jsonify(result)
+
+
+@bp.route('/admin/occupancy')
+@login_required
+@admin_required
+def occupancy_stats():
+    day = parse_report_date(request.args.get('date') or datetime.utcnow().date())
+    if day is None:
+        abort(400)
+    return jsonify(date=day.isoformat(), hours=occupancy(day))
+
+
+@bp.route('/admin/audit')
+@login_required
+@admin_required
+def audit_trail():
+    # /admin/audit?since=2026-10-01&until=2026-10-02&entity=packages&entity_id=3&actor=1
+    end = parse_timestamp(request.args.get('until'), datetime.utcnow())
+    start = parse_timestamp(request.args.get('since'), end - timedelta(days=1) if end else None)
+    if start is None or end is None:
+        abort(400)
+    limit = max(1, min(request.args.get('limit', 200, type=int), 1000))
+    events = audit_log.query(start, end, request.args.get('entity'), request.args.get('entity_id', type=int),
+                             request.args.get('actor', type=int), limit)
+    return jsonify(events=events, stats=audit_log.stats())
+
+
+@bp.route('/admin/replicas')
+@login_required
+@admin_required
+def replica_stats():
+    stats = replica_router.stats()
+    for replica, snapshot in zip(replica_router.replicas, stats['replicas']):
+        snapshot['pool'] = pool_stats(replica.engine)
+    return jsonify(stats)
+
+
+@bp.route('/admin/perf', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def perf_stats():
+    if request.method == 'POST':
+        perf_registry.reset()
+    return jsonify(perf_registry.snapshot())
+
+
+@bp.route('/admin/slots/add', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def add_slot():
+    form = ClassSlotForm()
+    form.package.choices = package_choices()
+    if form.validate_on_submit():
+        try:
+            starts_at = datetime.fromisoformat(form.starts_at.data)
+        except ValueError:
+            flash('Start time must look like 2024-09-01 06:00.', 'danger')
+        else:
+            db.session.add(ClassSlot(package_id=form.package.data, starts_at=starts_at,
+                                     duration_minutes=form.duration_minutes.data,
+                                     capacity=form.capacity.data))
+            db.session.commit()
+            flash('Class slot added successfully!')
+            return redirect(url_for('main.slots'))
+    return render_template('admin/add_slot.html', form=form)
+
+
+@bp.route('/admin/bookings')
+@login_required
+@admin_required
+@read_replica
 def manage_bookings():
-    bookings = Booking.query.all()
-    return render_template('admin/bookings.html', bookings=bookings)
+    page = booking_listing.page(request.args)
+    return render_template('admin/bookings.html', bookings=page.items, page=page)
 
-@app.route('/admin/bookings/update/<int:id>', methods=['GET', 'POST'])
+@bp.route('/admin/bookings/update/<int:id>', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def update_booking(id):
@@ -210,25 +503,61 @@ def update_booking(id):
         booking.payment_status = form.payment_status.data
         db.session.commit()
         flash('Booking updated successfully!')
-        return redirect(url_for('manage_bookings'))
+        return redirect(url_for('main.manage_bookings'))
     return render_template('admin/update_booking.html', form=form, booking=booking)
 
 
-@app.route('/admin/reports', methods=['GET', 'POST'])
+@bp.route('/admin/reports', methods=['GET', 'POST'])
 @login_required
 @admin_required
+@read_replica
 def generate_reports():
+    # Exports are plain GET links (?start_date=&end_date=&format=csv) streamed row by row
+    export_format = request.args.get('format')
+    if export_format:
+        if export_format not in REPORT_FORMATS:
+            abort(400)
+        start_date = parse_report_date(request.args.get('start_date'))
+        end_date = parse_report_date(request.args.get('end_date'))
+        if not start_date or not end_date:
+            abort(400)
+        mimetype, chunks = REPORT_FORMATS[export_format]
+        filename = f'bookings_{start_date}_{end_date}.{export_format}'
+        return Response(stream_with_context(chunks(start_date, end_date)), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+
     form = ReportForm()
     bookings = []
+    aggregates = None
     if form.validate_on_submit():
-        start_date = form.start_date.data
-        end_date = form.end_date.data
-        bookings = Booking.query.filter(Booking.date.between(start_date, end_date)).all()
-    return render_template('admin/reports.html', form=form, bookings=bookings)
+        start_date = parse_report_date(form.start_date.data)
+        end_date = parse_report_date(form.end_date.data)
+        build_format = request.form.get('build')
+        if start_date and end_date and build_format in REPORT_FORMATS:
+            # Large ranges are built to a file by a worker and downloaded later
+            enqueue('build_report', {'start_date': start_date.isoformat(), 'end_date': end_date.isoformat(),
+                                     'export_format': build_format, 'notify': current_user.email})
+            db.session.commit()
+            flash(f'{report_filename(start_date, end_date, build_format)} is being built; '
+                  'you will get an email when it is ready.', 'info')
+            return redirect(url_for('main.generate_reports'))
+        if start_date and end_date:
+            bookings = report_preview(start_date, end_date)
+            aggregates = report_aggregates(start_date, end_date)
+        else:
+            flash('Dates must be in YYYY-MM-DD format.', 'danger')
+    return render_template('admin/reports.html', form=form, bookings=bookings, aggregates=aggregates)
+
+
+@bp.route('/admin/reports/files/<path:filename>')
+@login_required
+@admin_required
+def download_report(filename):
+    return send_from_directory(report_directory(), filename, as_attachment=True)
 
 
 
-@app.route('/admin/profile', methods=['GET', 'POST'])
+@bp.route('/admin/profile', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def admin_profile():
@@ -238,54 +567,88 @@ def admin_profile():
         current_user.email = form.email.data
         db.session.commit()
         flash('Profile updated successfully!')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     return render_template('admin/profile.html', form=form)
 
-@app.route('/admin/change-password', methods=['GET', 'POST'])
+@bp.route('/admin/change-password', methods=['GET', 'POST'])
 @login_required
 @admin_required
-def change_password():
+def admin_change_password():
     form = ChangePasswordForm()
     if form.validate_on_submit():
-        current_user.set_password(form.new_password.data)
+        current_user.password_hash = hasher.hash(form.new_password.data)
         db.session.commit()
         flash('Password changed successfully!')
-        return redirect(url_for('admin_dashboard'))
+        return redirect(url_for('main.admin_dashboard'))
     return render_template('admin/change_password.html', form=form)
 
 
-@app.route('/admin/process_payment', methods=['GET', 'POST'])
+@bp.route('/admin/process_payment', methods=['GET', 'POST'])
+@login_required
 @admin_required
 def process_payment():
     form = PaymentForm()
-    form.booking_id.choices = [(booking.id, f'Booking #{booking.id} - {booking.user.username}') for booking in Booking.query.all()]
-    
+    if request.method == 'GET':
+        form.booking_id.data = request.args.get('booking_id', type=int)
+        form.idempotency_key.data = uuid.uuid4().hex
+
     if form.validate_on_submit():
-        payment = Payment(
-            booking_id=form.booking_id.data,
-            payment_date=date.today(),
-            amount=form.amount.data,
-            payment_type=form.payment_type.data
-        )
-        db.session.add(payment)
-        
-        # Update the booking amount paid
-        booking = Booking.query.get(form.booking_id.data)
-        booking.amount_paid += form.amount.data
-        
-        # Update booking status if fully paid
-        if booking.amount_paid >= booking.total_amount:
-            booking.status = 'Paid'
-        
-        db.session.commit()
-        flash('Payment processed successfully', 'success')
-        return redirect(url_for('admin_dashboard'))
-    
-    return render_template('admin/process_payment.html', form=form)
+        try:
+            payment, created = record_payment(form.booking_id.data, form.amount.data,
+                                              form.payment_type.data, form.idempotency_key.data)
+        except PaymentError as error:
+            flash(str(error), 'danger')
+        else:
+            if created:
+                flash('Payment processed successfully', 'success')
+            else:
+                flash(f'This payment was already recorded as #{payment.id}; nothing was charged.', 'info')
+            return redirect(url_for('main.admin_dashboard'))
+
+    # Look bookings up by id or member instead of listing every booking ever made
+    matches = search_bookings(request.args.get('q'))
+    return render_template('admin/process_payment.html', form=form, matches=matches)
 
 
-@app.route('/user/booking_history')
+@bp.route('/admin/search')
 @login_required
-def booking_history():
-    bookings = Booking.query.filter_by(user_id=current_user.id).all()
-    return render_template('user/booking_history.html', bookings=bookings)
+@admin_required
+@read_replica
+def admin_search():
+    # Typeahead: /admin/search?kind=members&q=ali
+    kind = request.args.get('kind', 'members')
+    if kind not in SEARCHABLE:
+        abort(400)
+    limit = min(request.args.get('limit', 10, type=int), 50)
+    results = search(kind, request.args.get('q'), limit)
+    if kind == 'members':
+        rows = [{'id': user.id, 'label': f'{user.username} <{user.email}>'} for user in results]
+    elif kind == 'packages':
+        rows = [{'id': package.id, 'label': package.name, 'description': package.description} for package in results]
+    else:
+        rows = [{'id': inquiry.id, 'label': f'{inquiry.name} <{inquiry.email}>', 'message': inquiry.message,
+                 'created_at': inquiry.created_at.isoformat() if inquiry.created_at else None}
+                for inquiry in results]
+    return jsonify(rows)
+
+
+@bp.route('/admin/bookings/search')
+@login_required
+@admin_required
+@read_replica
+def search_bookings_json():
+    return jsonify([{'id': booking.id,
+                     'label': f'Booking #{booking.id} - {booking.user.username}',
+                     'package': booking.package.name,
+                     'total_amount': booking.total_amount,
+                     'amount_paid': booking.amount_paid,
+                     'status': booking.status}
+                    for booking in search_bookings(request.args.get('q'))])
+
+
+@bp.route('/user/booking_history')
+@login_required
+@read_replica
+def user_booking_history():
+    bookings, next_cursor = booking_history_page(current_user.id, after=request.args.get('after'))
+    return render_template('user/booking_history.html', bookings=bookings, next_cursor=next_cursor)